@@ -0,0 +1,210 @@
+import multiprocessing
+import os
+import sys
+import time
+
+from multiprocessing.connection import wait
+from pathlib import Path as P
+from typing import Any, Dict, Iterable, List, Optional
+
+import click
+
+from .cluster import Cluster, load_clusters_from_api
+from .compile import compile as compile_cluster
+from .config import Config, usable_cpu_count
+from .lieutenant import ApiError
+
+LOG_FILE = "commodore.log"
+
+
+class ClusterResult:
+    def __init__(self, cluster_id: str, work_dir: P, cluster: Optional[Cluster] = None):
+        self.cluster_id = cluster_id
+        self.work_dir = work_dir
+        self.cluster = cluster
+        self.exitcode: Optional[int] = None
+        self.started = 0.0
+        self.finished = 0.0
+
+    @property
+    def log_file(self) -> P:
+        return self.work_dir / LOG_FILE
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exitcode == 0
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+
+def clusters_from_api(
+    config: Config, tenant: Optional[str] = None
+) -> Dict[str, Cluster]:
+    """
+    Load the specifications of all clusters known to Lieutenant, optionally
+    only of the clusters of tenant `tenant`. The result can be passed to
+    `compile_many()`, so that the clusters aren't listed a second time.
+    """
+    try:
+        return load_clusters_from_api(config, tenant=tenant)
+    except ApiError as e:
+        raise click.ClickException(f"While listing clusters: {e}") from e
+
+
+def _prefetch_clusters(config: Config, cluster_ids: List[str]) -> Dict[str, Cluster]:
+    """
+    Load the specifications of all clusters in `cluster_ids` in bulk, so that
+    the workers don't each have to query the cluster and its tenant.
+    Clusters which are missing from the result are loaded by their worker.
+    """
+    try:
+        return load_clusters_from_api(config, cluster_ids)
+    except ApiError as e:
+        raise click.ClickException(f"While fetching cluster specifications: {e}") from e
+
+
+def _compile_worker(
+    config: Config, cluster_id: str, work_dir: P, cluster: Optional[Cluster]
+):
+    """
+    Compile a single cluster in a forked child process. All output of the
+    compilation, including output of subprocesses, is written to the
+    cluster's log file.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    with open(work_dir / LOG_FILE, "w") as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+    # sys.stdout and sys.stderr may have been replaced, e.g. by a test
+    # harness, make sure they write to the log file as well. The streams stay
+    # open until the worker exits.
+    # pylint: disable=consider-using-with
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    os.chdir(work_dir)
+    config.work_dir = work_dir
+    # Only the parent process evicts mirrors from the shared cache, after all
+    # clusters have been compiled.
+    config.cache_max_size = None
+    config.reset_lieutenant()
+    try:
+        compile_cluster(config, cluster_id, cluster)
+    except click.ClickException as e:
+        e.show()
+        raise SystemExit(1) from e
+
+
+def _start(
+    config: Config, result: ClusterResult
+) -> multiprocessing.process.BaseProcess:
+    # Fork the workers, so that they don't have to import Kapitan again. The
+    # worker processes can't be daemonic, as Kapitan uses a multiprocessing
+    # pool to compile the targets of each cluster.
+    proc = multiprocessing.get_context("fork").Process(
+        target=_compile_worker,
+        args=(config, result.cluster_id, result.work_dir, result.cluster),
+        name=f"commodore-{result.cluster_id}",
+    )
+    result.started = time.monotonic()
+    proc.start()
+    return proc
+
+
+def _run(config: Config, results: List[ClusterResult], cluster_jobs: int):
+    pending = list(results)
+    running: Dict[Any, ClusterResult] = {}
+    procs: Dict[Any, multiprocessing.process.BaseProcess] = {}
+    done = 0
+    while pending or running:
+        while pending and len(running) < cluster_jobs:
+            result = pending.pop(0)
+            proc = _start(config, result)
+            running[proc.sentinel] = result
+            procs[proc.sentinel] = proc
+            if config.debug:
+                click.echo(f" > Started compilation of {result.cluster_id}")
+
+        for sentinel in wait(list(running.keys())):
+            proc = procs.pop(sentinel)
+            result = running.pop(sentinel)
+            proc.join()
+            result.exitcode = proc.exitcode
+            result.finished = time.monotonic()
+            done += 1
+            status = "compiled" if result.succeeded else "failed"
+            click.secho(
+                f" > [{done}/{len(results)}] {result.cluster_id}: {status} "
+                + f"in {result.duration:.1f}s",
+                fg=None if result.succeeded else "red",
+            )
+
+
+def _print_summary(results: Iterable[ClusterResult]):
+    results = list(results)
+    failed = [r for r in results if not r.succeeded]
+    click.secho("Summary:", bold=True)
+    for r in results:
+        if r.succeeded:
+            click.echo(f" > {r.cluster_id}: compiled ({r.duration:.1f}s)")
+        else:
+            click.secho(
+                f" > {r.cluster_id}: failed ({r.duration:.1f}s), see {r.log_file}",
+                fg="red",
+            )
+    click.echo(f"Compiled {len(results) - len(failed)} of {len(results)} cluster(s)")
+    if failed:
+        raise click.ClickException(
+            f"Compilation failed for {len(failed)} of {len(results)} cluster(s)"
+        )
+
+
+def compile_many(
+    config: Config,
+    cluster_ids: Iterable[str],
+    cluster_jobs: int,
+    clusters: Optional[Dict[str, Cluster]] = None,
+):
+    """
+    Compile the catalogs of all clusters in `cluster_ids`.
+
+    Each cluster is compiled in its own working directory
+    `<working dir>/<cluster id>` by a forked child process, at most
+    `cluster_jobs` clusters are compiled concurrently. Unless `config.jobs` is
+    set explicitly, each compilation uses an equal share of the usable CPUs
+    for its compile and postprocessing processes. All clusters share the
+    repository cache, which defaults to `<working dir>/.cache`, and each
+    repository is fetched at most once per batch. The cluster and tenant
+    specifications are fetched from Lieutenant in bulk before the
+    compilations start, unless they're given in `clusters`.
+    """
+    cluster_ids = list(dict.fromkeys(cluster_ids))
+    if len(cluster_ids) == 0:
+        raise click.ClickException("No clusters to compile")
+
+    if config.cache_dir is None:
+        config.cache_dir = config.work_dir / ".cache"
+    config.cache_fresh_since = time.time()
+    # Share the usable CPUs among the concurrent compilations, unless the
+    # number of compile processes per cluster is given explicitly.
+    config.default_jobs = max(
+        1, usable_cpu_count() // min(cluster_jobs, len(cluster_ids))
+    )
+
+    if clusters is None:
+        clusters = _prefetch_clusters(config, cluster_ids)
+    results = [
+        ClusterResult(cid, config.work_dir / cid, clusters.get(cid))
+        for cid in cluster_ids
+    ]
+    click.secho(
+        f"Compiling {len(results)} cluster(s), {cluster_jobs} at a time...",
+        bold=True,
+    )
+    _run(config, results, cluster_jobs)
+    if config.repo_cache:
+        # The mirrors are used by the worker processes, which mark each mirror
+        # they use. Keep all mirrors used by this batch.
+        config.repo_cache.evict(used_since=config.cache_fresh_since)
+    _print_summary(results)
@@ -0,0 +1,86 @@
+import os
+import shutil
+
+from pathlib import Path as P
+
+import click
+
+from .config import Config
+from .treesync import sync_trees
+
+BUILD_MARKER = ".commodore-build-in-progress"
+
+
+class AtomicBuild:
+    """
+    Keep the compiled output of the last successful compilation until a new
+    compilation succeeds.
+
+    `begin()` moves the previous output in `compiled/` to `compiled.old/` and
+    starts a fresh `compiled/` directory, which is marked as in progress. With
+    `reuse=True`, the fresh directory starts out with hardlinks to the
+    previous output, so that incremental compilation can reuse the output of
+    unchanged targets. `finish()` marks the new output as complete, and
+    `abort()` discards it and restores the previous output. The output of the
+    previous successful compilation is kept in `compiled.old/` for rollback.
+
+    Only the compiled output is protected. The inventory, libraries and
+    dependencies in the working directory are cleaned and recreated by each
+    compilation regardless.
+    """
+
+    def __init__(self, config: Config):
+        self._output_dir = config.inventory.output_dir
+        self._previous_dir = self._output_dir.with_name(f"{self._output_dir.name}.old")
+        self._debug = config.debug
+
+    @property
+    def output_dir(self) -> P:
+        return self._output_dir
+
+    @property
+    def previous_dir(self) -> P:
+        return self._previous_dir
+
+    @property
+    def _marker(self) -> P:
+        return self._output_dir / BUILD_MARKER
+
+    def in_progress(self) -> bool:
+        return self._marker.is_file()
+
+    def _restore_previous(self):
+        shutil.rmtree(self._output_dir, ignore_errors=True)
+        if self._previous_dir.is_dir():
+            os.rename(self._previous_dir, self._output_dir)
+
+    def begin(self, reuse: bool = False):
+        if self.in_progress():
+            # A previous compilation was interrupted before it could finish or
+            # abort, its output is incomplete.
+            click.echo(" > Discarding output of interrupted compilation")
+            self._restore_previous()
+
+        if self._output_dir.is_dir():
+            shutil.rmtree(self._previous_dir, ignore_errors=True)
+            os.rename(self._output_dir, self._previous_dir)
+            if reuse:
+                # Kapitan and Commodore replace compiled files instead of
+                # modifying them in place, except for postprocessing filters,
+                # which only run on freshly compiled targets. Hardlinks to the
+                # previous output are therefore safe.
+                sync_trees([self._previous_dir], self._output_dir, mode="hardlink")
+
+        os.makedirs(self._output_dir, exist_ok=True)
+        self._marker.touch()
+        if self._debug:
+            click.echo(f" > Compiling into fresh output directory {self._output_dir}")
+
+    def finish(self):
+        self._marker.unlink()
+        if self._debug:
+            click.echo(f" > Previous output kept in {self._previous_dir}")
+
+    def abort(self):
+        click.echo(" > Compilation failed, restoring previous output")
+        self._restore_previous()
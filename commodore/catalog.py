@@ -4,8 +4,9 @@ from typing import Iterable
 import click
 
 from . import git
-from .helpers import rm_tree_contents, lieutenant_query
-from .cluster import Cluster
+from .helpers import rm_tree_contents
+from .treesync import sync_trees
+from .cluster import Cluster, load_clusters_from_api
 from .config import Config
 
 
@@ -59,33 +60,78 @@ Compilation timestamp: {now}
 
 
 def clean_catalog(repo):
+    """
+    Convert old-style catalogs, which have the manifests at the top level of
+    the repository. The contents of `manifests` are synchronized with the
+    compiled output by `update_catalog()`, which removes stale manifests.
+    """
     catalogdir = P(repo.working_tree_dir, "manifests")
     click.secho("Cleaning catalog repository...", bold=True)
-    # delete everything in catalog
-    if catalogdir.is_dir():
-        rm_tree_contents(catalogdir)
-    else:
+    if not catalogdir.is_dir():
         click.echo(" > Converting old-style catalog")
         rm_tree_contents(repo.working_tree_dir)
 
 
+def _print_changes(cfg: Config, repo, diff):
+    # pylint: disable=import-outside-toplevel
+    import textwrap
+
+    diff_mode = cfg.diff_mode
+    if cfg.interactive and cfg.push:
+        # Always show the full diff when asking whether to push the changes
+        diff_mode = "full"
+
+    if diff_mode == "none":
+        click.echo(f" > Changes: {len(diff)} file(s) changed")
+        return
+
+    click.echo(" > Changes:")
+    if diff_mode == "stat":
+        difftexts = git.render_diff_stat(repo)
+    else:
+        # Print the diff file by file, instead of rendering the complete diff
+        # of large catalogs in memory first.
+        difftexts = git.render_diff(repo, diff)
+    for difftext in difftexts:
+        click.echo(textwrap.indent(difftext, "     "))
+
+
 def update_catalog(cfg: Config, targets: Iterable[str], repo):
     click.secho("Updating catalog repository...", bold=True)
     # pylint: disable=import-outside-toplevel
-    from distutils import dir_util
     import textwrap
 
     catalogdir = P(repo.working_tree_dir, "manifests")
-    for target_name in targets:
-        dir_util.copy_tree(str(cfg.inventory.output_dir / target_name), str(catalogdir))
-
-    difftext, changed = git.stage_all(repo)
+    # Only write manifests which changed, so that Git doesn't have to hash
+    # unchanged manifests again. Compiled files are clones of the compiled
+    # output where the file system supports it.
+    synced = sync_trees(
+        [cfg.inventory.output_dir / target_name for target_name in targets],
+        catalogdir,
+        mode="reflink",
+    )
+    if cfg.debug:
+        click.echo(f" > Manifests: {synced}")
+
+    # Stage the changed manifests without scanning the complete catalog.
+    # Changes outside of the manifests, e.g. to secret refs, are staged by
+    # Git, which only hashes files whose metadata changed. In local mode, the
+    # working tree may contain unstaged changes of previous compilations, so
+    # we let Git stage the complete catalog.
+    pathspecs = [".", ":(exclude)manifests"]
+    if cfg.local:
+        pathspecs = ["."]
+    diff = git.stage_paths(
+        repo,
+        [f"manifests/{p}" for p in synced.added + synced.modified],
+        [f"manifests/{p}" for p in synced.deleted],
+        pathspecs=pathspecs,
+    )
+    changed = bool(diff)
     if changed:
-        indented = textwrap.indent(difftext, "     ")
-        message = f" > Changes:\n{indented}"
+        _print_changes(cfg, repo, diff)
     else:
-        message = " > No changes."
-    click.echo(message)
+        click.echo(" > No changes.")
 
     commit_message = _render_catalog_commit_msg(cfg)
     if cfg.debug:
@@ -115,12 +161,13 @@ def update_catalog(cfg: Config, targets: Iterable[str], repo):
 
 
 def catalog_list(cfg):
-    clusters = lieutenant_query(cfg.api_url, cfg.api_token, "clusters", "")
-    for cluster in clusters:
-        display_name = cluster["displayName"]
-        catalog_id = cluster["id"]
-        if cfg.verbose:
-            click.secho(catalog_id, nl=False, bold=True)
-            click.echo(f" - {display_name}")
-        else:
-            click.echo(catalog_id)
+    if not cfg.verbose:
+        for cluster in cfg.lieutenant.clusters():
+            click.echo(cluster["id"])
+        return
+
+    # Verbose output includes the tenant of each cluster, load clusters and
+    # tenants in bulk instead of querying each cluster's tenant.
+    for cluster in load_clusters_from_api(cfg).values():
+        click.secho(cluster.id, nl=False, bold=True)
+        click.echo(f" - {cluster.display_name} ({cluster.tenant_display_name})")
@@ -5,8 +5,11 @@ import click
 from dotenv import load_dotenv
 from importlib_metadata import version
 from commodore import __git_version__
+from .batch import clusters_from_api, compile_many
 from .catalog import catalog_list
 from .config import Config
+from .git import CloneOptions
+from .lieutenant import DEFAULT_CACHE_TTL, DEFAULT_RETRIES, DEFAULT_TIMEOUT
 from .helpers import clean_working_tree
 from .compile import compile as _compile
 from .component.template import ComponentTemplater
@@ -22,6 +25,159 @@ verbosity = click.option(
 )
 
 
+def compile_options(f):
+    """
+    Options which control how catalogs are compiled, shared by `catalog
+    compile` and `catalog compile-many`.
+    """
+    options = [
+        click.option(
+            "--api-timeout",
+            envvar="COMMODORE_API_TIMEOUT",
+            type=click.FloatRange(min=1),
+            default=DEFAULT_TIMEOUT,
+            show_default=True,
+            metavar="SECONDS",
+            help="Timeout for requests to the Lieutenant API.",
+        ),
+        click.option(
+            "--api-retries",
+            envvar="COMMODORE_API_RETRIES",
+            type=click.IntRange(min=0),
+            default=DEFAULT_RETRIES,
+            show_default=True,
+            metavar="N",
+            help="Number of retries of failed requests to the Lieutenant API.",
+        ),
+        click.option(
+            "--api-cache-ttl",
+            envvar="COMMODORE_API_CACHE_TTL",
+            type=click.IntRange(min=0),
+            default=DEFAULT_CACHE_TTL,
+            show_default=True,
+            metavar="SECONDS",
+            help="How long tenant objects are cached in the cache directory.",
+        ),
+        click.option(
+            "--cache-dir",
+            envvar="COMMODORE_CACHE_DIR",
+            type=click.Path(file_okay=False, dir_okay=True),
+            metavar="DIR",
+            help="Directory for the shared cache of repository mirrors. "
+            + "By default no cache is used.",
+        ),
+        click.option(
+            "--cache-max-size",
+            envvar="COMMODORE_CACHE_MAX_SIZE",
+            type=click.IntRange(min=0),
+            metavar="MIB",
+            help="Evict least recently used repository mirrors when the cache is "
+            + "larger than MIB mebibytes.",
+        ),
+        click.option(
+            "--fetch-jobs",
+            envvar="COMMODORE_FETCH_JOBS",
+            type=click.IntRange(min=1),
+            default=4,
+            show_default=True,
+            metavar="N",
+            help="Number of component repositories to fetch concurrently.",
+        ),
+        click.option(
+            "--clone-depth",
+            envvar="COMMODORE_CLONE_DEPTH",
+            type=click.IntRange(min=1),
+            metavar="N",
+            help="Create shallow clones of config, catalog and component "
+            + "repositories with N commits of history.",
+        ),
+        click.option(
+            "--clone-filter",
+            envvar="COMMODORE_CLONE_FILTER",
+            metavar="FILTER",
+            help="Create partial clones of config, catalog and component "
+            + "repositories, e.g. 'blob:none'.",
+        ),
+        click.option(
+            "--single-branch/--no-single-branch",
+            envvar="COMMODORE_SINGLE_BRANCH",
+            default=False,
+            help="Only fetch the requested branch or revision of config, catalog "
+            + "and component repositories.",
+        ),
+        click.option(
+            "--incremental/--no-incremental",
+            envvar="COMMODORE_INCREMENTAL",
+            default=False,
+            help="Only recompile targets whose inputs changed since the last "
+            + "compilation in the working directory.",
+        ),
+        click.option(
+            "--atomic/--no-atomic",
+            envvar="COMMODORE_ATOMIC",
+            default=False,
+            help="Compile into a fresh output directory and keep the output of the "
+            + "last successful compilation until the compilation succeeds.",
+        ),
+        click.option(
+            "--diff",
+            "diff_mode",
+            envvar="COMMODORE_DIFF",
+            type=click.Choice(["none", "stat", "full"]),
+            default="full",
+            show_default=True,
+            help="How to show the changes to the catalog. "
+            + "'none' only shows the number of changed files, "
+            + "'stat' a summary of the changes per file.",
+        ),
+        click.option(
+            "-j",
+            "--jobs",
+            envvar="COMMODORE_JOBS",
+            type=click.IntRange(min=1),
+            metavar="N",
+            help="Number of parallel Kapitan compile and postprocessing processes. "
+            + "Defaults to the number of usable CPUs.",
+        ),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+# pylint: disable=too-many-arguments
+def _configure_compilation(
+    config: Config,
+    api_timeout,
+    api_retries,
+    api_cache_ttl,
+    cache_dir,
+    cache_max_size,
+    fetch_jobs,
+    clone_depth,
+    clone_filter,
+    single_branch,
+    incremental,
+    atomic,
+    diff_mode,
+    jobs,
+):
+    config.api_timeout = api_timeout
+    config.api_retries = api_retries
+    config.api_cache_ttl = api_cache_ttl
+    config.cache_dir = cache_dir
+    if cache_max_size is not None:
+        config.cache_max_size = cache_max_size * 1024 * 1024
+    config.fetch_jobs = fetch_jobs
+    config.clone_options = CloneOptions(
+        depth=clone_depth, filter_spec=clone_filter, single_branch=single_branch
+    )
+    config.incremental = incremental
+    config.atomic = atomic
+    config.diff_mode = diff_mode
+    config.jobs = jobs
+
+
 def _version():
     pyversion = version("commodore")
     if f"v{pyversion}" != __git_version__:
@@ -132,9 +288,10 @@ def clean(config: Config, verbose):
     default=True,
     help="Whether to fetch Jsonnet and Kapitan dependencies in local mode. By default dependencies are fetched.",
 )
+@compile_options
 @verbosity
 @pass_config
-# pylint: disable=too-many-arguments
+# pylint: disable=too-many-arguments,too-many-locals
 def compile_catalog(
     config: Config,
     cluster,
@@ -149,6 +306,19 @@ def compile_catalog(
     global_repo_revision_override,
     tenant_repo_revision_override,
     fetch_dependencies,
+    api_timeout,
+    api_retries,
+    api_cache_ttl,
+    cache_dir,
+    cache_max_size,
+    fetch_jobs,
+    clone_depth,
+    clone_filter,
+    single_branch,
+    incremental,
+    atomic,
+    diff_mode,
+    jobs,
 ):
     config.update_verbosity(verbose)
     config.api_url = api_url
@@ -175,9 +345,137 @@ def compile_catalog(
         # Ensure we always fetch dependencies in regular mode
         fetch_dependencies = True
     config.fetch_dependencies = fetch_dependencies
+    _configure_compilation(
+        config,
+        api_timeout,
+        api_retries,
+        api_cache_ttl,
+        cache_dir,
+        cache_max_size,
+        fetch_jobs,
+        clone_depth,
+        clone_filter,
+        single_branch,
+        incremental,
+        atomic,
+        diff_mode,
+        jobs,
+    )
     _compile(config, cluster)
 
 
+@catalog.command(
+    name="compile-many", short_help="Compile the catalogs of multiple clusters."
+)
+@click.argument("clusters", nargs=-1)
+@click.option(
+    "--api-url", envvar="COMMODORE_API_URL", help="Lieutenant API URL.", metavar="URL"
+)
+@click.option(
+    "--api-token",
+    envvar="COMMODORE_API_TOKEN",
+    help="Lieutenant API token.",
+    metavar="TOKEN",
+)
+@click.option(
+    "--tenant",
+    metavar="TENANT",
+    help="Compile the catalogs of all clusters of tenant TENANT.",
+)
+@click.option(
+    "--all",
+    "all_clusters",
+    is_flag=True,
+    default=False,
+    help="Compile the catalogs of all clusters known to Lieutenant.",
+)
+@click.option(
+    "--push", is_flag=True, default=False, help="Push catalogs to remote repositories."
+)
+@click.option(
+    "--git-author-name",
+    envvar="GIT_AUTHOR_NAME",
+    metavar="USERNAME",
+    help="Name of catalog commit author",
+)
+@click.option(
+    "--git-author-email",
+    envvar="GIT_AUTHOR_EMAIL",
+    metavar="EMAIL",
+    help="E-mail address of catalog commit author",
+)
+@click.option(
+    "--cluster-jobs",
+    envvar="COMMODORE_CLUSTER_JOBS",
+    type=click.IntRange(min=1),
+    default=2,
+    show_default=True,
+    metavar="N",
+    help="Number of clusters to compile concurrently.",
+)
+@compile_options
+@verbosity
+@pass_config
+# pylint: disable=too-many-arguments,too-many-locals
+def compile_many_catalogs(
+    config: Config,
+    clusters,
+    api_url,
+    api_token,
+    tenant,
+    all_clusters,
+    push,
+    git_author_name,
+    git_author_email,
+    cluster_jobs,
+    api_timeout,
+    api_retries,
+    api_cache_ttl,
+    cache_dir,
+    cache_max_size,
+    fetch_jobs,
+    clone_depth,
+    clone_filter,
+    single_branch,
+    incremental,
+    atomic,
+    diff_mode,
+    jobs,
+    verbose,
+):
+    config.update_verbosity(verbose)
+    config.api_url = api_url
+    config.api_token = api_token
+    config.push = push
+    config.username = git_author_name
+    config.usermail = git_author_email
+    _configure_compilation(
+        config,
+        api_timeout,
+        api_retries,
+        api_cache_ttl,
+        cache_dir,
+        cache_max_size,
+        fetch_jobs,
+        clone_depth,
+        clone_filter,
+        single_branch,
+        incremental,
+        atomic,
+        diff_mode,
+        jobs,
+    )
+    if sum([len(clusters) > 0, tenant is not None, all_clusters]) != 1:
+        raise click.ClickException(
+            "Specify either a list of cluster IDs, --tenant or --all"
+        )
+    specs = None
+    if tenant or all_clusters:
+        specs = clusters_from_api(config, tenant=tenant)
+        clusters = list(specs.keys())
+    compile_many(config, clusters, cluster_jobs, clusters=specs)
+
+
 @catalog.command(name="list", short_help="List available catalog cluster IDs")
 @click.option(
     "--api-url", envvar="COMMODORE_API_URL", help="Lieutenant API URL.", metavar="URL"
@@ -293,11 +591,23 @@ def component_delete(config: Config, slug, force, verbose):
     type=click.Path(file_okay=False, dir_okay=True),
     help="Specify output path for compiled component.",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    envvar="COMMODORE_JOBS",
+    type=click.IntRange(min=1),
+    metavar="N",
+    help="Number of parallel Kapitan compile and postprocessing processes. "
+    + "Defaults to the number of usable CPUs.",
+)
 @verbosity
 @pass_config
 # pylint: disable=too-many-arguments
-def component_compile(config: Config, path, values, search_paths, output, verbose):
+def component_compile(
+    config: Config, path, values, search_paths, output, jobs, verbose
+):
     config.update_verbosity(verbose)
+    config.jobs = jobs
     compile_component(config, path, values, search_paths, output)
 
 
@@ -5,7 +5,6 @@ from typing import Iterable, Tuple, Dict, Optional, Union
 import click
 
 from .helpers import (
-    lieutenant_query,
     yaml_dump,
     yaml_load,
 )
@@ -13,6 +12,7 @@ from .helpers import (
 from .component import component_parameters_key
 from .config import Config
 from .inventory import Inventory
+from .lieutenant import ApiError
 
 
 class Cluster:
@@ -96,17 +96,60 @@ class Cluster:
 
 
 def load_cluster_from_api(cfg: Config, cluster_id: str) -> Cluster:
-    cluster_response = lieutenant_query(
-        cfg.api_url, cfg.api_token, "clusters", cluster_id
-    )
+    cluster_response = cfg.lieutenant.cluster(cluster_id)
     if "tenant" not in cluster_response:
         raise click.ClickException("cluster does not have a tenant reference")
-    tenant_response = lieutenant_query(
-        cfg.api_url, cfg.api_token, "tenants", cluster_response["tenant"]
-    )
+    tenant_response = cfg.lieutenant.tenant(cluster_response["tenant"])
     return Cluster(cluster_response, tenant_response)
 
 
+def _skip_cluster(cluster_id: str, reason: str):
+    click.secho(f" > Skipping cluster '{cluster_id}': {reason}", fg="red", err=True)
+
+
+def load_clusters_from_api(
+    cfg: Config,
+    cluster_ids: Optional[Iterable[str]] = None,
+    tenant: Optional[str] = None,
+) -> Dict[str, Cluster]:
+    """
+    Load all clusters, or only the clusters in `cluster_ids` and/or of tenant
+    `tenant`, with two API requests: one to list the clusters and one to list
+    the tenants. Returns a dict of `Cluster` objects indexed by cluster ID.
+
+    Clusters which aren't known to Lieutenant are omitted from the result.
+    Tenants which are missing from the tenant list are fetched individually.
+    Clusters without a tenant reference, or whose tenant can't be fetched, are
+    reported and omitted from the result.
+    """
+    wanted = set(cluster_ids) if cluster_ids is not None else None
+    cluster_responses = [
+        c
+        for c in cfg.lieutenant.clusters()
+        if (wanted is None or c["id"] in wanted)
+        and (tenant is None or c.get("tenant") == tenant)
+    ]
+    if len(cluster_responses) == 0:
+        return {}
+
+    tenant_responses = {t["id"]: t for t in cfg.lieutenant.tenants()}
+    clusters = {}
+    for cluster_response in cluster_responses:
+        cluster_id = cluster_response["id"]
+        if "tenant" not in cluster_response:
+            _skip_cluster(cluster_id, "cluster does not have a tenant reference")
+            continue
+        tenant_id = cluster_response["tenant"]
+        if tenant_id not in tenant_responses:
+            try:
+                tenant_responses[tenant_id] = cfg.lieutenant.tenant(tenant_id)
+            except ApiError as e:
+                _skip_cluster(cluster_id, f"while fetching tenant '{tenant_id}': {e}")
+                continue
+        clusters[cluster_id] = Cluster(cluster_response, tenant_responses[tenant_id])
+    return clusters
+
+
 def read_cluster_and_tenant(inv: Inventory) -> Tuple[str, str]:
     """
     Reads the cluster and tenant ID from the current target.
@@ -182,6 +225,10 @@ def update_target(cfg: Config, target: str, component: Optional[str] = None):
     targetdata = render_target(
         cfg.inventory, target, cfg.get_components().keys(), component=component
     )
+    # Only write the target if it has changed, so the rendered inventory
+    # doesn't get invalidated needlessly.
+    if file.is_file() and yaml_load(file) == targetdata:
+        return
     yaml_dump(targetdata, file)
 
 
@@ -1,6 +1,10 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import click
 
 from . import git
+from .build import AtomicBuild
 from .catalog import fetch_customer_catalog, clean_catalog, update_catalog
 from .cluster import (
     Cluster,
@@ -24,60 +28,83 @@ from .helpers import (
     kapitan_inventory,
     rm_tree_contents,
 )
+from .incremental import expand_stale_targets, select_targets
 from .postprocess import postprocess_components
 from .refs import update_refs
 
 
-def _fetch_global_config(cfg: Config, cluster: Cluster):
+def _clone_global_config(cfg: Config, cluster: Cluster):
     click.secho("Updating global config...", bold=True)
     repo = git.clone_repository(
-        cluster.global_git_repo_url, cfg.inventory.global_config_dir, cfg
+        cluster.global_git_repo_url,
+        cfg.inventory.global_config_dir,
+        cfg,
+        use_cache=True,
     )
     rev = cluster.global_git_repo_revision
     if cfg.global_repo_revision_override:
         rev = cfg.global_repo_revision_override
     if rev:
         git.checkout_version(repo, rev)
-    cfg.register_config("global", repo)
+    return repo
 
 
-def _fetch_customer_config(cfg: Config, cluster: Cluster):
+def _clone_customer_config(cfg: Config, cluster: Cluster):
     click.secho("Updating customer config...", bold=True)
     repo_url = cluster.config_repo_url
     if cfg.debug:
         click.echo(f" > Cloning customer config {repo_url}")
     repo = git.clone_repository(
-        repo_url, cfg.inventory.tenant_config_dir(cluster.tenant_id), cfg
+        repo_url,
+        cfg.inventory.tenant_config_dir(cluster.tenant_id),
+        cfg,
+        use_cache=True,
     )
     rev = cluster.config_git_repo_revision
     if cfg.tenant_repo_revision_override:
         rev = cfg.tenant_repo_revision_override
     if rev:
         git.checkout_version(repo, rev)
-    cfg.register_config("customer", repo)
+    return repo
 
 
-def _regular_setup(config: Config, cluster_id):
-    try:
-        cluster = load_cluster_from_api(config, cluster_id)
-    except ApiError as e:
-        raise click.ClickException(f"While fetching cluster specification: {e}") from e
+def _regular_setup(config: Config, cluster_id, cluster: Optional[Cluster] = None):
+    if cluster is None:
+        try:
+            cluster = load_cluster_from_api(config, cluster_id)
+        except ApiError as e:
+            raise click.ClickException(
+                f"While fetching cluster specification: {e}"
+            ) from e
 
     update_target(config, config.inventory.bootstrap_target)
     update_params(config.inventory, cluster)
 
-    # Fetch components and config
-    _fetch_global_config(config, cluster)
-    _fetch_customer_config(config, cluster)
-    fetch_components(config)
+    # The global config, tenant config and catalog repos don't depend on each
+    # other, so we clone them concurrently. Component discovery only needs
+    # the global and tenant config, and runs while the catalog is still being
+    # cloned. The repository cache is created lazily, create it before
+    # starting the threads, so that they share a single cache which tracks
+    # all mirrors used by this compilation.
+    _ = config.repo_cache
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        global_config = executor.submit(_clone_global_config, config, cluster)
+        customer_config = executor.submit(_clone_customer_config, config, cluster)
+        catalog = executor.submit(fetch_customer_catalog, config, cluster)
 
-    update_target(config, config.inventory.bootstrap_target)
+        # Register configs in a fixed order regardless of which clone finishes
+        # first, as the order is visible in the catalog commit message.
+        config.register_config("global", global_config.result())
+        config.register_config("customer", customer_config.result())
 
-    for alias, component in config.get_component_aliases().items():
-        update_target(config, alias, component=component)
+        fetch_components(config)
+
+        update_target(config, config.inventory.bootstrap_target)
 
-    # Fetch catalog
-    return fetch_customer_catalog(config, cluster)
+        for alias, component in config.get_component_aliases().items():
+            update_target(config, alias, component=component)
+
+        return catalog.result()
 
 
 def _local_setup(config: Config, cluster_id):
@@ -145,13 +172,49 @@ def check_parameters_component_versions(config: Config, cluster_parameters):
         )
 
 
+def _compile_targets(config: Config, inventory, aliases, components):
+    """
+    Compile the Kapitan targets in `aliases` and postprocess the output of
+    `components`. With incremental compilation, only stale targets are
+    compiled, and only the components of stale targets are postprocessed.
+    """
+    compile_targets = list(aliases.keys())
+    fingerprints = None
+    if config.incremental:
+        fingerprints = select_targets(config, inventory, aliases)
+        compile_targets, stale_components = expand_stale_targets(
+            fingerprints.stale_targets(), aliases
+        )
+        components = {cn: c for cn, c in components.items() if cn in stale_components}
+        fingerprints.invalidate(compile_targets)
+
+    # Kapitan compiles all targets if the list of targets is empty, so we
+    # skip compilation completely if all targets are up-to-date.
+    if len(compile_targets) > 0:
+        kapitan_compile(
+            config,
+            compile_targets,
+            search_paths=[config.vendor_dir],
+            fetch_dependencies=config.fetch_dependencies,
+        )
+
+    postprocess_components(config, inventory, components)
+
+    if fingerprints:
+        fingerprints.save()
+
+
 # pylint: disable=redefined-builtin
-def compile(config, cluster_id):
+def compile(config, cluster_id, cluster: Optional[Cluster] = None):
+    """
+    Compile the catalog of cluster `cluster_id`. Callers which already loaded
+    the cluster from the API can pass the `Cluster` object in `cluster`.
+    """
     if config.local:
         catalog_repo = _local_setup(config, cluster_id)
     else:
-        clean_working_tree(config)
-        catalog_repo = _regular_setup(config, cluster_id)
+        clean_working_tree(config, keep_output=config.incremental or config.atomic)
+        catalog_repo = _regular_setup(config, cluster_id, cluster)
 
     inventory = kapitan_inventory(config)
     cluster_parameters = inventory[config.inventory.bootstrap_target]["parameters"]
@@ -186,14 +249,21 @@ def compile(config, cluster_id):
     # parameters
     update_refs(config, aliases, inventory)
 
-    kapitan_compile(
-        config,
-        targets,
-        search_paths=[config.vendor_dir],
-        fetch_dependencies=config.fetch_dependencies,
-    )
-
-    postprocess_components(config, inventory, components)
+    build = None
+    if config.atomic:
+        build = AtomicBuild(config)
+        build.begin(reuse=config.incremental)
+    try:
+        _compile_targets(config, inventory, aliases, components)
+    # Catch BaseException on purpose: if the compilation is interrupted, e.g.
+    # with Ctrl-C (KeyboardInterrupt) or by sys.exit(), the previous output is
+    # restored as well.
+    except BaseException:
+        if build:
+            build.abort()
+        raise
+    if build:
+        build.finish()
 
     update_catalog(config, targets, catalog_repo)
 
@@ -8,7 +8,12 @@ import click
 from git import Repo, BadName, GitCommandError
 from url_normalize.tools import deconstruct_url
 
-from commodore.git import RefError
+from commodore.git import (
+    CloneOptions,
+    RefError,
+    dissociate,
+    fetch_missing_revision,
+)
 
 
 CommitInfo = namedtuple("CommitInfo", ["commit", "branch", "tag"])
@@ -158,8 +163,96 @@ class Component:
 
         return CommitInfo(commit=commit, branch=branch, tag=tag)
 
-    def checkout(self):
-        remote_heads = self._repo.remote().fetch(prune=True, tags=True)
+    def _fetch_from_mirror(self, mirror: P):
+        """
+        Fetch branches and tags from the local bare mirror `mirror` instead of
+        the remote. Only objects which are missing in the component repo are
+        copied from the mirror. The component repo never borrows objects from
+        the mirror, as the mirror may be evicted from the cache at any time.
+        """
+        # Component repos which have been checked out by previous versions of
+        # Commodore may still borrow objects from the mirror.
+        dissociate(self._repo)
+
+        remote = self._repo.remote().name
+        self._repo.git.fetch(
+            str(mirror),
+            f"+refs/heads/*:refs/remotes/{remote}/*",
+            "+refs/tags/*:refs/tags/*",
+            prune=True,
+        )
+        # Point the remote HEAD to the mirror's default branch, so we don't
+        # have to ask the remote for its default branch.
+        mirror_head = Repo(mirror).git.symbolic_ref("HEAD")
+        branch = mirror_head.replace("refs/heads/", "", 1)
+        self._repo.git.symbolic_ref(
+            f"refs/remotes/{remote}/HEAD", f"refs/remotes/{remote}/{branch}"
+        )
+        return list(self._repo.remote().refs) + list(self._repo.tags)
+
+    def _fetch_single_revision(self, clone_options: CloneOptions):
+        """
+        Only fetch the requested version (or the remote's default branch) from
+        the remote. Returns the fetched commit, or None if the version can't
+        be fetched directly, for example because it's an abbreviated commit
+        SHA.
+        """
+        version = self._version or "HEAD"
+        try:
+            self._repo.git.fetch(
+                self._repo.remote().name, version, **clone_options.fetch_kwargs()
+            )
+        except GitCommandError:
+            return None
+        return self._repo.commit("FETCH_HEAD")
+
+    def _fetch_remote_heads(self, mirror: Optional[P], clone_options: CloneOptions):
+        """
+        Fetch branches and tags from the local mirror `mirror` if it's given,
+        otherwise from the remote with `clone_options`. Returns the fetched
+        branches and tags.
+        """
+        if mirror:
+            return self._fetch_from_mirror(mirror)
+        return self._repo.remote().fetch(
+            prune=True, tags=True, **clone_options.fetch_kwargs()
+        )
+
+    def _resolve_commit(self, commit: str):
+        """
+        Return the commit object for `commit`. The commit may be missing in a
+        shallow clone, in that case we try to fetch it.
+        """
+        try:
+            return self._repo.rev_parse(commit)
+        except (BadName, ValueError) as e:
+            rev = fetch_missing_revision(self._repo, commit)
+            if rev is None:
+                raise RefError(
+                    f"Revision '{self.version}' not found in repository"
+                ) from e
+            return rev
+
+    def checkout(
+        self,
+        mirror: Optional[P] = None,
+        clone_options: Optional[CloneOptions] = None,
+    ):
+        """
+        Checkout the component's version. If `mirror` is given, branches and
+        tags are fetched from the local mirror repository instead of the
+        component's remote. Otherwise, `clone_options` controls whether the
+        history fetched from the remote is limited.
+        """
+        if clone_options is None:
+            clone_options = CloneOptions()
+
+        if not mirror and clone_options.single_branch:
+            rev = self._fetch_single_revision(clone_options)
+            if rev is not None:
+                self._checkout_rev(rev)
+                return
+        remote_heads = self._fetch_remote_heads(mirror, clone_options)
         version = self._version
         if self._version is None:
             # Handle case where we want the default branch of the remote
@@ -186,8 +279,7 @@ class Component:
             else:
                 # Create detached head by setting repo.head.reference as
                 # direct ref to commit object.
-                rev = self._repo.rev_parse(commit)
-                self._repo.head.reference = rev
+                self._repo.head.reference = self._resolve_commit(commit)
 
             # Reset working tree to current HEAD reference
             self._repo.head.reset(index=True, working_tree=True)
@@ -196,6 +288,16 @@ class Component:
         except BadName as e:
             raise RefError(f"Revision '{self.version}' not found in repository") from e
 
+    def _checkout_rev(self, rev):
+        """
+        Checkout `rev` as detached HEAD.
+        """
+        try:
+            self._repo.head.reference = rev
+            self._repo.head.reset(index=True, working_tree=True)
+        except GitCommandError as e:
+            raise RefError(f"Failed to checkout revision '{self.version}'") from e
+
     def render_jsonnetfile_json(self, component_params):
         """
         Render jsonnetfile.json from jsonnetfile.jsonnet
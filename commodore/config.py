@@ -1,13 +1,22 @@
+import os
 import textwrap
 
 from pathlib import Path as P
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import click
 from git import Repo
 
 from commodore.component import Component, component_parameters_key
+from .git import CloneOptions
+from .gitcache import MirrorCache
 from .inventory import Inventory
+from .lieutenant import (
+    DEFAULT_CACHE_TTL,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT,
+    LieutenantClient,
+)
 
 
 # pylint: disable=too-many-instance-attributes,too-many-public-methods
@@ -17,6 +26,12 @@ class Config:
     _config_repos: Dict[str, Repo]
     _component_aliases: Dict[str, str]
     _deprecation_notices: List[str]
+    _cache_dir: Optional[P]
+    _cache_max_size: Optional[int]
+    _repo_cache: Optional[MirrorCache]
+    _jobs: Optional[int]
+    _rendered_inventory: Optional[Tuple[str, Dict]]
+    _lieutenant: Optional[LieutenantClient]
 
     # pylint: disable=too-many-arguments
     def __init__(
@@ -30,7 +45,7 @@ class Config:
     ):
         self._work_dir = work_dir.resolve()
         self.api_url = api_url
-        self.api_token = None
+        self._api_token = None
         self.api_token = api_token
         self._components = {}
         self._config_repos = {}
@@ -43,10 +58,27 @@ class Config:
         self.interactive = None
         self.force = False
         self.fetch_dependencies = True
+        self.incremental = False
+        self.atomic = False
+        self.diff_mode = "full"
+        self.fetch_jobs = 4
+        self._jobs = None
+        self.default_jobs: Optional[int] = None
+        self._rendered_inventory = None
+        self.clone_options = CloneOptions()
         self._inventory = Inventory(work_dir=self.work_dir)
         self._deprecation_notices = []
         self._global_repo_revision_override = None
         self._tenant_repo_revision_override = None
+        self._cache_dir = None
+        self._cache_max_size = None
+        self._repo_cache = None
+        self.cache_fresh_since: Optional[float] = None
+        self.api_timeout = DEFAULT_TIMEOUT
+        self.api_retries = DEFAULT_RETRIES
+        self.api_cache_ttl = DEFAULT_CACHE_TTL
+        self._lieutenant = None
+        self._lieutenant_settings: Optional[Tuple] = None
 
     @property
     def verbose(self):
@@ -129,6 +161,98 @@ class Config:
     def inventory(self):
         return self._inventory
 
+    @property
+    def cache_dir(self) -> Optional[P]:
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, d: Optional[P]):
+        self._cache_dir = P(d) if d else None
+        self._repo_cache = None
+
+    @property
+    def cache_max_size(self) -> Optional[int]:
+        """
+        Maximum size of the repository cache in bytes.
+        """
+        return self._cache_max_size
+
+    @cache_max_size.setter
+    def cache_max_size(self, size: Optional[int]):
+        self._cache_max_size = size
+        self._repo_cache = None
+
+    @property
+    def repo_cache(self) -> Optional[MirrorCache]:
+        """
+        Shared cache of component repository mirrors. Returns None if no cache
+        directory is configured. The cache is created on first access, which
+        isn't thread-safe.
+        """
+        if self._repo_cache is None and self._cache_dir:
+            self._repo_cache = MirrorCache(
+                self._cache_dir,
+                max_size=self._cache_max_size,
+                debug=self.debug,
+                fresh_since=self.cache_fresh_since,
+            )
+        return self._repo_cache
+
+    @property
+    def jobs(self) -> int:
+        """
+        Number of parallel compile and postprocessing processes. Defaults to
+        `default_jobs` if set, otherwise to the number of CPUs which are usable
+        by the Commodore process.
+        """
+        if self._jobs is not None:
+            return self._jobs
+        if self.default_jobs is not None:
+            return self.default_jobs
+        return usable_cpu_count()
+
+    @jobs.setter
+    def jobs(self, jobs: Optional[int]):
+        self._jobs = jobs
+
+    @property
+    def lieutenant(self) -> LieutenantClient:
+        """
+        Lieutenant API client for the configured API URL and token. Tenant
+        objects are cached in the repository cache directory, if one is
+        configured.
+        """
+        cache_dir = None
+        if self._cache_dir:
+            cache_dir = self._cache_dir / "lieutenant"
+        settings = (
+            self.api_url,
+            self.api_token,
+            self.api_timeout,
+            self.api_retries,
+            cache_dir,
+            self.api_cache_ttl,
+        )
+        if self._lieutenant is None or self._lieutenant_settings != settings:
+            self._lieutenant = LieutenantClient(
+                self.api_url,
+                self.api_token,
+                timeout=self.api_timeout,
+                retries=self.api_retries,
+                cache_dir=cache_dir,
+                cache_ttl=self.api_cache_ttl,
+            )
+            self._lieutenant_settings = settings
+        return self._lieutenant
+
+    def reset_lieutenant(self):
+        """
+        Discard the Lieutenant API client. Forked child processes must call
+        this, so that they don't share the parent's HTTP connections.
+        """
+        self._lieutenant = None
+        self._lieutenant_settings = None
+
     def update_verbosity(self, verbose):
         self._verbose += verbose
 
@@ -141,6 +265,21 @@ class Config:
     def get_component_repo(self, component_name):
         return self._components[component_name].repo
 
+    def get_rendered_inventory(self, digest: str) -> Optional[Dict]:
+        """
+        Return the rendered inventory if it was rendered from inventory
+        contents with digest `digest`.
+        """
+        if self._rendered_inventory is None:
+            return None
+        cached_digest, inventory = self._rendered_inventory
+        if cached_digest != digest:
+            return None
+        return inventory
+
+    def register_rendered_inventory(self, digest: str, inventory: Dict):
+        self._rendered_inventory = (digest, inventory)
+
     def get_configs(self):
         return self._config_repos
 
@@ -192,3 +331,16 @@ class Config:
                 if "deprecation_notice" in cmeta:
                     msg += f" {cmeta['deprecation_notice']}"
                 self.register_deprecation_notice(msg)
+
+
+def usable_cpu_count() -> int:
+    """
+    Return the number of CPUs the process may run on. On Linux, this honors
+    the process's CPU affinity mask (e.g. CPU limits of containers pinned with
+    cpusets) instead of returning the number of CPUs of the host.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # os.sched_getaffinity() isn't available on all platforms
+        return os.cpu_count() or 1
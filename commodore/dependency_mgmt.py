@@ -1,5 +1,6 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path as P
 from subprocess import call  # nosec
 from typing import Dict, Iterable, List, Optional, Tuple
@@ -9,6 +10,7 @@ import click
 from . import git
 from .config import Config
 from .component import Component, component_dir
+from .gitcache import MirrorCache
 from .helpers import relsymlink, kapitan_inventory
 
 
@@ -105,12 +107,36 @@ def _read_components(
     return component_urls, component_versions
 
 
+def _fetch_component(
+    cfg: Config,
+    cache: Optional[MirrorCache],
+    cn: str,
+    url: str,
+    version: Optional[str],
+) -> Component:
+    if cfg.debug:
+        click.echo(f" > Fetching component {cn}...")
+    c = Component(cn, work_dir=cfg.work_dir, repo_url=url, version=version)
+    mirror = None
+    if cache:
+        mirror = cache.mirror(url)
+    c.checkout(mirror=mirror, clone_options=cfg.clone_options)
+    return c
+
+
 def fetch_components(cfg: Config):
     """
     Download all components required by target. Generate list of components
     by searching for classes with prefix `components.` in the inventory files.
 
     Component repos are searched in `GLOBAL_GIT_BASE/commodore_components`.
+
+    If a repository cache is configured, components are fetched through the
+    cache's bare mirrors instead of directly from their remotes.
+
+    Up to `cfg.fetch_jobs` components are fetched concurrently. Components are
+    registered and symlinked in alphabetical order once all components have
+    been fetched successfully.
     """
 
     click.secho("Discovering components...", bold=True)
@@ -120,16 +146,34 @@ def fetch_components(cfg: Config):
     cfg.register_component_aliases(component_aliases)
     urls, versions = _read_components(cfg, component_names)
     click.secho("Fetching components...", bold=True)
-    for cn in component_names:
-        if cfg.debug:
-            click.echo(f" > Fetching component {cn}...")
-        c = Component(
-            cn, work_dir=cfg.work_dir, repo_url=urls[cn], version=versions[cn]
+    cache = cfg.repo_cache
+    with ThreadPoolExecutor(max_workers=cfg.fetch_jobs) as executor:
+        futures = {
+            cn: executor.submit(
+                _fetch_component, cfg, cache, cn, urls[cn], versions[cn]
+            )
+            for cn in component_names
+        }
+
+    errors = []
+    for cn, f in futures.items():
+        e = f.exception()
+        if e is not None:
+            errors.append(f" > {cn}: {e}")
+    if errors:
+        errmsg = "\n".join(errors)
+        raise click.ClickException(
+            f"Failed to fetch {len(errors)} component(s):\n{errmsg}"
         )
-        c.checkout()
+
+    for cn in component_names:
+        c = futures[cn].result()
         cfg.register_component(c)
         create_component_symlinks(cfg, c)
 
+    if cache:
+        cache.evict()
+
 
 def fetch_jsonnet_libs(config: Config, libs):
     """
@@ -1,16 +1,66 @@
 import difflib
 import hashlib
+import itertools
+import os
+import tempfile
+
+from pathlib import Path as P
+from typing import Any, Dict, Iterable, Iterator, Optional
 
 import click
 
 from git import Repo, Actor
 from git.exc import GitCommandError, BadName
 
+# Diffs of files larger than this are computed by Git instead of difflib
+LARGE_FILE_SIZE = 256 * 1024
+# Diffs of modified files are capped at this many lines in the catalog diff
+MAX_DIFF_LINES = 1000
+
 
 class RefError(ValueError):
     pass
 
 
+class CloneOptions:
+    """
+    Strategy for cloning and fetching Git repositories.
+
+    `depth` creates shallow clones with the given number of commits,
+    `filter_spec` creates partial clones (for example `blob:none`), and
+    `single_branch` only fetches the requested branch or revision.
+    Revisions which aren't present in a shallow, partial or single-branch
+    clone are fetched on demand by `fetch_missing_revision()`.
+    """
+
+    def __init__(
+        self,
+        depth: Optional[int] = None,
+        filter_spec: Optional[str] = None,
+        single_branch: bool = False,
+    ):
+        self.depth = depth
+        self.filter_spec = filter_spec
+        self.single_branch = single_branch
+
+    def fetch_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {}
+        if self.depth:
+            kwargs["depth"] = self.depth
+        if self.filter_spec:
+            kwargs["filter"] = self.filter_spec
+        return kwargs
+
+    def clone_kwargs(self) -> Dict[str, Any]:
+        kwargs = self.fetch_kwargs()
+        if self.single_branch:
+            kwargs["single_branch"] = True
+        elif self.depth:
+            # `git clone --depth` implies `--single-branch`
+            kwargs["no_single_branch"] = True
+        return kwargs
+
+
 def _normalize_git_ssh(url):
     # pylint: disable=import-outside-toplevel
     from url_normalize.url_normalize import (
@@ -37,32 +87,115 @@ def _normalize_git_ssh(url):
     return reconstruct_url(urlparts)
 
 
+def _is_shallow(repo: Repo) -> bool:
+    return P(repo.git_dir, "shallow").is_file()
+
+
+def fetch_missing_revision(repo: Repo, ref: str):
+    """
+    Try to make revision `ref` available in a shallow, partial or
+    single-branch clone. First, fetch `ref` directly from the remote, which
+    works for branches, tags and full commit SHAs. Otherwise, deepen a
+    shallow history step by step until `ref` can be resolved or the complete
+    history has been fetched.
+
+    Returns the commit `ref` resolves to, or None if the revision can't be
+    found.
+    """
+    if len(repo.remotes) == 0:
+        return None
+    remote = repo.remote().name
+    shallow = _is_shallow(repo)
+    try:
+        if shallow:
+            repo.git.fetch(remote, ref, depth=1)
+        else:
+            repo.git.fetch(remote, ref)
+        return repo.commit("FETCH_HEAD")
+    except (GitCommandError, BadName, ValueError):
+        pass
+
+    deepen = 64
+    while _is_shallow(repo):
+        try:
+            repo.git.fetch(remote, deepen=deepen)
+        except GitCommandError:
+            return None
+        try:
+            return repo.commit(ref)
+        except (BadName, ValueError):
+            deepen *= 2
+    return None
+
+
 def checkout_version(repo, ref):
     """
     Checkout the commit `ref` resolves to in `repo`. If `ref` does not resolve
     to a commit, try to resolve `remotes/origin/{ref}` to a commit, and
-    checkout that commit.  Always checkout as detached HEAD as that massively
-    simplifies the implementation.
+    checkout that commit.  If neither resolves, the repository may be a
+    shallow or single-branch clone, and we try to fetch `ref` from the remote.
+    Always checkout as detached HEAD as that massively simplifies the
+    implementation.
     """
     rev = None
+    for name in [f"{ref}", f"remotes/origin/{ref}"]:
+        try:
+            rev = repo.commit(name)
+            break
+        except (BadName, ValueError):
+            # ValueError is raised for full commit SHAs which aren't present
+            # in the repository.
+            pass
+    if not rev:
+        rev = fetch_missing_revision(repo, ref)
+    if not rev:
+        raise RefError(f"Revision '{ref}' not found in repository")
     try:
-        rev = repo.commit(f"{ref}")
-    except BadName:
-        pass
-    try:
-        if not rev:
-            rev = repo.commit(f"remotes/origin/{ref}")
         repo.head.reference = rev
         repo.head.reset(index=True, working_tree=True)
     except GitCommandError as e:
         raise RefError(f"Failed to checkout revision '{ref}'") from e
-    except BadName as e:
-        raise RefError(f"Revision '{ref}' not found in repository") from e
 
 
-def clone_repository(repository_url, directory, cfg):
+def dissociate(repo: Repo):
+    """
+    Copy all objects which `repo` borrows from alternate object stores into
+    the repo itself, and stop using the alternate object stores.
+    """
+    alternates = P(repo.git_dir, "objects", "info", "alternates")
+    if alternates.is_file():
+        repo.git.repack("-a", "-d")
+        alternates.unlink()
+
+
+def _clone_from_mirror(url, mirror: P, directory):
+    """
+    Clone `mirror` into `directory`, and point the clone's remote `origin` to
+    `url`. Git hardlinks the mirror's objects into the clone if possible, the
+    clone doesn't depend on the mirror.
+    """
+    repo = Repo.clone_from(str(mirror), directory)
+    repo.remote().set_url(url)
+    return repo
+
+
+def clone_repository(repository_url, directory, cfg, use_cache=False):
+    """
+    Clone `repository_url` into `directory`. If `use_cache` is True and a
+    repository cache is configured, the repository is cloned from its mirror
+    in the cache.
+    """
+    options = CloneOptions()
+    if cfg:
+        options = cfg.clone_options
+    url = _normalize_git_ssh(repository_url)
     try:
-        repo = Repo.clone_from(_normalize_git_ssh(repository_url), directory)
+        if use_cache and cfg and cfg.repo_cache:
+            repo = _clone_from_mirror(url, cfg.repo_cache.mirror(url), directory)
+        else:
+            repo = Repo.clone_from(url, directory, **options.clone_kwargs())
+    except click.ClickException:
+        raise
     except Exception as e:
         raise click.ClickException(f"While cloning git repository: {e}") from e
     try:
@@ -116,17 +249,103 @@ def _colorize_diff(line):
 
 
 def _compute_similarity(change):
-    before = change.b_blob.data_stream.read().decode("utf-8").split("\n")
-    after = change.a_blob.data_stream.read().decode("utf-8").split("\n")
-    r = difflib.SequenceMatcher(a=before, b=after).ratio()
+    # Git already computed the similarity score when detecting the rename,
+    # GitPython only exposes it in newer versions. Fall back to difflib for
+    # small files, and to an upper bound of the similarity, which can be
+    # computed in linear time, for large files.
+    label = "similarity index"
+    score = getattr(change, "score", None)
+    if score is not None:
+        r = score / 100
+    else:
+        before = change.b_blob.data_stream.read().decode("utf-8").split("\n")
+        after = change.a_blob.data_stream.read().decode("utf-8").split("\n")
+        matcher = difflib.SequenceMatcher(a=before, b=after)
+        if max(change.a_blob.size, change.b_blob.size) > LARGE_FILE_SIZE:
+            r = matcher.quick_ratio()
+            label = "estimated similarity index"
+        else:
+            r = matcher.ratio()
     similarity_diff = []
     similarity_diff.append(click.style(f"--- {change.b_path}", fg="yellow"))
     similarity_diff.append(click.style(f"+++ {change.a_path}", fg="yellow"))
-    similarity_diff.append(f"Renamed file, similarity index {r*100:.2f}%")
+    similarity_diff.append(f"Renamed file, {label} {r*100:.2f}%")
     return similarity_diff
 
 
-def stage_all(repo):
+def _cap_diff(diff_lines: Iterable[str], max_lines: Optional[int]) -> Iterator[str]:
+    """
+    Colorize unified diff `diff_lines` and cap it at `max_lines` lines. The
+    remaining lines are summarized by the number of added and removed lines.
+    """
+    it = iter(diff_lines)
+    for idx, line in enumerate(it):
+        if max_lines is not None and idx >= max_lines:
+            added = removed = 0
+            for rest in itertools.chain([line], it):
+                if rest.startswith("+"):
+                    added += 1
+                elif rest.startswith("-"):
+                    removed += 1
+            yield click.style(
+                f"... diff truncated after {max_lines} lines, "
+                + f"{added} more added and {removed} more removed lines",
+                fg="yellow",
+            )
+            return
+        yield _colorize_diff(line)
+
+
+def _git_diff_lines(repo, path: str) -> Iterator[str]:
+    """
+    Let Git compute the unified diff of the staged changes of `path`. Git's
+    diff is considerably faster than difflib for large files.
+    """
+    out = repo.git.diff(
+        "--cached", "--no-color", "--no-ext-diff", "--no-prefix", "--", path
+    )
+    lines = iter(out.split("\n"))
+    # Skip Git's extended header lines. Git doesn't show the contents of
+    # binary files, their diff only consists of a "Binary files differ" line.
+    for line in lines:
+        if line.startswith("Binary files "):
+            yield line
+            return
+        if line.startswith("--- "):
+            yield line
+            break
+    for line in lines:
+        # Drop the function context from hunk headers, so that the diff is
+        # rendered like the diffs computed with difflib.
+        if line.startswith("@@ "):
+            line = line[: line.index(" @@", 3) + 3]
+        yield line
+
+
+def _modified_file_diff(repo, change, max_lines: Optional[int]) -> Iterator[str]:
+    # The diff objects are backwards, so use b_blob as before and a_blob as
+    # after.
+    if max(change.a_blob.size, change.b_blob.size) > LARGE_FILE_SIZE:
+        diff_lines = _git_diff_lines(repo, change.a_path)
+    else:
+        before = change.b_blob.data_stream.read().decode("utf-8").split("\n")
+        after = change.a_blob.data_stream.read().decode("utf-8").split("\n")
+        diff_lines = difflib.unified_diff(
+            before,
+            after,
+            lineterm="",
+            fromfile=change.b_path,
+            tofile=change.a_path,
+        )
+    return _cap_diff(diff_lines, max_lines)
+
+
+def stage_changes(repo):
+    """
+    Stage all changes in the working tree of `repo`, and return the
+    `git.DiffIndex` of the staged changes. The diff objects are backwards,
+    they describe the changes from the index to `HEAD`.
+    """
     index = repo.index
 
     # Stage deletions
@@ -140,51 +359,97 @@ def stage_all(repo):
 
     # Stage all remaining changes
     index.add("*")
+    return _staged_diff(repo)
+
+
+def _staged_diff(repo):
+    index = repo.index
     # Compute diff of all changes
     try:
-        diff = index.diff(repo.head.commit)
+        return index.diff(repo.head.commit)
     except ValueError:
         # Assume that we're in an empty repo if we get a ValueError from
         # index.diff(repo.head.commit). Diff against empty tree.
-        diff = index.diff(_NULL_TREE(repo))
-
-    changed = False
-    difftext = []
-    if diff:
-        changed = True
-        for ct in diff.change_type:
-            for c in diff.iter_change_type(ct):
-                # Because we're diffing the staged changes, the diff objects
-                # are backwards, and "added" files are actually being deleted
-                # and vice versa for "deleted" files.
-                if ct == "A":
-                    difftext.append(click.style(f"Deleted file {c.b_path}", fg="red"))
-                elif ct == "D":
-                    difftext.append(click.style(f"Added file {c.b_path}", fg="green"))
-                elif ct == "R":
-                    difftext.append(
-                        click.style(
-                            f"Renamed file {c.b_path} => {c.a_path}", fg="yellow"
-                        )
-                    )
-                else:
-                    if c.renamed_file:
-                        # Just compute similarity ratio for renamed files
-                        # similar to git's diffing
-                        difftext.append("\n".join(_compute_similarity(c)).strip())
-                        continue
-                    # Other changes should produce a usable diff
-                    # The diff objects are backwards, so use b_blob as before
-                    # and a_blob as after.
-                    before = c.b_blob.data_stream.read().decode("utf-8").split("\n")
-                    after = c.a_blob.data_stream.read().decode("utf-8").split("\n")
-                    diff_lines = difflib.unified_diff(
-                        before, after, lineterm="", fromfile=c.b_path, tofile=c.a_path
-                    )
-                    diff_lines = [_colorize_diff(line) for line in diff_lines]
-                    difftext.append("\n".join(diff_lines).strip())
-
-    return "\n".join(difftext), changed
+        return index.diff(_NULL_TREE(repo))
+
+
+def stage_paths(
+    repo,
+    changed: Iterable[str],
+    deleted: Iterable[str],
+    pathspecs: Iterable[str] = (),
+):
+    """
+    Stage the changes to the paths in `changed` (added or modified files)
+    and `deleted`, relative to the root of the working tree of `repo`, in one
+    batch. Paths matching `pathspecs` are staged completely with `git add
+    --all`, for parts of the working tree whose changes aren't tracked by the
+    caller.
+
+    In contrast to `stage_changes()`, no other files in the working tree are
+    hashed. Returns the `git.DiffIndex` of the staged changes, like
+    `stage_changes()`.
+    """
+    # Remove deleted files first, a deleted file may be in the way of an
+    # added file, e.g. when a directory is replaced by a file.
+    paths = list(deleted) + list(changed)
+    if paths:
+        # `git update-index --add --remove` adds or updates existing files
+        # and removes missing files from the index. `--replace` replaces
+        # index entries which conflict with an added path.
+        with tempfile.TemporaryFile() as stdin:
+            stdin.write(b"".join(os.fsencode(p) + b"\0" for p in paths))
+            stdin.seek(0)
+            repo.git.update_index(
+                "--add", "--remove", "--replace", "-z", "--stdin", istream=stdin
+            )
+    pathspecs = list(pathspecs)
+    if pathspecs:
+        repo.git.add("--all", "--", *pathspecs)
+    return _staged_diff(repo)
+
+
+def render_diff(repo, diff, max_lines: Optional[int] = MAX_DIFF_LINES) -> Iterator[str]:
+    """
+    Render the staged changes in `diff`, as returned by `stage_changes()`.
+    Yields the rendered diff of one file at a time. Diffs of modified files
+    are capped at `max_lines` lines, pass `None` to render complete diffs.
+    """
+    for ct in diff.change_type:
+        for c in diff.iter_change_type(ct):
+            # Because we're diffing the staged changes, the diff objects
+            # are backwards, and "added" files are actually being deleted
+            # and vice versa for "deleted" files.
+            if ct == "A":
+                yield click.style(f"Deleted file {c.b_path}", fg="red")
+            elif ct == "D":
+                yield click.style(f"Added file {c.b_path}", fg="green")
+            elif ct == "R":
+                yield click.style(f"Renamed file {c.b_path} => {c.a_path}", fg="yellow")
+            elif c.renamed_file:
+                # Just compute similarity ratio for renamed files
+                # similar to git's diffing
+                yield "\n".join(_compute_similarity(c)).strip()
+            else:
+                # Other changes should produce a usable diff
+                text = "\n".join(_modified_file_diff(repo, c, max_lines)).strip()
+                if text:
+                    yield text
+
+
+def render_diff_stat(repo) -> Iterator[str]:
+    """
+    Render a summary of the staged changes, like `git diff --stat`. The
+    summary is computed by Git, without loading any file contents.
+    """
+    out = repo.git.diff("--cached", "--stat", "--no-color", "--no-ext-diff")
+    yield from out.split("\n")
+
+
+def stage_all(repo):
+    diff = stage_changes(repo)
+    difftext = "\n".join(render_diff(repo, diff))
+    return difftext, bool(diff)
 
 
 def commit(repo, commit_message, cfg):
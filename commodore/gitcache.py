@@ -0,0 +1,184 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from contextlib import contextmanager
+from pathlib import Path as P
+from typing import List, Optional, Set, Tuple
+
+import click
+
+from git import Repo
+from git.exc import GitCommandError
+
+
+class MirrorCache:
+    """
+    Shared cache of bare mirror repositories.
+
+    Each remote repository is mirrored exactly once into
+    `<cache_dir>/mirrors/<sha256 of URL>.git`. Repeated requests for the same
+    URL only fetch new commits into the existing mirror. Working copies which
+    are created from a mirror hardlink or copy the mirror's objects and don't
+    depend on the mirror, so mirrors can be evicted at any time.
+
+    Concurrent Commodore processes can share a cache directory, all
+    modifications of a mirror are serialized with a lock file. If
+    `fresh_since` is given, mirrors which have been fetched after that
+    timestamp aren't fetched again, which allows a batch of compilations to
+    fetch each repository only once.
+    """
+
+    _LAST_USED = "commodore-last-used"
+    _LAST_FETCHED = "commodore-last-fetched"
+
+    def __init__(
+        self,
+        cache_dir: P,
+        max_size: Optional[int] = None,
+        debug=False,
+        fresh_since: Optional[float] = None,
+    ):
+        self._dir = P(cache_dir).resolve() / "mirrors"
+        self._max_size = max_size
+        self._debug = debug
+        self._fresh_since = fresh_since
+        self._used: Set[P] = set()
+
+    @property
+    def directory(self) -> P:
+        return self._dir
+
+    @property
+    def max_size(self) -> Optional[int]:
+        return self._max_size
+
+    def mirror_dir(self, url: str) -> P:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self._dir / f"{key}.git"
+
+    @contextmanager
+    def _lock(self, mirror: P, blocking=True):
+        os.makedirs(self._dir, exist_ok=True)
+        with open(mirror.with_suffix(".lock"), "w") as lockf:
+            flags = fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(lockf, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lockf, fcntl.LOCK_UN)
+
+    def mirror(self, url: str) -> P:
+        """
+        Create or update the mirror of `url` and return the path to the bare
+        mirror repository.
+        """
+        path = self.mirror_dir(url)
+        with self._lock(path):
+            try:
+                if not (path / "HEAD").is_file():
+                    self._create(url, path)
+                    (path / self._LAST_FETCHED).touch()
+                elif not self._is_fresh(path):
+                    self._update(path)
+                    (path / self._LAST_FETCHED).touch()
+            except GitCommandError as e:
+                raise click.ClickException(
+                    f"While updating mirror of git repository {url}: {e}"
+                ) from e
+            (path / self._LAST_USED).touch()
+        self._used.add(path)
+        return path
+
+    def _is_fresh(self, path: P) -> bool:
+        if self._fresh_since is None:
+            return False
+        marker = path / self._LAST_FETCHED
+        return marker.exists() and marker.stat().st_mtime >= self._fresh_since
+
+    def _create(self, url: str, path: P):
+        if self._debug:
+            click.echo(f"   > Creating mirror of {url} in {path}")
+        # Clone into a temporary directory first, so that an interrupted clone
+        # never leaves a partial mirror in the cache.
+        tmpdir = P(tempfile.mkdtemp(dir=self._dir, prefix=".clone-"))
+        try:
+            Repo.clone_from(url, tmpdir / "mirror.git", mirror=True)
+            os.rename(tmpdir / "mirror.git", path)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def _update(self, path: P):
+        if self._debug:
+            click.echo(f"   > Updating mirror {path}")
+        repo = Repo(path)
+        repo.git.fetch("origin", prune=True, tags=True)
+        # Track changes of the remote's default branch
+        remote_head = str(repo.git.ls_remote("--symref", "origin", "HEAD"))
+        for line in remote_head.splitlines():
+            if line.startswith("ref: "):
+                ref, _ = line.replace("ref: ", "", 1).split("\t", 1)
+                repo.git.symbolic_ref("HEAD", ref)
+                break
+
+    def _entries(self) -> List[Tuple[float, int, P]]:
+        entries: List[Tuple[float, int, P]] = []
+        if not self._dir.is_dir():
+            return entries
+        for path in self._dir.glob("*.git"):
+            marker = path / self._LAST_USED
+            last_used = marker.stat().st_mtime if marker.exists() else 0.0
+            entries.append((last_used, _du(path), path))
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, used_since: Optional[float] = None):
+        """
+        Delete least recently used mirrors until the cache is smaller than the
+        configured maximum size. Mirrors which were used by this process, or
+        by any process since timestamp `used_since`, are never evicted.
+        """
+        if self._max_size is None:
+            return
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for last_used, size, path in entries:
+            if total <= self._max_size:
+                break
+            if path in self._used:
+                continue
+            if used_since is not None and last_used >= used_since:
+                continue
+            with self._lock(path, blocking=False) as locked:
+                if not locked:
+                    continue
+                if self._debug:
+                    age = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))
+                    click.echo(f" > Evicting mirror {path} (last used {age})")
+                shutil.rmtree(path)
+                total -= size
+
+
+def _du(path: P) -> int:
+    """
+    Return the disk usage of all files below `path` in bytes.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except FileNotFoundError:
+                pass
+    return total
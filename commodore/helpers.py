@@ -1,17 +1,16 @@
 import collections
-import json
+import copy
+import functools
+import hashlib
 import shutil
 import os
+import time
 from pathlib import Path as P
 from typing import Callable, Dict, Iterable, Optional
 
 import click
-import requests
 import yaml
 
-# pylint: disable=redefined-builtin
-from requests.exceptions import ConnectionError, HTTPError
-from url_normalize import url_normalize
 from kapitan import cached
 from kapitan import targets as kapitan_targets
 from kapitan import defaults
@@ -22,6 +21,10 @@ from kapitan.resources import inventory_reclass
 
 from commodore import __install_dir__
 from commodore.config import Config
+from commodore.lieutenant import LieutenantClient
+
+# ApiError is re-exported for backwards compatibility
+from commodore.lieutenant import ApiError  # noqa: F401 pylint: disable=unused-import
 
 
 ArgumentCache = collections.namedtuple("ArgumentCache", ["inventory_path"])
@@ -36,16 +39,12 @@ class FakeVaultBackend(VaultBackend):
         return PlainRef(ref_path)
 
 
-class ApiError(Exception):
-    pass
-
-
 def yaml_load(file):
     """
     Load single-document YAML and return document
     """
     with open(file, "r") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=_YamlLoader)
 
 
 def yaml_load_all(file):
@@ -53,7 +52,29 @@ def yaml_load_all(file):
     Load multi-document YAML and return documents in list
     """
     with open(file, "r") as f:
-        return list(yaml.safe_load_all(f))
+        return list(yaml.load_all(f, Loader=_YamlLoader))
+
+
+def yaml_iter_all(file):
+    """
+    Load multi-document YAML and yield documents one at a time
+    """
+    with open(file, "r") as f:
+        yield from yaml.load_all(f, Loader=_YamlLoader)
+
+
+def yaml_loads(data):
+    """
+    Load single-document YAML from string `data` and return document
+    """
+    return yaml.load(data, Loader=_YamlLoader)
+
+
+def yaml_loads_all(data):
+    """
+    Load multi-document YAML from string `data` and return documents in list
+    """
+    return list(yaml.load_all(data, Loader=_YamlLoader))
 
 
 def _represent_str(dumper, data):
@@ -73,45 +94,72 @@ def _represent_str(dumper, data):
     return dumper.represent_scalar("tag:yaml.org,2002:str", data, style=style)
 
 
+def _yaml_dumper(base):
+    """
+    Return a subclass of dumper class `base` which renders strings with
+    `_represent_str`.
+    """
+
+    # pylint: disable=too-few-public-methods
+    class _Dumper(base):
+        pass
+
+    _Dumper.add_representer(str, _represent_str)
+    return _Dumper
+
+
+# The pure-Python implementation, which is used if PyYAML was built without
+# the libyaml bindings
+_PyYamlLoader = yaml.SafeLoader
+_PyYamlDumper = _yaml_dumper(yaml.SafeDumper)
+
+# Use the libyaml bindings if PyYAML was built with them
+_YamlLoader = getattr(yaml, "CSafeLoader", _PyYamlLoader)
+_YamlDumper = _yaml_dumper(getattr(yaml, "CSafeDumper", yaml.SafeDumper))
+
+
+def yaml_backend() -> str:
+    """
+    Return the implementation used for YAML I/O, either "libyaml" or "python"
+    """
+    return "libyaml" if _YamlLoader is not _PyYamlLoader else "python"
+
+
 def yaml_dump(obj, file):
     """
     Dump obj as single-document YAML
     """
-    yaml.add_representer(str, _represent_str)
     with open(file, "w") as outf:
-        yaml.dump(obj, outf)
+        yaml.dump(obj, outf, Dumper=_YamlDumper)
+
+
+def yaml_dumps(obj) -> str:
+    """
+    Dump obj as single-document YAML and return the YAML as a string
+    """
+    return yaml.dump(obj, Dumper=_YamlDumper)
 
 
 def yaml_dump_all(obj, file):
     """
     Dump obj as multi-document YAML
     """
-    yaml.add_representer(str, _represent_str)
     with open(file, "w") as outf:
-        yaml.dump_all(obj, outf)
+        yaml.dump_all(obj, outf, Dumper=_YamlDumper)
+
+
+@functools.lru_cache(maxsize=8)
+def _lieutenant_client(api_url, api_token) -> LieutenantClient:
+    return LieutenantClient(api_url, api_token)
 
 
 def lieutenant_query(api_url, api_token, api_endpoint, api_id):
-    try:
-        r = requests.get(
-            url_normalize(f"{api_url}/{api_endpoint}/{api_id}"),
-            headers={"Authorization": f"Bearer {api_token}"},
-        )
-    except ConnectionError as e:
-        raise ApiError(f"Unable to connect to Lieutenant at {api_url}") from e
-    try:
-        resp = json.loads(r.text)
-    except json.JSONDecodeError:
-        resp = {"message": "Client error: Unable to parse JSON"}
-    try:
-        r.raise_for_status()
-    except HTTPError as e:
-        extra_msg = "."
-        if r.status_code >= 400:
-            extra_msg = f": {resp['reason']}"
-        raise ApiError(f"API returned {r.status_code}{extra_msg}") from e
-    else:
-        return resp
+    """
+    Query the Lieutenant API. Commodore itself uses `Config.lieutenant`, which
+    keeps one client per configuration. This function reuses one client, and
+    its HTTP session, per API URL and token.
+    """
+    return _lieutenant_client(api_url, api_token).query(api_endpoint, api_id)
 
 
 def _verbose_rmtree(tree, *args, **kwargs):
@@ -119,7 +167,7 @@ def _verbose_rmtree(tree, *args, **kwargs):
     shutil.rmtree(tree, *args, **kwargs)
 
 
-def clean_working_tree(config: Config):
+def clean_working_tree(config: Config, keep_output=False):
     # Defining rmtree as a naked Callable means that mypy won't complain about
     # _verbose_rmtree and shutil.rmtree having slightly different signatures.
     rmtree: Callable
@@ -131,7 +179,8 @@ def clean_working_tree(config: Config):
     rmtree(config.inventory.inventory_dir, ignore_errors=True)
     rmtree(config.inventory.lib_dir, ignore_errors=True)
     rmtree(config.inventory.libs_dir, ignore_errors=True)
-    rmtree(config.inventory.output_dir, ignore_errors=True)
+    if not keep_output:
+        rmtree(config.inventory.output_dir, ignore_errors=True)
     rmtree(config.catalog_dir, ignore_errors=True)
 
 
@@ -148,6 +197,10 @@ def kapitan_compile(
     if not output_dir:
         output_dir = config.work_dir
 
+    targets = list(targets)
+    # Don't spawn more worker processes than there are targets to compile
+    parallel = max(1, min(config.jobs, len(targets)))
+
     if not search_paths:
         search_paths = []
     search_paths = search_paths + [
@@ -155,10 +208,22 @@ def kapitan_compile(
         __install_dir__,
     ]
     reset_reclass_cache()
+    # Let Kapitan reuse the inventory rendered by `kapitan_inventory()` if the
+    # inventory hasn't changed since.
+    rendered = config.get_rendered_inventory(
+        inventory_digest(config.inventory.inventory_dir)
+    )
+    if rendered is not None:
+        # Kapitan modifies the inventory while compiling, e.g. it adds
+        # `target_full_path` to each target. Pass it a copy, so that the
+        # cached inventory stays intact.
+        cached.inv = copy.deepcopy(rendered)
     refController = RefController(config.refs_dir)
     if fake_refs:
         refController.register_backend(FakeVaultBackend())
     click.secho("Compiling catalog...", bold=True)
+    if config.debug:
+        click.echo(f" > Using {parallel} parallel Kapitan process(es)")
     cached.args["compile"] = ArgumentCache(
         inventory_path=config.inventory.inventory_dir
     )
@@ -167,7 +232,7 @@ def kapitan_compile(
         search_paths=search_paths,
         output_path=output_dir,
         targets=targets,
-        parallel=4,
+        parallel=parallel,
         labels=None,
         ref_controller=refController,
         verbose=config.trace,
@@ -183,13 +248,101 @@ def kapitan_compile(
     )
 
 
+# Files which have been modified less than this many seconds before they're
+# hashed are always hashed by content, as a later modification may not change
+# their modification time.
+_RACY_MTIME = 2.0
+
+
+def _hash_file_stat(h, fpath: P, racy_since: float) -> bool:
+    """
+    Feed the size and modification time of `fpath` into hash object `h`.
+    Returns False if the contents of the file must be hashed as well, as the
+    file may be modified again without changing its modification time.
+    """
+    try:
+        st = fpath.stat()
+    except FileNotFoundError:
+        # Dangling symlink
+        return False
+    h.update(f"{st.st_size}:{st.st_mtime_ns}\0".encode("utf-8"))
+    return st.st_mtime < racy_since
+
+
+def hash_tree(h, basedir: P, follow_symlinks=False, contents=True):
+    """
+    Feed the relative paths and contents of all files below `basedir` into
+    hash object `h`. Hidden files and directories, such as `.git`, are
+    skipped. Symlinks to files are followed and the link targets are hashed
+    as well. Symlinks to directories are only descended into if
+    `follow_symlinks` is True.
+
+    With `contents=False`, the size and modification time of each file is
+    hashed instead of its contents, except for files which have been modified
+    in the last few seconds. The resulting digest is only suitable to detect
+    modifications within a process, not to compare trees across checkouts.
+    """
+    if not basedir.is_dir():
+        return
+    racy_since = time.time() - _RACY_MTIME
+    for root, dirs, files in os.walk(basedir, followlinks=follow_symlinks):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for d in dirs:
+            dpath = P(root, d)
+            if dpath.is_symlink():
+                rel = dpath.relative_to(basedir)
+                h.update(f"{rel} -> {os.readlink(dpath)}\0".encode("utf-8"))
+        if not follow_symlinks:
+            dirs[:] = [d for d in dirs if not P(root, d).is_symlink()]
+        for f in sorted(files):
+            if f.startswith("."):
+                continue
+            fpath = P(root, f)
+            h.update(f"{fpath.relative_to(basedir)}\0".encode("utf-8"))
+            if fpath.is_symlink():
+                h.update(f"-> {os.readlink(fpath)}\0".encode("utf-8"))
+            if not contents and _hash_file_stat(h, fpath, racy_since):
+                h.update(b"\0")
+                continue
+            try:
+                with open(fpath, "rb") as fh:
+                    for chunk in iter(functools.partial(fh.read, 65536), b""):
+                        h.update(chunk)
+            except FileNotFoundError:
+                # Dangling symlink
+                h.update(b"\0missing")
+            h.update(b"\0")
+
+
+def inventory_digest(inventory_dir: P) -> str:
+    """
+    Compute a digest of the inventory in `inventory_dir`, including the files
+    and directories the inventory symlinks to. The digest is based on the
+    size and modification time of the inventory files, so that computing it
+    doesn't read the whole inventory.
+    """
+    h = hashlib.sha256()
+    hash_tree(h, inventory_dir, follow_symlinks=True, contents=False)
+    return h.hexdigest()
+
+
 def kapitan_inventory(config: Config, key="nodes") -> Dict:
     """
-    Reset reclass cache and render inventory.
+    Render inventory.
     Returns the top-level key according to the kwarg.
+
+    The rendered inventory is cached in `config` and is only rendered again
+    if the contents of the inventory directory have changed since the last
+    call. Callers must not modify the returned data.
     """
-    reset_reclass_cache()
-    inv = inventory_reclass(config.inventory.inventory_dir)
+    digest = inventory_digest(config.inventory.inventory_dir)
+    inv = config.get_rendered_inventory(digest)
+    if inv is None:
+        reset_reclass_cache()
+        inv = inventory_reclass(config.inventory.inventory_dir)
+        config.register_rendered_inventory(digest, inv)
+    elif config.debug:
+        click.echo(" > Reusing rendered inventory")
     return inv[key]
 
 
@@ -224,6 +377,9 @@ def relsymlink(src: P, dest_dir: P, dest_name: Optional[str] = None):
         click.ClickException(
             f"Can't link {link_src} to {link_dst}. Source does not exist."
         )
-    if link_dst.exists():
+    if link_dst.is_symlink() and os.readlink(link_dst) == link_src:
+        # Don't touch up-to-date symlinks, so the inventory doesn't change
+        return
+    if link_dst.exists() or link_dst.is_symlink():
         os.remove(link_dst)
     os.symlink(link_src, link_dst)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import shutil
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import click
+
+from kapitan.version import VERSION as KAPITAN_VERSION
+
+from commodore import __git_version__
+from .component import Component
+from .config import Config
+from .helpers import hash_tree
+
+FINGERPRINTS_FILE = ".commodore-fingerprints.json"
+
+
+def dependencies_digest(config: Config) -> str:
+    """
+    Compute a digest of the Jsonnet dependencies which are shared by all
+    targets, i.e. the contents of `vendor/` and `dependencies/lib/`.
+    """
+    h = hashlib.sha256()
+    for d in [config.vendor_dir, config.inventory.lib_dir]:
+        h.update(f"{d.name}\0".encode("utf-8"))
+        hash_tree(h, d)
+    return h.hexdigest()
+
+
+def target_fingerprint(
+    target: str,
+    target_inventory: Dict,
+    component: Component,
+    deps_digest: str,
+) -> Optional[str]:
+    """
+    Compute the fingerprint of all inputs of target `target`.
+
+    Returns None if the target's inputs can't be fingerprinted reliably,
+    e.g. because the component repository has uncommitted changes.
+    """
+    if component.repo.is_dirty(untracked_files=True):
+        return None
+    try:
+        component_commit = component.repo.head.commit.hexsha
+    except ValueError:
+        return None
+
+    h = hashlib.sha256()
+    inputs = {
+        "commodore": __git_version__,
+        "kapitan": KAPITAN_VERSION,
+        "target": target,
+        "component": component.name,
+        "component_commit": component_commit,
+        "dependencies": deps_digest,
+        "parameters": target_inventory.get("parameters", {}),
+    }
+    h.update(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8"))
+    filters_file = component.filters_file
+    if filters_file.is_file():
+        h.update(filters_file.read_bytes())
+    return h.hexdigest()
+
+
+class TargetFingerprints:
+    """
+    Fingerprints of the inputs of each target of the previous compilation.
+
+    The fingerprints are stored alongside the compiled output in
+    `compiled/.commodore-fingerprints.json`. A target is only recompiled if
+    its fingerprint differs from the stored fingerprint or if its compiled
+    output is missing.
+    """
+
+    def __init__(self, config: Config):
+        self._output_dir = config.inventory.output_dir
+        self._file = self._output_dir / FINGERPRINTS_FILE
+        self._previous: Dict[str, str] = {}
+        self._current: Dict[str, Optional[str]] = {}
+        if self._file.is_file():
+            try:
+                with open(self._file) as f:
+                    self._previous = json.load(f)
+            except (OSError, ValueError):
+                self._previous = {}
+
+    def compute(
+        self,
+        config: Config,
+        inventory: Dict[str, Dict],
+        aliases: Dict[str, str],
+    ):
+        deps_digest = dependencies_digest(config)
+        components = config.get_components()
+        self._current = {
+            alias: target_fingerprint(
+                alias, inventory.get(alias, {}), components[cn], deps_digest
+            )
+            for alias, cn in aliases.items()
+        }
+
+    def is_stale(self, target: str) -> bool:
+        fp = self._current.get(target)
+        return (
+            fp is None
+            or self._previous.get(target) != fp
+            or not (self._output_dir / target).is_dir()
+        )
+
+    def stale_targets(self) -> List[str]:
+        return [t for t in self._current if self.is_stale(t)]
+
+    def prune_output(self):
+        """
+        Remove compiled output of targets which no longer exist.
+        """
+        if not self._output_dir.is_dir():
+            return
+        for d in self._output_dir.iterdir():
+            if (
+                d.is_dir()
+                and not d.name.startswith(".")
+                and d.name not in self._current
+            ):
+                shutil.rmtree(d)
+
+    def invalidate(self, targets: Iterable[str]):
+        """
+        Drop stored fingerprints of `targets`, so that an interrupted
+        compilation doesn't leave behind fingerprints for partially compiled
+        output.
+        """
+        for t in targets:
+            self._previous.pop(t, None)
+        self._write(self._previous)
+
+    def save(self):
+        self._write({t: fp for t, fp in self._current.items() if fp is not None})
+
+    def _write(self, fingerprints: Dict[str, str]):
+        os.makedirs(self._output_dir, exist_ok=True)
+        # Replace the file instead of writing it in place, the output
+        # directory may contain hardlinks to a previous output, see
+        # `commodore.build.AtomicBuild`.
+        tmpfile = f"{self._file}.tmp"
+        with open(tmpfile, "w") as f:
+            json.dump(fingerprints, f, indent=2, sort_keys=True)
+        os.replace(tmpfile, self._file)
+
+
+def select_targets(
+    config: Config, inventory: Dict[str, Dict], aliases: Dict[str, str]
+) -> TargetFingerprints:
+    """
+    Fingerprint all targets and report which targets are recompiled.
+    """
+    fingerprints = TargetFingerprints(config)
+    fingerprints.compute(config, inventory, aliases)
+    fingerprints.prune_output()
+    stale = fingerprints.stale_targets()
+    unchanged = len(aliases) - len(stale)
+    click.secho(
+        f"Incremental compilation: {len(stale)} of {len(aliases)} target(s) changed",
+        bold=True,
+    )
+    if unchanged > 0:
+        click.echo(f" > Reusing compiled output of {unchanged} unchanged target(s)")
+    if config.debug:
+        for t in stale:
+            click.echo(f" > Recompiling target {t}")
+    return fingerprints
+
+
+def expand_stale_targets(
+    stale: Iterable[str], aliases: Dict[str, str]
+) -> Tuple[List[str], Set[str]]:
+    """
+    Map the stale targets to their components through the alias table
+    `aliases`. Returns the targets to compile and the components to
+    postprocess.
+
+    The postprocessing filters of a component run on the output of the
+    target which is named after the component, and must only run on freshly
+    compiled output. If an instance of a component is stale, the component's
+    own target is therefore compiled as well.
+    """
+    stale = set(stale)
+    components = {aliases[t] for t in stale}
+    targets = [
+        t for t, cn in aliases.items() if t in stale or (t == cn and cn in components)
+    ]
+    return targets, components
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from pathlib import Path as P
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+# pylint: disable=redefined-builtin
+from requests.exceptions import ConnectionError, HTTPError, RequestException
+from url_normalize import url_normalize
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_CACHE_TTL = 300
+
+
+class ApiError(Exception):
+    pass
+
+
+class LieutenantClient:
+    """
+    Client for the Lieutenant API.
+
+    All requests share a pooled HTTP session. Requests which fail with a
+    connection error or a 5xx response are retried with exponential backoff.
+    Responses which carry an ETag are kept in memory and are revalidated with
+    conditional requests. If `cache_dir` is given, tenant objects are
+    additionally cached on disk for `cache_ttl` seconds, so that repeated
+    Commodore runs don't fetch the same tenant again and again. Disk cache
+    entries are specific to the API token, so that a token never sees
+    responses which were fetched with another token.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        api_url: str,
+        api_token: Optional[str],
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = DEFAULT_RETRIES,
+        cache_dir: Optional[P] = None,
+        cache_ttl: int = DEFAULT_CACHE_TTL,
+    ):
+        self._api_url = api_url
+        self._timeout = timeout
+        self._cache_dir = P(cache_dir) if cache_dir else None
+        self._cache_ttl = cache_ttl
+        self._token_digest = hashlib.sha256(
+            (api_token or "").encode("utf-8")
+        ).hexdigest()
+        self._responses: Dict[str, Tuple[str, Any]] = {}
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers["Authorization"] = f"Bearer {api_token}"
+
+    @property
+    def api_url(self) -> str:
+        return self._api_url
+
+    def _url(self, api_endpoint: str, api_id: str) -> str:
+        url = f"{self._api_url}/{api_endpoint}/{api_id}"
+        return url_normalize(url) or url
+
+    def _cache_file(self, url: str) -> Optional[P]:
+        if not self._cache_dir:
+            return None
+        key = hashlib.sha256(f"{self._token_digest}:{url}".encode("utf-8")).hexdigest()
+        return self._cache_dir / f"{key}.json"
+
+    def _read_cache(self, url: str) -> Tuple[Optional[Dict], bool]:
+        """
+        Return the cached entry for `url` and whether it's still fresh.
+        """
+        cache_file = self._cache_file(url)
+        if not cache_file or not cache_file.is_file():
+            return None, False
+        try:
+            with open(cache_file) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, False
+        fresh = time.time() - cache_file.stat().st_mtime < self._cache_ttl
+        return entry, fresh
+
+    def _write_cache(self, url: str, etag: Optional[str], data):
+        cache_file = self._cache_file(url)
+        if not cache_file:
+            return
+        os.makedirs(cache_file.parent, exist_ok=True)
+        # Write atomically, as the cache may be shared by multiple processes
+        fd, tmp = tempfile.mkstemp(dir=cache_file.parent, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"etag": etag, "data": data}, f)
+        os.replace(tmp, cache_file)
+
+    def _get(self, url: str, etag: Optional[str] = None):
+        """
+        GET `url`. Returns the parsed response, the response's ETag and
+        whether the server answered with 304 Not Modified.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        try:
+            r = self._session.get(url, headers=headers, timeout=self._timeout)
+        except ConnectionError as e:
+            raise ApiError(f"Unable to connect to Lieutenant at {self._api_url}") from e
+        except RequestException as e:
+            raise ApiError(
+                f"Request to Lieutenant at {self._api_url} failed: {e}"
+            ) from e
+        if r.status_code == 304:
+            return None, etag, True
+        try:
+            resp = json.loads(r.text)
+        except json.JSONDecodeError:
+            resp = {"message": "Client error: Unable to parse JSON"}
+        try:
+            r.raise_for_status()
+        except HTTPError as e:
+            extra_msg = "."
+            if r.status_code >= 400:
+                extra_msg = f": {resp.get('reason', r.reason)}"
+            raise ApiError(f"API returned {r.status_code}{extra_msg}") from e
+        return resp, r.headers.get("ETag"), False
+
+    def query(self, api_endpoint: str, api_id: str = ""):
+        """
+        Query `api_endpoint` for object `api_id`. Omit `api_id` to list all
+        objects of the endpoint.
+        """
+        url = self._url(api_endpoint, api_id)
+        etag = None
+        if url in self._responses:
+            etag, _ = self._responses[url]
+        resp, etag, not_modified = self._get(url, etag=etag)
+        if not_modified:
+            return self._responses[url][1]
+        if etag:
+            self._responses[url] = (etag, resp)
+        return resp
+
+    def _cached_query(self, api_endpoint: str, api_id: str):
+        """
+        Like `query()`, but cache the response on disk. Fresh cache entries
+        are returned without contacting the API, stale entries are
+        revalidated with a conditional request.
+        """
+        if not self._cache_dir:
+            return self.query(api_endpoint, api_id)
+        url = self._url(api_endpoint, api_id)
+        entry, fresh = self._read_cache(url)
+        if entry is not None and fresh:
+            return entry["data"]
+        etag = entry.get("etag") if entry else None
+        resp, etag, not_modified = self._get(url, etag=etag)
+        if not_modified and entry is not None:
+            resp = entry["data"]
+        self._write_cache(url, etag, resp)
+        return resp
+
+    def cluster(self, cluster_id: str) -> Dict:
+        return self.query("clusters", cluster_id)
+
+    def clusters(self):
+        return self.query("clusters")
+
+    def tenant(self, tenant_id: str) -> Dict:
+        return self._cached_query("tenants", tenant_id)
+
+    def tenants(self):
+        return self.query("tenants")
@@ -1,5 +1,10 @@
+import io
+import multiprocessing
+import sys
+
+from contextlib import redirect_stderr, redirect_stdout
 from pathlib import Path as P
-from typing import Any, Callable, ClassVar, Dict, List, Set
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Set, Tuple
 from typing_extensions import Protocol
 
 import click
@@ -9,7 +14,12 @@ from commodore.helpers import yaml_load
 
 from .inventory import resolve_inventory_vars, InventoryError
 
-from .jsonnet import run_jsonnet_filter, validate_jsonnet_filter
+from .jsonnet import (
+    caches,
+    reset_caches,
+    run_jsonnet_filter,
+    validate_jsonnet_filter,
+)
 from .builtin_filters import run_builtin_filter, validate_builtin_filter
 
 
@@ -153,39 +163,172 @@ def _get_external_filters(
     return filters
 
 
+def _component_filters(
+    config: Config, inventory: Dict[str, Any], cn: str, c: Component
+) -> List[Filter]:
+    # inventory filters
+    invfilters = _get_inventory_filters(inventory)
+
+    # "old", external filters
+    extfilters = _get_external_filters(inventory, c)
+
+    filters: List[Filter] = []
+    for fd in invfilters + extfilters:
+        try:
+            filters.append(Filter.from_dict(config, cn, fd))
+        except (KeyError, ValueError) as e:
+            click.secho(
+                f" > Skipping filter '{fd['filter']}' with invalid definition {fd}: {e}",
+                fg="yellow",
+            )
+    return filters
+
+
+def _run_filters(config: Config, inventory: Dict, cn: str, filters: List[Filter]):
+    if config.debug:
+        click.echo(f" > {cn}...")
+
+    for f in filters:
+        if config.debug:
+            click.secho(f"   > Executing filter '{f.type}:{f.filter}'")
+        try:
+            f.run(config, inventory, cn)
+        except click.ClickException:
+            raise
+        except Exception as e:
+            raise click.ClickException(
+                f"Filter '{f.type}:{f.filter}' of component {cn} failed: "
+                + f"{type(e).__name__}: {e}"
+            ) from e
+
+
+# Config, inventories, filters and colour setting of the postprocessing run,
+# set in each worker process by `_init_worker()`.
+_worker_context: Optional[
+    Tuple[Config, Dict[str, Dict], Dict[str, List[Filter]], bool]
+] = None
+
+
+def _init_worker(
+    config: Config,
+    inventories: Dict[str, Dict],
+    filters: Dict[str, List[Filter]],
+    color: bool,
+):
+    # pylint: disable=global-statement
+    global _worker_context
+    _worker_context = (config, inventories, filters, color)
+
+
+def _cache_stats() -> Dict[str, Tuple[int, int]]:
+    return {name: (c.hits, c.misses) for name, c in caches().items()}
+
+
+def _postprocess_worker(
+    cn: str,
+) -> Tuple[str, str, Optional[str], Dict[str, Tuple[int, int]]]:
+    """
+    Run the filters of component `cn` in a worker process. Returns the
+    component name, the output of the filters, an error message if a
+    filter failed, and the hits and misses of the worker's caches for the
+    component.
+    """
+    assert _worker_context is not None
+    config, inventories, filters, color = _worker_context
+    before = _cache_stats()
+    out = io.StringIO()
+    error = None
+    # The captured output isn't a terminal, keep the styling of the output
+    # according to the parent's colour setting instead of stripping it.
+    with click.Context(click.Command("postprocess"), color=color):
+        with redirect_stdout(out), redirect_stderr(out):
+            try:
+                _run_filters(config, inventories[cn], cn, filters[cn])
+            except click.ClickException as e:
+                error = e.format_message()
+    stats = {
+        name: (hits - before[name][0], misses - before[name][1])
+        for name, (hits, misses) in _cache_stats().items()
+    }
+    return cn, out.getvalue(), error, stats
+
+
+def _output_color() -> bool:
+    ctx = click.get_current_context(silent=True)
+    if ctx is not None and ctx.color is not None:
+        return ctx.color
+    return sys.stdout.isatty()
+
+
+def _run_parallel(
+    config: Config,
+    inventories: Dict[str, Dict],
+    filters: Dict[str, List[Filter]],
+    processes: int,
+):
+    """
+    Run the filter chains of all components in `filters` in `processes`
+    worker processes. The filters of each component run in order in a single
+    worker. The output of each component is shown in the order of `filters`,
+    after its filters have completed.
+    """
+    errors = []
+    # Fork the workers, so that the config and inventories are inherited
+    # instead of pickled.
+    with multiprocessing.get_context("fork").Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(config, inventories, filters, _output_color()),
+    ) as pool:
+        for cn, output, error, stats in pool.imap(_postprocess_worker, filters.keys()):
+            sys.stdout.write(output)
+            for name, cache in caches().items():
+                cache.hits += stats[name][0]
+                cache.misses += stats[name][1]
+            if error:
+                click.secho(f" > Postprocessing {cn} failed: {error}", fg="red")
+                errors.append(cn)
+
+    if errors:
+        raise click.ClickException(
+            f"Postprocessing failed for component(s) {', '.join(errors)}"
+        )
+
+
 def postprocess_components(
     config: Config,
     kapitan_inventory: Dict[str, Dict[str, Any]],
     components: Dict[str, Component],
 ):
     click.secho("Postprocessing...", bold=True)
+    reset_caches()
 
+    filters: Dict[str, List[Filter]] = {}
     for cn, c in components.items():
         inventory = kapitan_inventory.get(cn)
         if not inventory:
             click.echo(f" > No target exists for component {cn}, skipping...")
             continue
 
-        # inventory filters
-        invfilters = _get_inventory_filters(inventory)
-
-        # "old", external filters
-        extfilters = _get_external_filters(inventory, c)
-
-        filters: List[Filter] = []
-        for fd in invfilters + extfilters:
-            try:
-                filters.append(Filter.from_dict(config, cn, fd))
-            except (KeyError, ValueError) as e:
-                click.secho(
-                    f" > Skipping filter '{fd['filter']}' with invalid definition {fd}: {e}",
-                    fg="yellow",
+        component_filters = _component_filters(config, inventory, cn, c)
+        if len(component_filters) > 0:
+            filters[cn] = component_filters
+
+    # The outputs of different components are disjoint, so their filters can
+    # run concurrently.
+    processes = min(config.jobs, len(filters))
+    if processes > 1:
+        if config.debug:
+            click.echo(f" > Using {processes} parallel postprocessing process(es)")
+        _run_parallel(config, kapitan_inventory, filters, processes)
+    else:
+        for cn, component_filters in filters.items():
+            _run_filters(config, kapitan_inventory[cn], cn, component_filters)
+
+    if config.debug:
+        for name, cache in caches().items():
+            if cache.hits + cache.misses > 0:
+                click.echo(
+                    f" > {name} cache: {cache.hits} hits, {cache.misses} misses "
+                    + f"({cache.hits / (cache.hits + cache.misses):.0%} hit rate)"
                 )
-
-        if len(filters) > 0 and config.debug:
-            click.echo(f" > {cn}...")
-
-        for f in filters:
-            if config.debug:
-                click.secho(f"   > Executing filter '{f.type}:{f.filter}'")
-            f.run(config, inventory, cn)
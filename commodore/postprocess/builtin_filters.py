@@ -1,26 +1,120 @@
 import json
+import os
 
 from pathlib import Path as P
-from typing import Dict
+from typing import Any, Dict, Iterable, Set, Tuple
 
 import _jsonnet
 import click
 
 from commodore import __install_dir__
 from commodore.config import Config
+from commodore.helpers import yaml_dump, yaml_dump_all, yaml_iter_all
 
-from .jsonnet import jsonnet_runner
+from .jsonnet import invalidate_cached_file, jsonnet_runner
 
 
 def _output_dir(work_dir: P, component: str, path):
     return work_dir / "compiled" / component / path
 
 
-def _builtin_filter_helm_namespace(work_dir: P, inv, component: str, path, **kwargs):
+def _excluded_objects(exclude_objects: Iterable[Dict]) -> Set[Tuple[Any, Any]]:
+    try:
+        return {(e["kind"], e["name"]) for e in exclude_objects}
+    except (KeyError, TypeError) as e:
+        raise click.ClickException(
+            "Builtin filter 'helm_namespace': entries of filter argument "
+            + "'exclude_objects' must have keys 'kind' and 'name'"
+        ) from e
+
+
+def _patch_namespace(obj: Any, namespace: str, excluded: Set[Tuple[Any, Any]]):
+    if not isinstance(obj, dict):
+        return obj
+    metadata = obj.get("metadata") or {}
+    if (obj.get("kind"), metadata.get("name")) not in excluded:
+        obj["metadata"] = metadata
+        metadata["namespace"] = namespace
+    return obj
+
+
+def _namespace_manifest(namespace: str) -> Dict:
+    """
+    Render the same Namespace object as `kube.Namespace()` of kube-libsonnet
+    """
+    return {
+        "apiVersion": "v1",
+        "kind": "Namespace",
+        "metadata": {
+            "annotations": {},
+            "labels": {"name": "-".join(namespace.split(":"))},
+            "name": namespace,
+        },
+    }
+
+
+def _builtin_filter_helm_namespace(work_dir: P, _inv, component: str, path, **kwargs):
+    """
+    Set the namespace of all objects in the files in `path`, except for the
+    objects listed in filter argument `exclude_objects`.
+
+    Files are rewritten one at a time, and the objects of each file are
+    streamed from the input file to the output file.
+    """
     if "namespace" not in kwargs:
         raise click.ClickException(
             "Builtin filter 'helm_namespace': filter argument 'namespace' is required"
         )
+    namespace = kwargs["namespace"]
+    create_namespace = kwargs.get("create_namespace", False)
+    if not isinstance(create_namespace, bool):
+        create_namespace = create_namespace == "true"
+    excluded = _excluded_objects(kwargs.get("exclude_objects", []))
+    output_dir = _output_dir(work_dir, component, path)
+
+    # Like the Jsonnet implementation, write the objects of each file to
+    # `<stem>.yaml`, where `<stem>` is the file name without the last
+    # extension.
+    outpaths: Dict[P, P] = {}
+    for f in sorted(x for x in output_dir.iterdir() if x.is_file()):
+        outpath = output_dir / f"{f.name.rpartition('.')[0]}.yaml"
+        if outpath in outpaths:
+            raise click.ClickException(
+                f"Builtin filter 'helm_namespace': files '{outpaths[outpath].name}' "
+                + f"and '{f.name}' would both be written to '{outpath.name}'"
+            )
+        outpaths[outpath] = f
+
+    for outpath, f in outpaths.items():
+        tmppath = outpath.with_name(f".{outpath.name}.tmp")
+        try:
+            yaml_dump_all(
+                (
+                    _patch_namespace(obj, namespace, excluded)
+                    for obj in yaml_iter_all(f)
+                    if obj is not None
+                ),
+                tmppath,
+            )
+        except BaseException:
+            tmppath.unlink(missing_ok=True)
+            raise
+        os.replace(tmppath, outpath)
+        invalidate_cached_file(outpath)
+
+    if create_namespace:
+        nsfile = output_dir / "00_namespace.yaml"
+        yaml_dump(_namespace_manifest(namespace), nsfile)
+        invalidate_cached_file(nsfile)
+
+
+def _builtin_filter_helm_namespace_jsonnet(
+    work_dir: P, inv, component: str, path, **kwargs
+):
+    if "namespace" not in kwargs:
+        raise click.ClickException(
+            "Builtin filter 'helm_namespace_jsonnet': filter argument 'namespace' is required"
+        )
     create_namespace = kwargs.get("create_namespace", "false")
     # Transform create_namespace to string as jsonnet extvars can only be
     # strings
@@ -47,6 +141,7 @@ def _builtin_filter_helm_namespace(work_dir: P, inv, component: str, path, **kwa
 
 _builtin_filters = {
     "helm_namespace": _builtin_filter_helm_namespace,
+    "helm_namespace_jsonnet": _builtin_filter_helm_namespace_jsonnet,
 }
 
 
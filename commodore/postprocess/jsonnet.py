@@ -1,55 +1,95 @@
+import hashlib
 import json
 import os
 import functools
+import stat
 
 from pathlib import Path as P
-from typing import Any, Callable, Dict, Iterable
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import _jsonnet
 
 from commodore.config import Config
-from commodore.helpers import yaml_load, yaml_load_all, yaml_dump, yaml_dump_all
+from commodore.helpers import yaml_loads, yaml_loads_all, yaml_dump, yaml_dump_all
 from commodore import __install_dir__
 
 
-def _try_path(basedir: P, rel: str):
+class ImportCache:
     """
-    Returns content of file basedir/rel if it exists, None if file not found, or throws an exception
+    Cache for the Jsonnet import callback of postprocessing filters.
+
+    The cache memoizes which file an import resolves to, and the contents of
+    imported files, keyed by path. Cached contents are only used while the
+    file's mtime and size are unchanged. Import resolution isn't invalidated
+    when a file is created in a directory which is earlier in the search path
+    than the memoized file, so the cache should only be used for a single
+    postprocessing run.
     """
-    if not rel:
-        raise RuntimeError("Got invalid filename (empty string).")
-    if rel[0] == "/":
-        full_path = P(rel)
-    else:
-        full_path = basedir / rel
-    if full_path.is_dir():
-        raise RuntimeError("Attempted to import a directory")
 
-    if not full_path.is_file():
-        return full_path.name, None
-    with open(full_path) as f:
-        return full_path.name, f.read()
+    def __init__(self):
+        self._search_paths: Dict[P, List[P]] = {}
+        self._resolved: Dict[Tuple[P, str, str], P] = {}
+        self._contents: Dict[P, Tuple[Tuple[int, int], str]] = {}
+        self.hits = 0
+        self.misses = 0
 
+    def _search_path(self, work_dir: P) -> List[P]:
+        search_path = self._search_paths.get(work_dir)
+        if search_path is None:
+            # Add current working dir to search path for Jsonnet import callback
+            search_path = [
+                work_dir.resolve(),
+                __install_dir__.resolve(),
+                (work_dir / "vendor").resolve(),
+            ]
+            self._search_paths[work_dir] = search_path
+        return search_path
 
-def _import_callback_with_searchpath(search: Iterable[P], basedir: P, rel: str):
-    full_path, content = _try_path(basedir, rel)
-    if content:
-        return full_path, content
-    for p in search:
-        full_path, content = _try_path(p, rel)
-        if content:
-            return full_path, content
-    raise RuntimeError("File not found")
+    def _read(self, full_path: P) -> Optional[str]:
+        """
+        Returns content of file `full_path` if it exists, None if file not
+        found, or throws an exception
+        """
+        try:
+            st = full_path.stat()
+        except FileNotFoundError:
+            return None
+        if stat.S_ISDIR(st.st_mode):
+            raise RuntimeError("Attempted to import a directory")
+        version = (st.st_mtime_ns, st.st_size)
+        cached = self._contents.get(full_path)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        with open(full_path) as f:
+            content = f.read()
+        self._contents[full_path] = (version, content)
+        return content
 
+    def _candidates(self, work_dir: P, basedir: str, rel: str) -> Iterator[P]:
+        if not rel:
+            raise RuntimeError("Got invalid filename (empty string).")
+        if rel[0] == "/":
+            yield P(rel)
+            return
+        yield P(basedir) / rel
+        for p in self._search_path(work_dir):
+            yield p / rel
 
-def _import_cb(work_dir: P, basedir: str, rel: str):
-    # Add current working dir to search path for Jsonnet import callback
-    search_path = [
-        work_dir.resolve(),
-        __install_dir__.resolve(),
-        (work_dir / "vendor").resolve(),
-    ]
-    return _import_callback_with_searchpath(search_path, P(basedir), rel)
+    def import_callback(self, work_dir: P, basedir: str, rel: str) -> Tuple[str, str]:
+        key = (work_dir, basedir, rel)
+        full_path = self._resolved.get(key)
+        if full_path is not None:
+            content = self._read(full_path)
+            if content:
+                return full_path.name, content
+        for full_path in self._candidates(work_dir, basedir, rel):
+            content = self._read(full_path)
+            if content:
+                self._resolved[key] = full_path
+                return full_path.name, content
+        raise RuntimeError("File not found")
 
 
 def _list_dir(basedir: os.PathLike, basename: bool):
@@ -65,19 +105,194 @@ def _list_dir(basedir: os.PathLike, basename: bool):
     return files
 
 
+class NativeCallbackCache:
+    """
+    Cache for the `yaml_load`, `yaml_load_all`, `list_dir` and
+    `inventory_json` native callbacks of Jsonnet filters.
+
+    Parsed YAML documents are cached by the digest of the file contents, so
+    that identical files are only parsed once. The digest of each file and
+    directory listings are memoized by path, and must be invalidated with
+    `invalidate()` when a file is written. Callers must not modify the
+    returned data.
+    """
+
+    def __init__(self):
+        self._digests: Dict[P, str] = {}
+        self._parsed: Dict[Tuple[str, bool], Any] = {}
+        self._listings: Dict[Tuple[P, bool], List] = {}
+        self._inventories: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, file: os.PathLike, load_all: bool):
+        path = P(file).absolute()
+        data = None
+        digest = self._digests.get(path)
+        if digest is None:
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            self._digests[path] = digest
+        key = (digest, load_all)
+        if key in self._parsed:
+            self.hits += 1
+            return self._parsed[key]
+        self.misses += 1
+        if data is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        text = data.decode("utf-8")
+        parsed = yaml_loads_all(text) if load_all else yaml_loads(text)
+        self._parsed[key] = parsed
+        return parsed
+
+    def yaml_load(self, file: os.PathLike):
+        return self._load(file, load_all=False)
+
+    def yaml_load_all(self, file: os.PathLike):
+        return self._load(file, load_all=True)
+
+    def list_dir(self, basedir: os.PathLike, basename: bool):
+        key = (P(basedir).absolute(), basename)
+        if key in self._listings:
+            self.hits += 1
+            return self._listings[key]
+        self.misses += 1
+        listing = _list_dir(basedir, basename)
+        self._listings[key] = listing
+        return listing
+
+    def inventory_json(self, target: str, inventory: Dict[str, Any]) -> str:
+        """
+        Return the inventory of target `target` encoded as JSON. Passing a
+        single string to the Jsonnet VM is much cheaper than converting the
+        inventory dict into Jsonnet values on every call.
+        """
+        encoded = self._inventories.get(target)
+        if encoded is not None:
+            self.hits += 1
+            return encoded
+        self.misses += 1
+        encoded = json.dumps(inventory)
+        self._inventories[target] = encoded
+        return encoded
+
+    def invalidate(self, file: os.PathLike):
+        """
+        Forget cached data of file `file`, and listings of its directory.
+        """
+        path = P(file).absolute()
+        self._digests.pop(path, None)
+        self._listings.pop((path.parent, True), None)
+        self._listings.pop((path.parent, False), None)
+
+
+_import_cache = ImportCache()
+_callback_cache = NativeCallbackCache()
+
+
+def caches() -> Dict[str, Any]:
+    """
+    Return the caches of the current postprocessing run by name.
+    """
+    return {"Jsonnet import": _import_cache, "Native callback": _callback_cache}
+
+
+def reset_caches():
+    """
+    Discard the Jsonnet import and native callback caches. Call this at the
+    start of each postprocessing run.
+    """
+    # pylint: disable=global-statement
+    global _import_cache, _callback_cache
+    _import_cache = ImportCache()
+    _callback_cache = NativeCallbackCache()
+
+
+def invalidate_cached_file(file: os.PathLike):
+    """
+    Invalidate cached native callback data of file `file`. Filters must call
+    this for each file they write.
+    """
+    _callback_cache.invalidate(file)
+
+
+def _yaml_load(file):
+    return _callback_cache.yaml_load(file)
+
+
+def _yaml_load_all(file):
+    return _callback_cache.yaml_load_all(file)
+
+
+def _cached_list_dir(basedir, basename):
+    return _callback_cache.list_dir(basedir, basename)
+
+
 _native_callbacks = {
-    "yaml_load": (("file",), yaml_load),
-    "yaml_load_all": (("file",), yaml_load_all),
+    "yaml_load": (("file",), _yaml_load),
+    "yaml_load_all": (("file",), _yaml_load_all),
     "list_dir": (
         (
             "dir",
             "basename",
         ),
-        _list_dir,
+        _cached_list_dir,
     ),
 }
 
 
+def _skip_ws(doc: str, pos: int) -> int:
+    while pos < len(doc) and doc[pos] in " \t\n\r":
+        pos += 1
+    return pos
+
+
+def _expect(doc: str, pos: int, chars: str) -> str:
+    if pos >= len(doc) or doc[pos] not in chars:
+        expected = " or ".join(f"'{c}'" for c in chars)
+        raise json.JSONDecodeError(f"Expecting {expected}", doc, pos)
+    return doc[pos]
+
+
+def _iter_output_objects(output: str) -> Iterator[Tuple[str, Any]]:
+    """
+    Decode the JSON object `output` one member at a time. This avoids holding
+    the decoded contents of all output files in memory at once.
+    """
+    decoder = json.JSONDecoder()
+    pos = _skip_ws(output, 0)
+    _expect(output, pos, "{")
+    pos = _skip_ws(output, pos + 1)
+    if pos < len(output) and output[pos] == "}":
+        return
+    while True:
+        _expect(output, pos, '"')
+        key, pos = decoder.raw_decode(output, pos)
+        pos = _skip_ws(output, pos)
+        _expect(output, pos, ":")
+        pos = _skip_ws(output, pos + 1)
+        value, pos = decoder.raw_decode(output, pos)
+        yield key, value
+        del value
+        pos = _skip_ws(output, pos)
+        if _expect(output, pos, ",}") == "}":
+            return
+        pos = _skip_ws(output, pos + 1)
+
+
+def _write_output(outpath: P, contents: Any):
+    invalidate_cached_file(outpath)
+    if not outpath.exists():
+        print(f"   > {outpath} doesn't exist, creating...")
+        os.makedirs(outpath.parent, exist_ok=True)
+    if isinstance(contents, list):
+        yaml_dump_all(contents, outpath)
+    else:
+        yaml_dump(contents, outpath)
+
+
 # pylint: disable=too-many-arguments
 def jsonnet_runner(
     work_dir: P,
@@ -91,28 +306,25 @@ def jsonnet_runner(
     def _inventory() -> Dict[str, Any]:
         return inv
 
-    _native_cb = _native_callbacks
+    def _inventory_json() -> str:
+        return _callback_cache.inventory_json(component, inv)
+
+    _native_cb = dict(_native_callbacks)
     _native_cb["inventory"] = ((), _inventory)
+    _native_cb["inventory_json"] = ((), _inventory_json)
     kwargs["target"] = component
     kwargs["component"] = component
     output_dir = work_dir / "compiled" / component / path
     kwargs["output_path"] = str(output_dir)
     output = jsonnet_func(
         str(jsonnet_input),
-        import_callback=functools.partial(_import_cb, work_dir),
+        import_callback=functools.partial(_import_cache.import_callback, work_dir),
         native_callbacks=_native_cb,
         ext_vars=kwargs,
     )
-    out_objs = json.loads(output)
-    for outobj, outcontents in out_objs.items():
-        outpath = output_dir / f"{outobj}.yaml"
-        if not outpath.exists():
-            print(f"   > {outpath} doesn't exist, creating...")
-            os.makedirs(outpath.parent, exist_ok=True)
-        if isinstance(outcontents, list):
-            yaml_dump_all(outcontents, outpath)
-        else:
-            yaml_dump(outcontents, outpath)
+    # Write each output file as soon as its contents are decoded
+    for outobj, outcontents in _iter_output_objects(output):
+        _write_output(output_dir / f"{outobj}.yaml", outcontents)
 
 
 def _filter_file(work_dir: P, component: str, filterpath: str) -> P:
@@ -1,14 +1,17 @@
+import hashlib
+import json
 import re
 import os
+import shutil
 from base64 import b64encode
 from pathlib import Path as P
-from typing import Dict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import click
 
 from .component import component_parameters_key
 from .config import Config
-from .helpers import rm_tree_contents, yaml_dump
+from .helpers import yaml_dumps
 
 
 class SecretRef:
@@ -59,37 +62,128 @@ class SecretRef:
 
         raise NotImplementedError(f"Ref type: {self.type}")
 
-    def create_kapitan_ref(self, refdir, ref_params, debug=False):
-        """
-        Create a Kapitan secret ref file from this reference.
+    def add_key(self, key):
+        self.keys.append(key)
 
-        This method creates a secret ref file in `refdir` which Kapitan can
-        subsequently use for revealing the secret.
 
-        Currently only `vaultkv` references are supported.
-        """
-        reffile = P(refdir, self.ref)
-        if debug:
-            click.echo(f"    > Writing to file {reffile}")
-        if self.type != "vaultkv":
-            raise NotImplementedError(f"ref type: {self.type}")
-        params = ref_params[self.type]
-        refdef = {
-            "data": self._mangle_ref(),
+# Render the contents of the Kapitan secret ref files for a list of refs of
+# one type, given the backend parameters configured in
+# `parameters.kapitan.secrets.<type>`. Returns the contents in the order of the
+# refs.
+RefRenderFunc = Callable[[List[SecretRef], Dict], List[Dict]]
+
+
+def _render_vaultkv(refs: List[SecretRef], params: Dict) -> List[Dict]:
+    if not params:
+        raise click.ClickException(
+            f"Secret ref '{refs[0].refstr}' requires parameters in "
+            + "`parameters.kapitan.secrets.vaultkv`"
+        )
+    return [
+        {
+            "data": r._mangle_ref(),  # pylint: disable=protected-access
             "encoding": "original",
-            "type": self.type,
-            params["key"]: params["values"],
+            "type": r.type,
+            "vault_params": params,
         }
-        os.makedirs(reffile.parent, exist_ok=True)
-        yaml_dump(refdef, reffile)
+        for r in refs
+    ]
 
-    def add_key(self, key):
-        self.keys.append(key)
+
+class RefBackends:
+    """
+    Registry of the secret ref backends. Commodore generates the ref files of
+    backends which have a render function, and leaves the ref files of
+    external backends alone.
+
+    `update_refs()` uses a fresh registry for each run unless it's given one,
+    so registrations never leak between runs.
+    """
+
+    _handlers: Dict[str, RefRenderFunc]
+    _external: Set[str]
+
+    def __init__(self):
+        self._handlers = {"vaultkv": _render_vaultkv}
+        # Ref files of these types contain the (encrypted) secret itself, so
+        # Commodore can't generate them. They must be created with `kapitan
+        # refs --write` and committed to the catalog repository.
+        self._external = {"awskms", "base64", "gkms", "plain"}
+
+    def register(self, reftype: str, render: RefRenderFunc):
+        """
+        Register function `render` to generate the ref files for references
+        of type `reftype`.
+        """
+        self._handlers[reftype] = render
+        self._external.discard(reftype)
+
+    def generated(self, reftype: str) -> bool:
+        """
+        Whether Commodore generates the ref files for references of type
+        `reftype`.
+        """
+        return reftype in self._handlers
+
+    def external(self, reftype: str) -> bool:
+        """
+        Whether the ref files for references of type `reftype` are managed
+        outside of Commodore.
+        """
+        return reftype in self._external
+
+    def render(self, reftype: str, refs: List[SecretRef], params: Dict) -> Dict[P, str]:
+        """
+        Render the ref files of `refs`, which are all of type `reftype`, with
+        a single call of the backend's render function. Returns the ref file
+        contents indexed by path relative to the refs directory.
+        """
+        contents = self._handlers[reftype](refs, params)
+        if len(contents) != len(refs):
+            raise click.ClickException(
+                f"Secret ref backend '{reftype}' rendered {len(contents)} "
+                + f"ref files for {len(refs)} refs"
+            )
+        return {P(r.ref): yaml_dumps(c) for r, c in zip(refs, contents)}
+
+
+def _children(params):
+    if isinstance(params, dict):
+        return iter(params.items())
+    return enumerate(params)
+
+
+def _params_digest(params) -> Optional[bytes]:
+    """
+    Digest of parameters `params`, or None if the parameters can't be
+    serialized, e.g. because a dict has keys of different types.
+    """
+    try:
+        encoded = json.dumps(params, sort_keys=True, default=str)
+    except TypeError:
+        return None
+    return hashlib.sha256(encoded.encode("utf-8")).digest()
+
+
+def _key_path(prefix: str, params, keys: List) -> str:
+    """
+    Render the path of the node reached from `params` by following `keys`,
+    e.g. `prefix/key[0]/other`.
+    """
+    path = prefix
+    node = params
+    for k in keys:
+        if isinstance(node, list):
+            path += f"[{k}]"
+        else:
+            path += f"/{k}"
+        node = node[k]
+    return path
 
 
 class RefBuilder:
     """
-    Helper class to wrap recursive search for Kapitan secret references
+    Helper class to wrap the search for Kapitan secret references
     """
 
     _refs: Dict[str, SecretRef]
@@ -100,53 +194,75 @@ class RefBuilder:
         self._bootstrap_target = config.inventory.bootstrap_target
         self.inventory = inventory
         self._refs = {}
+        self._searched: Dict[str, Set[bytes]] = {}
         self._ref_params = None
 
     def _find_ref(self, key, value):
         """
-        Process leaf value of parameters structure.
-        """
-        # Only consider leaves which are of type string, other types cannot
-        # contain a secret reference.
-        if isinstance(value, str):
-            r = SecretRef.from_value(key, value)
-            if r is not None:
-                if self.debug:
-                    click.echo(f"    > Found secret ref {r.refstr} in {value}")
-                if r.refstr in self._refs:
-                    if self.trace:
-                        click.echo("    > Duplicate ref, adding key to list")
-                    self._refs[r.refstr].add_key(key)
-                else:
-                    self._refs[r.refstr] = r
-        elif self.trace:
-            click.echo(f"    > Ignoring leaf of type {type(value).__name__}...")
+        Process leaf value of parameters structure which may contain a secret
+        reference.
+        """
+        r = SecretRef.from_value(key, value)
+        if r is not None:
+            if self.debug:
+                click.echo(f"    > Found secret ref {r.refstr} in {value}")
+            if r.refstr in self._refs:
+                if self.trace:
+                    click.echo("    > Duplicate ref, adding key to list")
+                self._refs[r.refstr].add_key(key)
+            else:
+                self._refs[r.refstr] = r
 
     def _find_refs(self, prefix, params):
         """
-        Recursively search Kapitan refs, descending into dicts and lists.
+        Search Kapitan refs, descending into dicts and lists.
+
+        The parameters are traversed depth-first with an explicit stack of
+        iterators. The key path of a leaf is only rendered when the leaf
+        contains a secret reference.
         """
-        if self.trace:
-            click.echo(f" > Processing {prefix}")
-
-        if isinstance(params, dict):
-            # Recurse for dicts
-            for k, v in params.items():
-                self._find_refs(f"{prefix}/{k}", v)
-        elif isinstance(params, list):
-            # Recurse for lists
-            for idx, e in enumerate(params):
-                self._find_refs(f"{prefix}[{idx}]", e)
-        else:
-            # Otherwise, handle as leaf
-            self._find_ref(prefix, params)
+        if not isinstance(params, (dict, list)):
+            if isinstance(params, str) and "?{" in params:
+                self._find_ref(prefix, params)
+            return
+
+        stack = [_children(params)]
+        keys = []
+        while stack:
+            for k, v in stack[-1]:
+                if isinstance(v, (dict, list)):
+                    keys.append(k)
+                    stack.append(_children(v))
+                    break
+                # Only strings can contain a secret reference, skip the
+                # regex search for strings which can't contain one.
+                if isinstance(v, str) and "?{" in v:
+                    self._find_ref(_key_path(prefix, params, keys + [k]), v)
+            else:
+                stack.pop()
+                if keys:
+                    keys.pop()
 
     def find_refs(self, target: str, key: str):
         """
         Search for Kapitan secret refs in key `key` in the parameters for
         Kapitan target `target`.
+
+        Parameters which are identical to parameters already searched for the
+        same key, e.g. for targets which share a component's parameters, are
+        skipped.
         """
         params = self.inventory[target]["parameters"][key]
+        searched = self._searched.setdefault(key, set())
+        digest = _params_digest(params)
+        if digest in searched:
+            if self.trace:
+                click.echo(f" > Skipping {key} in {target}, already searched")
+            return
+        if digest is not None:
+            searched.add(digest)
+        if self.trace:
+            click.echo(f" > Processing {key} in {target}")
         self._find_refs(key, params)
 
     @property
@@ -155,24 +271,164 @@ class RefBuilder:
 
     @property
     def params(self):
+        """
+        Parameters of all secret ref backends, indexed by ref type, as
+        configured in `parameters.kapitan.secrets` of the bootstrap target.
+        """
         if self._ref_params is None:
-            kapitan_params = self.inventory[self._bootstrap_target]["parameters"][
-                "kapitan"
-            ]["secrets"]["vaultkv"]
-            self._ref_params = {
-                "vaultkv": {"key": "vault_params", "values": kapitan_params}
-            }
+            kapitan_params = self.inventory[self._bootstrap_target]["parameters"].get(
+                "kapitan", {}
+            )
+            self._ref_params = kapitan_params.get("secrets", {})
         return self._ref_params
 
 
-def update_refs(config: Config, aliases: Dict[str, str], inventory: Dict):
+def _existing_ref_files(refs_dir: P):
+    """
+    List all files in `refs_dir` relative to `refs_dir`, skipping hidden
+    files and directories.
+    """
+    for dirpath, dirnames, filenames in os.walk(refs_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for f in filenames:
+            if not f.startswith("."):
+                yield P(dirpath, f).relative_to(refs_dir)
+
+
+def _prune_empty_dirs(refs_dir: P):
+    for dirpath, _, _ in os.walk(refs_dir, topdown=False):
+        d = P(dirpath)
+        if d != refs_dir and not d.name.startswith(".") and not any(d.iterdir()):
+            d.rmdir()
+
+
+def write_refs(
+    refs_dir: P, reffiles: Dict[P, str], keep: Iterable[P] = (), debug=False
+) -> Tuple[int, int, int, int]:
+    """
+    Update the ref files in `refs_dir` to match `reffiles`, a dict of ref file
+    contents indexed by path relative to `refs_dir`. Existing ref files whose
+    path is in `keep` are left as they are.
+
+    Only new and changed ref files are written, and only ref files which are
+    not present in `reffiles` are deleted, so that unchanged ref files keep
+    their modification time. Returns the number of created, updated, deleted
+    and unchanged ref files.
+    """
+    created = updated = deleted = unchanged = 0
+
+    # Delete stale ref files first, a stale ref file may be in the way of a
+    # directory of a new ref file and vice versa.
+    keep = set(keep)
+    existing = set()
+    for reffile in _existing_ref_files(refs_dir):
+        if reffile in reffiles:
+            existing.add(reffile)
+            continue
+        if reffile in keep:
+            unchanged += 1
+            continue
+        if debug:
+            click.echo(f"    > Deleting file {refs_dir / reffile}")
+        os.unlink(refs_dir / reffile)
+        deleted += 1
+    if deleted > 0:
+        _prune_empty_dirs(refs_dir)
+
+    for reffile, contents in reffiles.items():
+        path = refs_dir / reffile
+        if reffile in existing:
+            with open(path) as f:
+                if f.read() == contents:
+                    unchanged += 1
+                    continue
+            updated += 1
+        else:
+            if path.is_dir():
+                shutil.rmtree(path)
+            created += 1
+        if debug:
+            click.echo(f"    > Writing to file {path}")
+        os.makedirs(path.parent, exist_ok=True)
+        with open(path, "w") as f:
+            f.write(contents)
+
+    return created, updated, deleted, unchanged
+
+
+def _render_refs(
+    config: Config, rb: RefBuilder, backends: RefBackends
+) -> Tuple[Dict[P, str], List[SecretRef]]:
+    """
+    Render the ref files of the refs found by `rb` in one batch per ref type.
+    Returns the contents of the ref files by path, and the refs of external
+    ref types, whose ref files aren't generated.
+    """
+    refs_by_type: Dict[str, List[SecretRef]] = {}
+    for r in rb.refs:
+        refs_by_type.setdefault(r.type, []).append(r)
+    reffiles: Dict[P, str] = {}
+    external: List[SecretRef] = []
+    for reftype, typerefs in refs_by_type.items():
+        if backends.external(reftype):
+            external.extend(typerefs)
+            continue
+        if not backends.generated(reftype):
+            raise click.ClickException(
+                f"Unsupported secret ref type '{reftype}' in "
+                + ", ".join(r.refstr for r in typerefs)
+            )
+        if config.debug:
+            for r in typerefs:
+                click.echo(f" > Creating Kapitan reffile for secret ref {r.refstr}")
+        reffiles.update(backends.render(reftype, typerefs, rb.params.get(reftype, {})))
+    return reffiles, external
+
+
+def _write_reffiles(config: Config, reffiles: Dict[P, str], external: List[SecretRef]):
+    """
+    Write the rendered ref files in `reffiles`, and remove stale ref files.
+    The ref files of the refs in `external` are kept, and a warning is shown
+    for each missing one.
+    """
+    for r in external:
+        if not (config.refs_dir / r.ref).is_file():
+            click.secho(
+                f" > [WARN] Ref file for secret ref {r.refstr} is missing, "
+                + "create it with `kapitan refs --write`",
+                fg="yellow",
+            )
+
+    created, updated, deleted, unchanged = write_refs(
+        config.refs_dir,
+        reffiles,
+        keep=[P(r.ref) for r in external],
+        debug=config.debug,
+    )
+    click.echo(
+        f" > {created} created, {updated} updated, {deleted} deleted, "
+        + f"{unchanged} unchanged"
+    )
+
+
+def update_refs(
+    config: Config,
+    aliases: Dict[str, str],
+    inventory: Dict,
+    backends: Optional[RefBackends] = None,
+):
     """
     Iterate over parameters for each target, and create Kapitan secret refs
-    for all ?{...} found as values in the dicts
+    for all ?{...} found as values in the dicts. Existing ref files are only
+    rewritten if their contents change.
+
+    The ref files are rendered with the secret ref backends in `backends`,
+    which defaults to the builtin backends.
     """
+    if backends is None:
+        backends = RefBackends()
     click.secho("Updating Kapitan secret references...", bold=True)
     os.makedirs(config.refs_dir, exist_ok=True)
-    rm_tree_contents(config.refs_dir)
 
     rb = RefBuilder(config, inventory)
 
@@ -195,9 +451,6 @@ def update_refs(config: Config, aliases: Dict[str, str], inventory: Dict):
         # Find references for component instance
         rb.find_refs(target, component_key)
 
-    ref_params = rb.params
-    # Create Kapitan references
-    for r in rb.refs:
-        if config.debug:
-            click.echo(f" > Creating Kapitan reffile for secret ref {r.refstr}")
-        r.create_kapitan_ref(config.refs_dir, ref_params, debug=config.debug)
+    # Render Kapitan references in memory, and only write changes to disk
+    reffiles, external = _render_refs(config, rb, backends)
+    _write_reffiles(config, reffiles, external)
@@ -0,0 +1,164 @@
+import errno
+import os
+import shutil
+
+from pathlib import Path as P
+from typing import Dict, Iterable, List
+
+# ioctl request to clone a file (reflink) on Linux, see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+_CHUNK_SIZE = 64 * 1024
+
+SYNC_MODES = ["copy", "reflink", "hardlink"]
+
+
+class SyncResult:
+    """
+    Paths, relative to the destination directory, which were added, modified
+    or deleted by `sync_trees()`.
+    """
+
+    def __init__(self):
+        self.added: List[P] = []
+        self.modified: List[P] = []
+        self.deleted: List[P] = []
+        self.unchanged = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.modified or self.deleted)
+
+    def __str__(self):
+        return (
+            f"{len(self.added)} added, {len(self.modified)} modified, "
+            + f"{len(self.deleted)} deleted, {self.unchanged} unchanged"
+        )
+
+
+def _list_files(basedir: P, skip_hidden: bool) -> Dict[P, P]:
+    """
+    Return all files below `basedir`, indexed by their path relative to
+    `basedir`. Symlinks are followed.
+    """
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(basedir, followlinks=True):
+        if skip_hidden:
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            filenames = [f for f in filenames if not f.startswith(".")]
+        relpath = P(dirpath).relative_to(basedir)
+        for f in filenames:
+            files[relpath / f] = P(dirpath, f)
+    return files
+
+
+def _same_contents(a: P, b: P) -> bool:
+    if os.path.getsize(a) != os.path.getsize(b):
+        return False
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            ca = fa.read(_CHUNK_SIZE)
+            if ca != fb.read(_CHUNK_SIZE):
+                return False
+            if not ca:
+                return True
+
+
+class _Copier:
+    def __init__(self, mode: str):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode {mode}")
+        self._mode = mode
+
+    def _reflink(self, src: P, dst: P) -> bool:
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            except OSError as e:
+                if e.errno not in (
+                    errno.EBADF,
+                    errno.EINVAL,
+                    errno.ENOTTY,
+                    errno.EOPNOTSUPP,
+                    errno.EXDEV,
+                ):
+                    raise
+                return False
+        shutil.copymode(src, dst)
+        return True
+
+    def copy(self, src: P, dst: P):
+        if dst.is_symlink() or dst.exists():
+            os.unlink(dst)
+        if self._mode == "hardlink":
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                # Fall back to copying, e.g. across file systems
+                self._mode = "copy"
+        if self._mode == "reflink":
+            if self._reflink(src, dst):
+                return
+            # Don't try again if the file system doesn't support reflinks
+            self._mode = "copy"
+        shutil.copyfile(src, dst)
+        shutil.copymode(src, dst)
+
+
+def _remove_empty_dirs(basedir: P):
+    for dirpath, _, _ in os.walk(basedir, topdown=False):
+        d = P(dirpath)
+        if d != basedir and not d.name.startswith(".") and not any(d.iterdir()):
+            d.rmdir()
+
+
+def sync_trees(sources: Iterable[P], dest: P, mode: str = "copy") -> SyncResult:
+    """
+    Make directory `dest` contain the merged contents of the directories in
+    `sources`. Files which are present in multiple sources are taken from the
+    last source.
+
+    Files which exist in `dest` and have the same contents as the source
+    file are left untouched, files which are missing from all sources are
+    deleted. Hidden files and directories in `dest` are never deleted.
+
+    `mode` selects how files are transferred: `copy` copies file contents,
+    `reflink` creates copy-on-write clones where the file system supports it
+    and falls back to copying otherwise, and `hardlink` hardlinks the source
+    files. Hardlinked files share their contents with the source file, only
+    use `hardlink` if the source files aren't modified in place afterwards.
+    """
+    copier = _Copier(mode)
+    wanted: Dict[P, P] = {}
+    for source in sources:
+        wanted.update(_list_files(source, skip_hidden=False))
+    existing = _list_files(dest, skip_hidden=True) if dest.is_dir() else {}
+
+    result = SyncResult()
+    # Delete stale files first, a stale file may be in the way of a
+    # directory of a new file.
+    for relpath in sorted(existing.keys() - wanted.keys()):
+        os.unlink(dest / relpath)
+        result.deleted.append(relpath)
+    if result.deleted:
+        _remove_empty_dirs(dest)
+
+    for relpath, src in sorted(wanted.items()):
+        dst = dest / relpath
+        if relpath in existing:
+            if _same_contents(src, dst):
+                result.unchanged += 1
+                continue
+            result.modified.append(relpath)
+        else:
+            if dst.is_dir() and not dst.is_symlink():
+                # A directory which only contains hidden files is in the way
+                shutil.rmtree(dst)
+            os.makedirs(dst.parent, exist_ok=True)
+            result.added.append(relpath)
+        copier.copy(src, dst)
+
+    return result
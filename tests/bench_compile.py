@@ -0,0 +1,94 @@
+"""
+Benchmark Kapitan compilation with different numbers of parallel jobs
+"""
+
+from pathlib import Path
+from textwrap import dedent
+
+import pytest
+
+from commodore.config import Config
+from commodore.helpers import kapitan_compile
+
+TARGET_COUNT = 50
+
+
+def setup_synthetic_inventory(tmp_path: Path, target_count=TARGET_COUNT):
+    """
+    Create an inventory with `target_count` targets which each render 50
+    Kubernetes objects with Jsonnet.
+    """
+    config = Config(tmp_path)
+    inv = config.inventory
+    inv.ensure_dirs()
+
+    (tmp_path / "synthetic.jsonnet").write_text(
+        dedent(
+            """
+            local kap = import 'lib/kapitan.libjsonnet';
+            local inv = kap.inventory();
+            local target = inv.parameters.kapitan.vars.target;
+
+            {
+              [target + '-' + i]: {
+                apiVersion: 'v1',
+                kind: 'ConfigMap',
+                metadata: { name: target + '-' + i, namespace: target },
+                data: { ['key-' + j]: std.md5(target + i + j) for j in std.range(0, 9) },
+              }
+              for i in std.range(0, 49)
+            }
+            """
+        )
+    )
+    with open(inv.classes_dir / "synthetic.yml", "w") as f:
+        f.write(
+            dedent(
+                """
+                parameters:
+                  kapitan:
+                    compile:
+                      - input_paths:
+                          - synthetic.jsonnet
+                        input_type: jsonnet
+                        output_path: ${kapitan:vars:target}/
+                        output_type: yaml
+                """
+            )
+        )
+
+    targets = []
+    for i in range(target_count):
+        target = f"target-{i}"
+        targets.append(target)
+        with open(inv.targets_dir / f"{target}.yml", "w") as f:
+            f.write(
+                dedent(
+                    f"""
+                    classes:
+                      - synthetic
+                    parameters:
+                      kapitan:
+                        vars:
+                          target: {target}
+                    """
+                )
+            )
+
+    return config, targets
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("jobs", [1, 2, 4, 8, 16, 32])
+def bench_kapitan_compile_jobs(benchmark, tmp_path: Path, jobs):
+    config, targets = setup_synthetic_inventory(tmp_path)
+    config.jobs = jobs
+
+    benchmark.pedantic(
+        kapitan_compile,
+        args=(config, targets),
+        kwargs={"fetch_dependencies": False},
+        rounds=3,
+    )
+    for target in targets:
+        assert (config.inventory.output_dir / target).is_dir()
@@ -0,0 +1,65 @@
+"""
+Benchmark staging changes in a large catalog repository
+"""
+
+from pathlib import Path
+
+import pytest
+
+from git import Repo
+
+from commodore import git
+
+MANIFEST_COUNT = 20000
+CHANGED_COUNT = 100
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    """
+    Create a catalog repository with `MANIFEST_COUNT` committed manifests.
+    """
+    path = tmp_path_factory.mktemp("catalog")
+    repo = Repo.init(path)
+    for i in range(MANIFEST_COUNT):
+        manifest = path / "manifests" / f"component-{i % 100}" / f"cm-{i}.yaml"
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        manifest.write_text(f"apiVersion: v1\nkind: ConfigMap\ndata:\n  key: '{i}'\n")
+    repo.git.add("--all")
+    repo.index.commit("initial")
+    return repo
+
+
+def _changed_paths():
+    return [
+        f"manifests/component-{i % 100}/cm-{i}.yaml"
+        for i in range(0, MANIFEST_COUNT, MANIFEST_COUNT // CHANGED_COUNT)
+    ]
+
+
+def _modify_catalog(repo):
+    repo.git.reset("--hard")
+    for path in _changed_paths():
+        (Path(repo.working_tree_dir) / path).write_text("kind: ConfigMap\n")
+
+
+@pytest.mark.bench
+def bench_stage_paths(benchmark, catalog):
+    diff = benchmark.pedantic(
+        git.stage_paths,
+        args=(catalog, _changed_paths(), []),
+        setup=lambda: _modify_catalog(catalog),
+        rounds=3,
+    )
+    assert len(diff) == CHANGED_COUNT
+
+
+@pytest.mark.bench
+def bench_stage_changes(benchmark, catalog):
+    diff = benchmark.pedantic(
+        git.stage_changes,
+        args=(catalog,),
+        setup=lambda: _modify_catalog(catalog),
+        rounds=3,
+    )
+    assert len(diff) == CHANGED_COUNT
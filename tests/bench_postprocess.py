@@ -0,0 +1,123 @@
+"""
+Benchmark postprocessing filters
+"""
+
+from textwrap import dedent
+
+import _jsonnet
+import pytest
+
+from commodore.config import Config
+from commodore.postprocess.builtin_filters import run_builtin_filter
+from commodore.postprocess.jsonnet import jsonnet_runner, reset_caches
+
+# Each filter accesses the inventory a few times, like a typical small filter
+FILTERS = {
+    "inventory": dedent(
+        """
+        local inv = std.native('inventory');
+        {
+          ['out-' + i]: { ns: inv().parameters.component.namespace }
+          for i in std.range(0, 4)
+        }
+        """
+    ),
+    "inventory_json": dedent(
+        """
+        local inv = std.parseJson(std.native('inventory_json')());
+        {
+          ['out-' + i]: { ns: inv.parameters.component.namespace }
+          for i in std.range(0, 4)
+        }
+        """
+    ),
+    # commodore.libjsonnet uses `inventory_json`
+    "commodore.libjsonnet": dedent(
+        """
+        local com = import 'lib/commodore.libjsonnet';
+        {
+          ['out-' + i]: { ns: com.inventory().parameters.component.namespace }
+          for i in std.range(0, 4)
+        }
+        """
+    ),
+}
+
+
+def _inventory(leaves: int):
+    """
+    Generate an inventory with roughly `leaves` parameter leaves.
+    """
+    return {
+        "classes": ["global.common", "components.component"],
+        "parameters": {
+            "component": {"namespace": "syn-component"},
+            **{
+                f"component-{i}": {
+                    f"key-{j}": {"value": f"value-{j}", "enabled": True}
+                    for j in range(50)
+                }
+                for i in range(max(1, leaves // 100))
+            },
+        },
+    }
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("leaves", [1000, 10000, 100000])
+@pytest.mark.parametrize("callback", FILTERS.keys())
+def bench_filter_inventory(benchmark, tmp_path, callback, leaves):
+    filterfile = tmp_path / "filter.jsonnet"
+    filterfile.write_text(FILTERS[callback])
+    inventory = _inventory(leaves)
+
+    benchmark.pedantic(
+        jsonnet_runner,
+        args=(
+            tmp_path,
+            inventory,
+            "component",
+            "out",
+            _jsonnet.evaluate_file,
+            filterfile,
+        ),
+        setup=reset_caches,
+        rounds=5,
+    )
+    assert (tmp_path / "compiled" / "component" / "out" / "out-0.yaml").is_file()
+
+
+def _write_chart(chart_dir, files=100, objects=50):
+    """
+    Write a rendered Helm chart with `files` files of `objects` objects each.
+    """
+    chart_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(files):
+        (chart_dir / f"template-{i}.yaml").write_text(
+            "".join(
+                "---\napiVersion: v1\nkind: ConfigMap\n"
+                + f"metadata:\n  name: cm-{i}-{j}\n  labels:\n    app: chart\n"
+                + f"data:\n  script: |\n    echo {i}\n    echo {j}\n  key: value-{j}\n"
+                for j in range(objects)
+            )
+        )
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("filterid", ["helm_namespace", "helm_namespace_jsonnet"])
+def bench_helm_namespace(benchmark, tmp_path, filterid):
+    chart_dir = tmp_path / "compiled" / "chart" / "chart"
+    config = Config(tmp_path)
+    excludes = [{"kind": "ConfigMap", "name": f"cm-0-{j}"} for j in range(50)]
+
+    def _setup():
+        _write_chart(chart_dir)
+        reset_caches()
+
+    benchmark.pedantic(
+        run_builtin_filter,
+        args=(config, {}, "chart", filterid, "chart"),
+        kwargs={"namespace": "syn-chart", "exclude_objects": excludes},
+        setup=_setup,
+        rounds=3,
+    )
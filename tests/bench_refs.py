@@ -0,0 +1,69 @@
+"""
+Benchmark the search for Kapitan secret references
+"""
+
+from pathlib import Path
+
+import pytest
+
+from commodore.config import Config
+from commodore.refs import RefBuilder
+
+TARGET_COUNT = 20
+
+
+def _component_params(target: str):
+    """
+    Generate parameters with roughly 10000 leaves, of which 1% contain a
+    secret reference.
+    """
+    return {
+        f"service-{i}": {
+            "enabled": True,
+            "replicas": i,
+            "labels": {f"label-{j}": f"value-{j}" for j in range(10)},
+            "env": [
+                {"name": f"ENV_{j}", "value": f"value-{j}"}
+                if j != 0
+                else {"name": "SECRET", "value": f"?{{vaultkv:{target}/svc-{i}}}"}
+                for j in range(40)
+            ],
+        }
+        for i in range(100)
+    }
+
+
+def setup_synthetic_inventory(target_count=TARGET_COUNT):
+    """
+    Create an inventory with `target_count` instances of a component, which
+    each have roughly 10000 parameter leaves.
+    """
+    inventory = {
+        "cluster": {
+            "parameters": {
+                "kapitan": {"secrets": {"vaultkv": {"auth": "token"}}},
+            },
+        },
+    }
+    aliases = {}
+    for i in range(target_count):
+        target = f"target-{i}"
+        aliases[target] = "synthetic"
+        inventory[target] = {"parameters": {"synthetic": _component_params(target)}}
+    return inventory, aliases
+
+
+def _find_all_refs(config, inventory, aliases):
+    rb = RefBuilder(config, inventory)
+    for target in aliases:
+        rb.find_refs(target, "synthetic")
+    return rb
+
+
+@pytest.mark.bench
+def bench_find_refs(benchmark, tmp_path: Path):
+    config = Config(tmp_path)
+    inventory, aliases = setup_synthetic_inventory()
+
+    rb = benchmark(_find_all_refs, config, inventory, aliases)
+    assert len(list(rb.refs)) == TARGET_COUNT * 100
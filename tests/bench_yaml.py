@@ -0,0 +1,71 @@
+"""
+Benchmark YAML I/O with libyaml and the pure-Python implementation
+"""
+
+import pytest
+import yaml
+
+from commodore import helpers
+
+FILE_SIZE = 50 * 1024 * 1024
+
+
+def _manifest(i: int):
+    return {
+        "apiVersion": "v1",
+        "kind": "ConfigMap",
+        "metadata": {
+            "name": f"config-{i}",
+            "namespace": "syn-bench",
+            "labels": {f"label-{j}": f"value-{j}" for j in range(5)},
+        },
+        "data": {
+            f"key-{j}": f"line {j}\nof a multi-line value\n" * 3 for j in range(10)
+        },
+    }
+
+
+@pytest.fixture(scope="module")
+def manifests(tmp_path_factory):
+    """
+    Write a multi-document YAML file of roughly `FILE_SIZE` bytes, and return
+    its path and documents.
+    """
+    single = len(helpers.yaml_dumps(_manifest(0))) + len("---\n")
+    docs = [_manifest(i) for i in range(FILE_SIZE // single)]
+    path = tmp_path_factory.mktemp("yaml") / "manifests.yaml"
+    helpers.yaml_dump_all(docs, path)
+    return path, docs
+
+
+def _load_all(path, loader):
+    with open(path) as f:
+        return list(yaml.load_all(f, Loader=loader))
+
+
+def _dump_all(docs, path, dumper):
+    with open(path, "w") as f:
+        yaml.dump_all(docs, f, Dumper=dumper)
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("backend", ["libyaml", "python"])
+def bench_yaml_load_all(benchmark, manifests, backend):
+    path, docs = manifests
+    if backend == "libyaml" and not yaml.__with_libyaml__:
+        pytest.skip("PyYAML is built without libyaml")
+    loader = helpers._YamlLoader if backend == "libyaml" else helpers._PyYamlLoader
+    loaded = benchmark.pedantic(_load_all, args=(path, loader), rounds=1)
+    assert len(loaded) == len(docs)
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("backend", ["libyaml", "python"])
+def bench_yaml_dump_all(benchmark, manifests, tmp_path, backend):
+    path, docs = manifests
+    if backend == "libyaml" and not yaml.__with_libyaml__:
+        pytest.skip("PyYAML is built without libyaml")
+    dumper = helpers._YamlDumper if backend == "libyaml" else helpers._PyYamlDumper
+    output = tmp_path / "manifests.yaml"
+    benchmark.pedantic(_dump_all, args=(docs, output, dumper), rounds=1)
+    assert output.read_text() == path.read_text()
@@ -42,7 +42,7 @@ class Repo:
         return rev
 
 
-def clone_repository(url, directory, cfg):
+def clone_repository(url, directory, cfg, use_cache=False):
     return Repo(url, directory, cfg)
 
 
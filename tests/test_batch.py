@@ -0,0 +1,133 @@
+"""
+Unit-tests for batch compilation of multiple clusters
+"""
+
+from pathlib import Path
+from unittest.mock import patch
+
+import click
+import pytest
+
+from commodore import batch
+from commodore.cluster import Cluster
+from commodore.config import Config
+
+
+@pytest.fixture
+def config(tmp_path: Path):
+    return Config(
+        tmp_path,
+        api_url="https://syn.example.com",
+        api_token="token",
+    )
+
+
+@patch("commodore.lieutenant.LieutenantClient.query")
+def test_clusters_from_api(patch_query, config: Config):
+    clusters = [
+        {"id": "c-one", "tenant": "t-foo"},
+        {"id": "c-two", "tenant": "t-bar"},
+        {"id": "c-three", "tenant": "t-foo"},
+    ]
+    tenants = [{"id": "t-foo"}, {"id": "t-bar"}]
+    patch_query.side_effect = lambda endpoint, api_id="": (
+        clusters if endpoint == "clusters" else tenants
+    )
+
+    assert list(batch.clusters_from_api(config)) == ["c-one", "c-two", "c-three"]
+    specs = batch.clusters_from_api(config, tenant="t-foo")
+    assert list(specs) == ["c-one", "c-three"]
+    assert specs["c-three"].tenant_id == "t-foo"
+
+
+def _fake_compile(config: Config, cluster_id: str, cluster=None):
+    click.echo(f"Compiling {cluster_id} in {config.work_dir}")
+    assert cluster is None or cluster.id == cluster_id
+    assert Path.cwd() == config.work_dir
+    assert config.cache_max_size is None
+    assert config._lieutenant is None
+    if cluster_id == "c-broken":
+        raise click.ClickException("Cluster is broken")
+
+
+def _fake_load_clusters(config: Config, cluster_ids):
+    return {
+        cid: Cluster({"id": cid, "tenant": "t-foo"}, {"id": "t-foo"})
+        for cid in cluster_ids
+        if cid != "c-unknown"
+    }
+
+
+@patch("commodore.batch.load_clusters_from_api")
+@patch("commodore.batch.compile_cluster", new=_fake_compile)
+def test_compile_many(patch_load, config: Config, capsys):
+    patch_load.side_effect = _fake_load_clusters
+    clusters = ["c-one", "c-two", "c-three", "c-one", "c-unknown"]
+    config.cache_max_size = 1024
+    # The workers don't inherit the parent's API client
+    assert config.lieutenant is not None
+
+    batch.compile_many(config, clusters, 2)
+
+    stdout, _ = capsys.readouterr()
+    assert "Compiled 4 of 4 cluster(s)" in stdout
+    # Cluster specifications are fetched once for the whole batch
+    patch_load.assert_called_once_with(
+        config, ["c-one", "c-two", "c-three", "c-unknown"]
+    )
+    for cluster_id in ["c-one", "c-two", "c-three", "c-unknown"]:
+        work_dir = config.work_dir / cluster_id
+        log = (work_dir / batch.LOG_FILE).read_text()
+        assert log == f"Compiling {cluster_id} in {work_dir}\n"
+        assert f" > {cluster_id}: compiled" in stdout
+    assert config.cache_dir == config.work_dir / ".cache"
+
+
+@patch("commodore.batch.load_clusters_from_api", new=_fake_load_clusters)
+@patch("commodore.batch.compile_cluster", new=_fake_compile)
+def test_compile_many_failure(config: Config, capsys):
+    with pytest.raises(click.ClickException) as e:
+        batch.compile_many(config, ["c-one", "c-broken"], 1)
+
+    assert "Compilation failed for 1 of 2 cluster(s)" in str(e.value)
+    stdout, _ = capsys.readouterr()
+    log_file = config.work_dir / "c-broken" / batch.LOG_FILE
+    assert " > c-broken: failed" in stdout
+    assert str(log_file) in stdout
+    assert "Error: Cluster is broken" in log_file.read_text()
+
+
+def _fake_compile_jobs(config: Config, cluster_id: str, cluster=None):
+    click.echo(f"jobs={config.jobs}")
+
+
+@pytest.mark.parametrize("jobs,expected", [(None, 3), (5, 5)])
+@patch("commodore.batch.usable_cpu_count", new=lambda: 6)
+@patch("commodore.batch.load_clusters_from_api", new=_fake_load_clusters)
+@patch("commodore.batch.compile_cluster", new=_fake_compile_jobs)
+def test_compile_many_jobs(config: Config, jobs, expected):
+    config.jobs = jobs
+
+    batch.compile_many(config, ["c-one", "c-two", "c-three"], 2)
+
+    log = (config.work_dir / "c-one" / batch.LOG_FILE).read_text()
+    assert log == f"jobs={expected}\n"
+
+
+@patch("commodore.batch.load_clusters_from_api")
+@patch("commodore.batch.compile_cluster", new=_fake_compile)
+def test_compile_many_prefetched(patch_load, config: Config, capsys):
+    specs = _fake_load_clusters(config, ["c-one", "c-two"])
+
+    batch.compile_many(config, list(specs), 2, clusters=specs)
+
+    stdout, _ = capsys.readouterr()
+    assert "Compiled 2 of 2 cluster(s)" in stdout
+    patch_load.assert_not_called()
+
+
+def test_compile_many_no_clusters(config: Config):
+    with pytest.raises(click.ClickException) as e:
+        batch.compile_many(config, [], 1)
+
+    assert "No clusters to compile" in str(e.value)
@@ -0,0 +1,77 @@
+"""
+Unit-tests for atomic compilation
+"""
+
+from pathlib import Path
+
+from commodore.build import AtomicBuild, BUILD_MARKER
+from commodore.config import Config
+
+
+def _write(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _setup(tmp_path: Path):
+    config = Config(tmp_path)
+    output = config.inventory.output_dir
+    _write(output / "a" / "manifest.yaml", "good")
+    return AtomicBuild(config), output
+
+
+def test_build_finish(tmp_path: Path):
+    build, output = _setup(tmp_path)
+
+    build.begin()
+    assert build.in_progress()
+    assert not (output / "a").exists()
+    assert (build.previous_dir / "a" / "manifest.yaml").read_text() == "good"
+
+    _write(output / "a" / "manifest.yaml", "new")
+    build.finish()
+    assert not build.in_progress()
+    assert (output / "a" / "manifest.yaml").read_text() == "new"
+    assert (build.previous_dir / "a" / "manifest.yaml").read_text() == "good"
+
+
+def test_build_abort(tmp_path: Path):
+    build, output = _setup(tmp_path)
+
+    build.begin()
+    _write(output / "a" / "manifest.yaml", "partial")
+    build.abort()
+    assert not build.in_progress()
+    assert (output / "a" / "manifest.yaml").read_text() == "good"
+    assert not build.previous_dir.exists()
+
+
+def test_build_reuse(tmp_path: Path):
+    build, output = _setup(tmp_path)
+
+    build.begin(reuse=True)
+    assert (output / "a" / "manifest.yaml").samefile(
+        build.previous_dir / "a" / "manifest.yaml"
+    )
+    assert (output / BUILD_MARKER).is_file()
+
+
+def test_build_interrupted(tmp_path: Path):
+    build, output = _setup(tmp_path)
+    build.begin()
+    _write(output / "a" / "manifest.yaml", "partial")
+
+    # Start a new compilation without finishing or aborting the previous one
+    build.begin()
+    assert (build.previous_dir / "a" / "manifest.yaml").read_text() == "good"
+    assert not (output / "a").exists()
+
+
+def test_build_first_compilation(tmp_path: Path):
+    build = AtomicBuild(Config(tmp_path))
+
+    build.begin(reuse=True)
+    assert build.in_progress()
+    build.abort()
+    assert not build.output_dir.exists()
+    assert not build.previous_dir.exists()
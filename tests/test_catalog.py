@@ -2,7 +2,17 @@
 Tests for catalog internals
 """
 
-from commodore.catalog import _render_catalog_commit_msg
+import click
+import pytest
+
+from git import Repo
+
+from commodore import git
+from commodore.catalog import (
+    _print_changes,
+    _render_catalog_commit_msg,
+    update_catalog,
+)
 from commodore.config import Config
 
 
@@ -16,3 +26,90 @@ def test_catalog_commit_message(tmp_path):
     commit_message = _render_catalog_commit_msg(config)
     assert not commit_message.startswith("\n")
     assert commit_message.startswith("Automated catalog update from Commodore\n\n")
+
+
+def _catalog_with_changes(tmp_path):
+    repo = Repo.init(tmp_path / "catalog")
+    manifests = tmp_path / "catalog" / "manifests"
+    manifests.mkdir()
+    (manifests / "cm.yaml").write_text("data:\n  key: old\n")
+    repo.index.add(["manifests/cm.yaml"])
+    repo.index.commit("initial")
+    (manifests / "cm.yaml").write_text("data:\n  key: new\n")
+    (manifests / "new.yaml").write_text("kind: ConfigMap\n")
+    return repo, git.stage_changes(repo)
+
+
+@pytest.mark.parametrize(
+    "diff_mode,interactive,expected,unexpected",
+    [
+        ("none", False, [" > Changes: 2 file(s) changed"], ["+  key: new"]),
+        (
+            "stat",
+            False,
+            [" manifests/cm.yaml  | 2 +-", " 2 files changed"],
+            ["+  key: new"],
+        ),
+        ("full", False, ["Added file manifests/new.yaml", "+  key: new"], []),
+        ("none", True, ["Added file manifests/new.yaml", "+  key: new"], []),
+    ],
+)
+def test_print_changes(tmp_path, capsys, diff_mode, interactive, expected, unexpected):
+    config = Config(tmp_path)
+    config.diff_mode = diff_mode
+    config.interactive = interactive
+    config.push = True
+    repo, diff = _catalog_with_changes(tmp_path)
+
+    _print_changes(config, repo, diff)
+
+    stdout = click.unstyle(capsys.readouterr().out)
+    for line in expected:
+        assert line in stdout
+    for line in unexpected:
+        assert line not in stdout
+
+
+def _compiled_output(config: Config, files):
+    for path, content in files.items():
+        f = config.inventory.output_dir / path
+        f.parent.mkdir(parents=True, exist_ok=True)
+        f.write_text(content)
+
+
+@pytest.mark.parametrize("local", [False, True])
+def test_update_catalog(tmp_path, capsys, local):
+    config = Config(tmp_path)
+    config.local = local
+    config.diff_mode = "stat"
+    repo = Repo.init(tmp_path / "catalog")
+    manifests = tmp_path / "catalog" / "manifests"
+    manifests.mkdir()
+    (manifests / "unchanged.yaml").write_text("kind: Namespace\n")
+    (manifests / "stale.yaml").write_text("kind: ConfigMap\n")
+    repo.index.add(["manifests/unchanged.yaml", "manifests/stale.yaml"])
+    repo.index.commit("initial")
+    (tmp_path / "catalog" / "refs").mkdir()
+    (tmp_path / "catalog" / "refs" / "secret").write_text("ref\n")
+    _compiled_output(
+        config,
+        {
+            "target-a/unchanged.yaml": "kind: Namespace\n",
+            "target-b/b/new.yaml": "kind: Secret\n",
+        },
+    )
+
+    update_catalog(config, ["target-a", "target-b"], repo)
+
+    stdout = click.unstyle(capsys.readouterr().out)
+    assert "3 files changed, 2 insertions(+), 1 deletion(-)" in stdout
+    if local:
+        # Changes are unstaged in local mode, and must be shown again by the
+        # next compilation.
+        assert repo.index.diff("HEAD") == []
+        update_catalog(config, ["target-a", "target-b"], repo)
+        stdout = click.unstyle(capsys.readouterr().out)
+        assert "3 files changed, 2 insertions(+), 1 deletion(-)" in stdout
+    else:
+        staged = sorted(d.a_path for d in repo.index.diff("HEAD"))
+        assert staged == ["manifests/b/new.yaml", "manifests/stale.yaml", "refs/secret"]
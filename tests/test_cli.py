@@ -36,6 +36,14 @@ def test_compile_command():
     assert exit_status == 0
 
 
+def test_compile_many_command():
+    """
+    Is subcommand available?
+    """
+    exit_status = call("commodore catalog compile-many --help", shell=True)
+    assert exit_status == 0
+
+
 def test_component_new_command():
     """
     Is subcommand available?
@@ -7,8 +7,10 @@ from unittest.mock import patch
 import pytest
 
 from commodore import compile
-from commodore.cluster import Cluster
+from commodore.catalog import catalog_list
+from commodore.cluster import Cluster, load_clusters_from_api
 from commodore.config import Config
+from commodore.lieutenant import ApiError
 
 
 @pytest.fixture
@@ -33,7 +35,7 @@ def lieutenant_query(api_url, api_token, api_endpoint, api_id):
     raise click.ClickException(f"call to unexpected API endpoint '#{api_endpoint}'")
 
 
-@patch("commodore.cluster.lieutenant_query")
+@patch("commodore.lieutenant.LieutenantClient.query")
 def test_no_tenant_reference(test_patch, tmp_path):
     customer_id = "t-wild-fire-234"
     config = Config(
@@ -41,12 +43,131 @@ def test_no_tenant_reference(test_patch, tmp_path):
         api_url="https://syn.example.com",
         api_token="token",
     )
-    test_patch.side_effect = lieutenant_query
+    test_patch.side_effect = lambda endpoint, api_id="": lieutenant_query(
+        config.api_url, config.api_token, endpoint, api_id
+    )
     with pytest.raises(click.ClickException) as err:
         compile.load_cluster_from_api(config, customer_id)
     assert "cluster does not have a tenant reference" in str(err)
 
 
+def _bulk_api(clusters, tenants):
+    def query(endpoint, api_id=""):
+        if endpoint == "clusters" and api_id == "":
+            return clusters
+        if endpoint == "tenants" and api_id == "":
+            return tenants
+        if endpoint == "tenants":
+            return {"id": api_id, "displayName": f"Tenant {api_id}"}
+        raise click.ClickException(f"call to unexpected API endpoint '{endpoint}'")
+
+    return query
+
+
+@pytest.fixture
+def bulk_data():
+    clusters = [
+        {"id": "c-one", "tenant": "t-foo", "displayName": "One"},
+        {"id": "c-two", "tenant": "t-bar", "displayName": "Two"},
+        {"id": "c-three", "tenant": "t-foo", "displayName": "Three"},
+        {"id": "c-four", "tenant": "t-unlisted", "displayName": "Four"},
+    ]
+    tenants = [
+        {"id": "t-foo", "displayName": "Foo Inc."},
+        {"id": "t-bar", "displayName": "Bar Inc."},
+    ]
+    return clusters, tenants
+
+
+@patch("commodore.lieutenant.LieutenantClient.query")
+def test_load_clusters_from_api(test_patch, tmp_path, bulk_data):
+    config = Config(tmp_path, api_url="https://syn.example.com", api_token="token")
+    test_patch.side_effect = _bulk_api(*bulk_data)
+
+    clusters = load_clusters_from_api(config)
+
+    assert list(clusters.keys()) == ["c-one", "c-two", "c-three", "c-four"]
+    assert clusters["c-three"].tenant_display_name == "Foo Inc."
+    assert clusters["c-two"].tenant_display_name == "Bar Inc."
+    assert clusters["c-four"].tenant_display_name == "Tenant t-unlisted"
+    # Clusters and tenants are listed once, only the unlisted tenant is
+    # fetched individually.
+    assert [c.args for c in test_patch.call_args_list] == [
+        ("clusters",),
+        ("tenants",),
+        ("tenants", "t-unlisted"),
+    ]
+
+
+@patch("commodore.lieutenant.LieutenantClient.query")
+def test_load_clusters_from_api_subset(test_patch, tmp_path, bulk_data):
+    config = Config(tmp_path, api_url="https://syn.example.com", api_token="token")
+    test_patch.side_effect = _bulk_api(*bulk_data)
+
+    clusters = load_clusters_from_api(config, ["c-two", "c-missing"])
+    assert list(clusters.keys()) == ["c-two"]
+
+    test_patch.reset_mock()
+    assert load_clusters_from_api(config, ["c-missing"]) == {}
+    assert [c.args for c in test_patch.call_args_list] == [("clusters",)]
+
+
+@patch("commodore.lieutenant.LieutenantClient.query")
+def test_load_clusters_from_api_tenant(test_patch, tmp_path, bulk_data):
+    config = Config(tmp_path, api_url="https://syn.example.com", api_token="token")
+    test_patch.side_effect = _bulk_api(*bulk_data)
+
+    clusters = load_clusters_from_api(config, tenant="t-foo")
+    assert list(clusters.keys()) == ["c-one", "c-three"]
+
+
+@patch("commodore.lieutenant.LieutenantClient.query")
+def test_load_clusters_from_api_skip_broken(test_patch, tmp_path, bulk_data, capsys):
+    config = Config(tmp_path, api_url="https://syn.example.com", api_token="token")
+    clusters, tenants = bulk_data
+    clusters.append({"id": "c-no-tenant", "displayName": "No tenant"})
+    clusters.append({"id": "c-gone", "tenant": "t-gone", "displayName": "Gone"})
+    query = _bulk_api(clusters, tenants)
+
+    def _query(endpoint, api_id=""):
+        if endpoint == "tenants" and api_id == "t-gone":
+            raise ApiError("API returned 404: Not Found")
+        return query(endpoint, api_id)
+
+    test_patch.side_effect = _query
+
+    result = load_clusters_from_api(config)
+
+    # Broken clusters are reported and skipped, the other clusters are loaded
+    assert list(result.keys()) == ["c-one", "c-two", "c-three", "c-four"]
+    _, stderr = capsys.readouterr()
+    assert (
+        "Skipping cluster 'c-no-tenant': cluster does not have a tenant reference"
+        in stderr
+    )
+    assert (
+        "Skipping cluster 'c-gone': while fetching tenant 't-gone': "
+        + "API returned 404: Not Found"
+        in stderr
+    )
+
+
+@patch("commodore.lieutenant.LieutenantClient.query")
+def test_catalog_list(test_patch, tmp_path, bulk_data, capsys):
+    config = Config(tmp_path, api_url="https://syn.example.com", api_token="token")
+    test_patch.side_effect = _bulk_api(*bulk_data)
+
+    catalog_list(config)
+    stdout, _ = capsys.readouterr()
+    assert stdout == "c-one\nc-two\nc-three\nc-four\n"
+
+    config.update_verbosity(1)
+    catalog_list(config)
+    stdout, _ = capsys.readouterr()
+    assert "c-one - One (Foo Inc.)\n" in stdout
+    assert "c-four - Four (Tenant t-unlisted)\n" in stdout
+
+
 def test_cluster_global_git_repo_url(data):
     cluster = Cluster(data["cluster"], data["tenant"])
     with pytest.raises(click.ClickException) as err:
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 
 from pathlib import Path as P
@@ -91,14 +93,12 @@ def assert_result(cluster, repo, repourl, revision, override_revision):
 @patch.object(compile, "git", new=mock_git)
 @pytest.mark.parametrize("revision", [None, "ref"])
 @pytest.mark.parametrize("override_revision", [None, "oref"])
-def test_fetch_global_config(tmp_path: P, config, revision, override_revision):
+def test_clone_global_config(tmp_path: P, config, revision, override_revision):
     # Set revision values
     cluster = setup_cluster(globalrev=revision)
     config.global_repo_revision_override = override_revision
 
-    compile._fetch_global_config(config, cluster)
-
-    repo = config.get_configs()["global"]
+    repo = compile._clone_global_config(config, cluster)
 
     assert_result(
         cluster, repo, cluster.global_git_repo_url, revision, override_revision
@@ -108,13 +108,36 @@ def test_fetch_global_config(tmp_path: P, config, revision, override_revision):
 @patch.object(compile, "git", new=mock_git)
 @pytest.mark.parametrize("revision", [None, "ref"])
 @pytest.mark.parametrize("override_revision", [None, "oref"])
-def test_fetch_customer_config(tmp_path: P, config, revision, override_revision):
+def test_clone_customer_config(tmp_path: P, config, revision, override_revision):
     # Set revision values
     cluster = setup_cluster(tenantrev=revision)
     config.tenant_repo_revision_override = override_revision
 
-    compile._fetch_customer_config(config, cluster)
-
-    repo = config.get_configs()["customer"]
+    repo = compile._clone_customer_config(config, cluster)
 
     assert_result(cluster, repo, cluster.config_repo_url, revision, override_revision)
+
+
+@patch.object(compile, "git", new=mock_git)
+@patch.object(compile, "load_cluster_from_api")
+@patch.object(compile, "fetch_components")
+@patch.object(compile, "fetch_customer_catalog")
+def test_regular_setup(patch_catalog, patch_components, patch_cluster, config):
+    patch_cluster.return_value = setup_cluster(globalrev="ref", tenantrev="ref")
+    components_fetched = threading.Event()
+
+    def fetch_customer_catalog(cfg, cluster):
+        # The catalog is cloned concurrently with fetching the components
+        assert components_fetched.wait(timeout=10)
+        return "catalog-repo"
+
+    def fetch_components(cfg):
+        assert list(cfg.get_configs().keys()) == ["global", "customer"]
+        components_fetched.set()
+
+    patch_catalog.side_effect = fetch_customer_catalog
+    patch_components.side_effect = fetch_components
+
+    assert compile._regular_setup(config, "c-cluster") == "catalog-repo"
+    assert config.inventory.params_file.is_file()
+    assert config.inventory.target_file("cluster").is_file()
@@ -12,6 +12,7 @@ from commodore.component import (
     RefError,
     component_parameters_key,
 )
+from commodore.git import CloneOptions
 from commodore.inventory import Inventory
 
 
@@ -266,9 +267,7 @@ def _setup_render_jsonnetfile_json(tmp_path: P) -> Component:
     c = Component("kube-monitoring", directory=tmp_path)
     jsonnetfile = tmp_path / "jsonnetfile.jsonnet"
     with open(jsonnetfile, "w") as jf:
-        jf.write(
-            dedent(
-                """
+        jf.write(dedent("""
             {
                version: 1,
                dependencies: [
@@ -283,9 +282,7 @@ def _setup_render_jsonnetfile_json(tmp_path: P) -> Component:
                     },
                ],
                legacyImports: true,
-            }"""
-            )
-        )
+            }"""))
     c.repo.index.add("*")
     c.repo.index.commit("Initial commit")
     return c
@@ -345,3 +342,37 @@ def test_render_jsonnetfile_json_warning(tmp_path: P, capsys):
 )
 def test_component_parameters_key(name: str, key: str):
     assert component_parameters_key(name) == key
+
+
+def _setup_upstream_history(tmp_path: P):
+    upstream = Repo.init(tmp_path / "upstream")
+    commits = []
+    for i in range(3):
+        testf = P(upstream.working_tree_dir) / "test.txt"
+        testf.write_text(f"{i}\n")
+        upstream.index.add(["test.txt"])
+        commits.append(upstream.index.commit(f"commit {i}"))
+    upstream.create_head("feature", commit=commits[1])
+    return f"file://{upstream.working_tree_dir}", commits
+
+
+def test_component_checkout_shallow_sha1version(tmp_path: P):
+    url, commits = _setup_upstream_history(tmp_path)
+    c = _setup_component(tmp_path, version=commits[0].hexsha, repo_url=url)
+
+    c.checkout(clone_options=CloneOptions(depth=1))
+
+    assert c.repo.head.commit.hexsha == commits[0].hexsha
+    assert (P(c.repo.git_dir) / "shallow").is_file()
+
+
+@pytest.mark.parametrize("version,expected", [(None, 2), ("feature", 1)])
+def test_component_checkout_single_branch(tmp_path: P, version, expected):
+    url, commits = _setup_upstream_history(tmp_path)
+    c = _setup_component(tmp_path, version=version, repo_url=url)
+
+    c.checkout(clone_options=CloneOptions(depth=1, single_branch=True))
+
+    assert c.repo.head.commit.hexsha == commits[expected].hexsha
+    assert c.repo.head.is_detached
+    assert (P(c.repo.git_dir) / "shallow").is_file()
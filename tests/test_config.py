@@ -4,7 +4,9 @@ from pathlib import Path as P
 
 import click
 
-from commodore.config import Config
+from unittest.mock import patch
+
+from commodore.config import Config, usable_cpu_count
 
 
 @pytest.fixture
@@ -152,3 +154,24 @@ def test_print_deprecation_notices(config, capsys):
         )
         == captured.out
     )
+
+
+def test_jobs_default(config):
+    assert config.jobs == usable_cpu_count()
+
+    config.jobs = 3
+    assert config.jobs == 3
+
+
+@patch("os.sched_getaffinity", create=True)
+def test_usable_cpu_count_affinity(patch_affinity):
+    patch_affinity.return_value = {0, 2, 5}
+    assert usable_cpu_count() == 3
+
+
+@patch("os.cpu_count")
+@patch("os.sched_getaffinity", create=True)
+def test_usable_cpu_count_fallback(patch_affinity, patch_cpu_count):
+    patch_affinity.side_effect = AttributeError()
+    patch_cpu_count.return_value = None
+    assert usable_cpu_count() == 1
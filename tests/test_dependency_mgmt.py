@@ -38,6 +38,19 @@ def test_symlink(tmp_path: Path):
     assert test_file.is_symlink()
 
 
+def test_symlink_unchanged(tmp_path: Path):
+    test_file = tmp_path / "test1"
+    test_file.touch()
+    (tmp_path / "links").mkdir()
+    relsymlink(test_file, tmp_path / "links")
+    link = tmp_path / "links" / "test1"
+    ino = os.lstat(link).st_ino
+
+    relsymlink(test_file, tmp_path / "links")
+
+    assert os.lstat(link).st_ino == ino
+
+
 def test_override_symlink(tmp_path: Path):
     test_file = tmp_path / "test2"
     test_file.touch()
@@ -271,6 +284,43 @@ def test_fetch_components_is_minimal(
         assert not (tmp_path / "dependencies" / component).exists()
 
 
+@patch("commodore.dependency_mgmt._read_components")
+@patch("commodore.dependency_mgmt._discover_components")
+def test_fetch_components_reports_all_errors(
+    patch_discover, patch_read, data: Config, tmp_path: Path
+):
+    components = ["component-one", "component-two", "component-three"]
+    patch_discover.return_value = (components, {})
+    urls, versions = setup_components_upstream(tmp_path, components)
+    versions["component-one"] = "does-not-exist"
+    versions["component-three"] = "does-not-exist"
+    patch_read.return_value = (urls, versions)
+
+    with pytest.raises(click.ClickException) as e:
+        dependency_mgmt.fetch_components(data)
+
+    assert "Failed to fetch 2 component(s)" in e.value.message
+    assert " > component-one: " in e.value.message
+    assert " > component-three: " in e.value.message
+    assert "component-two" not in e.value.message
+    assert data.get_components() == {}
+
+
+@patch("commodore.dependency_mgmt._read_components")
+@patch("commodore.dependency_mgmt._discover_components")
+def test_fetch_components_registration_order(
+    patch_discover, patch_read, data: Config, tmp_path: Path
+):
+    components = [f"component-{i}" for i in range(6)]
+    patch_discover.return_value = (components, {})
+    patch_read.return_value = setup_components_upstream(tmp_path, components)
+    data.fetch_jobs = 3
+
+    dependency_mgmt.fetch_components(data)
+
+    assert list(data.get_components().keys()) == components
+
+
 def test_write_jsonnetfile(data: Config, tmp_path: Path):
     data.register_component(Component("test-component", work_dir=tmp_path))
     data.register_component(Component("test-component-2", work_dir=tmp_path))
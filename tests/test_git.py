@@ -2,10 +2,14 @@
 Unit-tests for git
 """
 
+import io
+import shutil
+
 import click
 import pytest
 
 from commodore import git
+from commodore.config import Config
 from git import Repo
 from pathlib import Path
 
@@ -30,3 +34,256 @@ def test_update_remote(tmp_path: Path):
     with pytest.raises(click.ClickException):
         git.update_remote(repo, new_url)
     assert repo.remotes.origin.url == new_url
+
+
+def _setup_upstream(tmp_path: Path):
+    upstream = Repo.init(tmp_path / "upstream")
+    commits = []
+    for i in range(3):
+        testf = Path(upstream.working_tree_dir) / "test.txt"
+        testf.write_text(f"{i}\n")
+        upstream.index.add(["test.txt"])
+        commits.append(upstream.index.commit(f"commit {i}"))
+    upstream.create_head("feature", commit=commits[1])
+    return f"file://{upstream.working_tree_dir}", commits
+
+
+def test_clone_shallow_checkout_old_revision(tmp_path: Path):
+    url, commits = _setup_upstream(tmp_path)
+    cfg = Config(tmp_path)
+    cfg.clone_options = git.CloneOptions(depth=1)
+
+    repo = git.clone_repository(url, tmp_path / "clone", cfg)
+    assert (Path(repo.git_dir) / "shallow").is_file()
+    assert repo.head.commit == commits[2]
+
+    git.checkout_version(repo, commits[0].hexsha)
+    assert repo.head.commit.hexsha == commits[0].hexsha
+
+
+def test_clone_shallow_checkout_abbreviated_revision(tmp_path: Path):
+    url, commits = _setup_upstream(tmp_path)
+    cfg = Config(tmp_path)
+    cfg.clone_options = git.CloneOptions(depth=1)
+
+    repo = git.clone_repository(url, tmp_path / "clone", cfg)
+    git.checkout_version(repo, commits[0].hexsha[:8])
+    assert repo.head.commit.hexsha == commits[0].hexsha
+
+
+def test_clone_single_branch_checkout_branch(tmp_path: Path):
+    url, commits = _setup_upstream(tmp_path)
+    cfg = Config(tmp_path)
+    cfg.clone_options = git.CloneOptions(single_branch=True)
+
+    repo = git.clone_repository(url, tmp_path / "clone", cfg)
+    assert "origin/feature" not in [r.name for r in repo.remote().refs]
+
+    git.checkout_version(repo, "feature")
+    assert repo.head.commit.hexsha == commits[1].hexsha
+
+
+def test_checkout_version_missing_revision(tmp_path: Path):
+    url, _ = _setup_upstream(tmp_path)
+    cfg = Config(tmp_path)
+    cfg.clone_options = git.CloneOptions(depth=1)
+
+    repo = git.clone_repository(url, tmp_path / "clone", cfg)
+    with pytest.raises(git.RefError) as e:
+        git.checkout_version(repo, "does-not-exist")
+    assert "Revision 'does-not-exist' not found in repository" in str(e.value)
+
+
+def test_clone_repository_from_cache(tmp_path: Path):
+    url, commits = _setup_upstream(tmp_path)
+    cfg = Config(tmp_path)
+    cfg.cache_dir = tmp_path / "cache"
+
+    repo = git.clone_repository(url, tmp_path / "clone", cfg, use_cache=True)
+
+    assert repo.head.commit == commits[2]
+    assert repo.remote().url == url
+    alternates = Path(repo.git_dir) / "objects" / "info" / "alternates"
+    assert not alternates.exists()
+    # The clone doesn't depend on the mirror
+    shutil.rmtree(cfg.repo_cache.mirror_dir(url))
+    git.checkout_version(repo, "feature")
+    assert repo.head.commit == commits[1]
+
+
+def _setup_catalog(tmp_path: Path, files):
+    repo = Repo.init(tmp_path / "catalog")
+    for name, content in files.items():
+        (tmp_path / "catalog" / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "catalog" / name).write_text(content)
+    repo.index.add(list(files.keys()))
+    repo.index.commit("initial")
+    return repo
+
+
+def test_stage_all(tmp_path: Path):
+    repo = _setup_catalog(
+        tmp_path,
+        {"modified.txt": "a\nb\nc\n", "deleted.txt": "x\n", "renamed.txt": "r\n" * 10},
+    )
+    workdir = tmp_path / "catalog"
+    (workdir / "modified.txt").write_text("a\nB\nc\n")
+    (workdir / "deleted.txt").unlink()
+    (workdir / "added.txt").write_text("new\n")
+    (workdir / "renamed.txt").rename(workdir / "moved.txt")
+
+    difftext, changed = git.stage_all(repo)
+
+    assert changed
+    lines = click.unstyle(difftext).split("\n")
+    assert "Added file added.txt" in lines
+    assert "Deleted file deleted.txt" in lines
+    assert "Renamed file renamed.txt => moved.txt" in lines
+    assert "--- modified.txt" in lines
+    assert "+++ modified.txt" in lines
+    assert "-b" in lines
+    assert "+B" in lines
+
+
+def test_stage_all_no_changes(tmp_path: Path):
+    repo = _setup_catalog(tmp_path, {"file.txt": "a\n"})
+    assert git.stage_all(repo) == ("", False)
+
+
+def test_render_diff_large_file(tmp_path: Path, monkeypatch):
+    content = "".join(f"line {i}\n" for i in range(100))
+    repo = _setup_catalog(tmp_path, {"large.txt": content})
+    (tmp_path / "catalog" / "large.txt").write_text(
+        content.replace("line 50\n", "changed\n")
+    )
+    diff = git.stage_changes(repo)
+    expected = list(git.render_diff(repo, diff))
+
+    # Diffs computed by Git are rendered like diffs computed by difflib
+    monkeypatch.setattr(git, "LARGE_FILE_SIZE", 10)
+    assert list(git.render_diff(repo, diff)) == expected
+    lines = click.unstyle(expected[0]).split("\n")
+    assert lines[:2] == ["--- large.txt", "+++ large.txt"]
+    assert "-line 50" in lines
+    assert "+changed" in lines
+
+
+def test_render_diff_large_binary_file(tmp_path: Path, monkeypatch):
+    repo = _setup_catalog(tmp_path, {"large.bin": "\0binary\n" * 10})
+    (tmp_path / "catalog" / "large.bin").write_text("\0changed\n" * 10)
+    diff = git.stage_changes(repo)
+
+    monkeypatch.setattr(git, "LARGE_FILE_SIZE", 10)
+    [text] = git.render_diff(repo, diff)
+    assert click.unstyle(text) == "Binary files large.bin and large.bin differ"
+
+
+class _FakeBlob:
+    def __init__(self, content: str):
+        self._data = content.encode("utf-8")
+        self.size = len(self._data)
+
+    @property
+    def data_stream(self):
+        return io.BytesIO(self._data)
+
+
+class _FakeRename:
+    def __init__(self, before: str, after: str):
+        self.a_path = "after.txt"
+        self.b_path = "before.txt"
+        self.a_blob = _FakeBlob(after)
+        self.b_blob = _FakeBlob(before)
+
+
+def test_compute_similarity_fallback(monkeypatch):
+    before = "".join(f"{i}\n" for i in range(10))
+    change = _FakeRename(before, "".join(f"{9 - i}\n" for i in range(10)))
+
+    lines = git._compute_similarity(change)
+    assert click.unstyle(lines[2]) == "Renamed file, similarity index 18.18%"
+
+    # For large files, only an estimate of the similarity is computed
+    monkeypatch.setattr(git, "LARGE_FILE_SIZE", 10)
+    lines = git._compute_similarity(change)
+    assert lines[2] == "Renamed file, estimated similarity index 100.00%"
+
+
+def test_render_diff_max_lines(tmp_path: Path):
+    repo = _setup_catalog(tmp_path, {"file.txt": "a\n" * 10})
+    (tmp_path / "catalog" / "file.txt").write_text("b\n" * 10)
+    diff = git.stage_changes(repo)
+
+    [text] = git.render_diff(repo, diff, max_lines=5)
+    lines = click.unstyle(text).split("\n")
+    assert len(lines) == 6
+    assert (
+        lines[5]
+        == "... diff truncated after 5 lines, 10 more added and 8 more removed lines"
+    )
+
+    [text] = git.render_diff(repo, diff, max_lines=None)
+    assert len(text.split("\n")) == 23
+
+
+def test_stage_paths(tmp_path: Path):
+    repo = _setup_catalog(
+        tmp_path, {"modified.txt": "old\n", "deleted.txt": "x\n", "other.txt": "o\n"}
+    )
+    workdir = tmp_path / "catalog"
+    (workdir / "modified.txt").write_text("new\n")
+    (workdir / "deleted.txt").unlink()
+    (workdir / "added.txt").write_text("added\n")
+    (workdir / "untracked.txt").write_text("not staged\n")
+    (workdir / "other.txt").write_text("not staged\n")
+
+    diff = git.stage_paths(repo, ["added.txt", "modified.txt"], ["deleted.txt"])
+
+    # The diff is backwards, files added to the index are "deleted"
+    assert [d.b_path for d in diff.iter_change_type("D")] == ["added.txt"]
+    assert [d.b_path for d in diff.iter_change_type("A")] == ["deleted.txt"]
+    assert [d.b_path for d in diff.iter_change_type("M")] == ["modified.txt"]
+    assert "untracked.txt" in repo.untracked_files
+
+
+@pytest.mark.parametrize("replace_dir", [True, False])
+def test_stage_paths_replace(tmp_path: Path, replace_dir):
+    if replace_dir:
+        # Directory `foo/` is replaced by file `foo`
+        repo = _setup_catalog(tmp_path, {"foo/bar.yaml": "a\n"})
+        old, new = "foo/bar.yaml", "foo"
+        shutil.rmtree(tmp_path / "catalog" / "foo")
+    else:
+        # File `foo` is replaced by directory `foo/`
+        repo = _setup_catalog(tmp_path, {"foo": "a\n"})
+        old, new = "foo", "foo/bar.yaml"
+        (tmp_path / "catalog" / "foo").unlink()
+    (tmp_path / "catalog" / new).parent.mkdir(exist_ok=True)
+    (tmp_path / "catalog" / new).write_text("b\n")
+
+    diff = git.stage_paths(repo, [new], [old])
+
+    assert [d.b_path for d in diff.iter_change_type("D")] == [new]
+    assert [d.b_path for d in diff.iter_change_type("A")] == [old]
+
+
+def test_stage_paths_pathspecs(tmp_path: Path):
+    repo = _setup_catalog(tmp_path, {"file.txt": "a\n"})
+    workdir = tmp_path / "catalog"
+    (workdir / "refs").mkdir()
+    (workdir / "refs" / "secret").write_text("ref\n")
+    (workdir / "file.txt").unlink()
+    (workdir / "manifests").mkdir()
+    (workdir / "manifests" / "untracked.yaml").write_text("not staged\n")
+
+    diff = git.stage_paths(repo, [], [], pathspecs=[".", ":(exclude)manifests"])
+
+    assert sorted(d.b_path for d in diff) == ["file.txt", "refs/secret"]
+    assert repo.untracked_files == ["manifests/untracked.yaml"]
+
+
+def test_stage_paths_empty_repo(tmp_path: Path):
+    repo = Repo.init(tmp_path)
+    (tmp_path / "file.txt").write_text("a\n")
+    diff = git.stage_paths(repo, ["file.txt"], [])
+    assert [d.b_path for d in diff] == ["file.txt"]
@@ -0,0 +1,168 @@
+"""
+Unit-tests for the component repository mirror cache
+"""
+
+import os
+import shutil
+
+from pathlib import Path
+from unittest.mock import patch
+
+import git
+
+from commodore import dependency_mgmt
+from commodore.component import Component
+from commodore.config import Config
+from commodore.gitcache import MirrorCache
+
+from bench_component import setup_components_upstream
+
+
+def _add_commit(repo_path: Path, filename: str):
+    repo = git.Repo(repo_path)
+    with open(repo_path / filename, "w") as f:
+        f.write(filename)
+    repo.index.add([filename])
+    return repo.index.commit(f"Add {filename}")
+
+
+def test_mirror_create_and_update(tmp_path: Path):
+    urls, _ = setup_components_upstream(tmp_path, ["test-component"])
+    url = urls["test-component"]
+    cache = MirrorCache(tmp_path / "cache")
+
+    mirror = cache.mirror(url)
+    assert mirror == cache.mirror_dir(url)
+    assert mirror.parent == tmp_path.resolve() / "cache" / "mirrors"
+    mrepo = git.Repo(mirror)
+    assert mrepo.bare
+
+    upstream = tmp_path / "upstream" / "test-component"
+    c = _add_commit(upstream, "README.md")
+    assert cache.mirror(url) == mirror
+    assert mrepo.head.commit.hexsha == c.hexsha
+
+
+def test_component_checkout_from_mirror(tmp_path: Path):
+    urls, _ = setup_components_upstream(tmp_path, ["test-component"])
+    url = urls["test-component"]
+    cache = MirrorCache(tmp_path / "cache")
+
+    c = Component("test-component", work_dir=tmp_path, repo_url=url)
+    c.checkout(mirror=cache.mirror(url))
+
+    assert (c.target_directory / "class" / "defaults.yml").is_file()
+    assert c.repo.remote().url == url
+    alternates = Path(c.repo.git_dir) / "objects" / "info" / "alternates"
+    assert not alternates.exists()
+
+    # The component repo doesn't depend on the mirror
+    shutil.rmtree(cache.mirror_dir(url))
+    c.repo.git.fsck("--full")
+    c.checkout(mirror=cache.mirror(url))
+    assert (c.target_directory / "class" / "defaults.yml").is_file()
+
+
+def test_component_checkout_from_mirror_dissociate(tmp_path: Path):
+    urls, _ = setup_components_upstream(tmp_path, ["test-component"])
+    url = urls["test-component"]
+    cache = MirrorCache(tmp_path / "cache")
+    mirror = cache.mirror(url)
+    # Component repo which borrows objects from the mirror
+    git.Repo.clone_from(
+        str(mirror), tmp_path / "dependencies" / "test-component", shared=True
+    )
+
+    c = Component("test-component", work_dir=tmp_path, repo_url=url)
+    c.checkout(mirror=cache.mirror(url))
+
+    alternates = Path(c.repo.git_dir) / "objects" / "info" / "alternates"
+    assert not alternates.exists()
+    shutil.rmtree(mirror)
+    c.repo.git.fsck("--full")
+
+
+def test_component_checkout_from_mirror_version(tmp_path: Path):
+    urls, _ = setup_components_upstream(tmp_path, ["test-component"])
+    url = urls["test-component"]
+    upstream = git.Repo(tmp_path / "upstream" / "test-component")
+    upstream.create_tag("v1.0.0")
+    _add_commit(tmp_path / "upstream" / "test-component", "README.md")
+    cache = MirrorCache(tmp_path / "cache")
+
+    c = Component("test-component", work_dir=tmp_path, repo_url=url, version="v1.0.0")
+    c.checkout(mirror=cache.mirror(url))
+
+    assert c.repo.head.commit.hexsha == upstream.tags["v1.0.0"].commit.hexsha
+    assert not (c.target_directory / "README.md").exists()
+
+
+def test_evict(tmp_path: Path):
+    components = ["component-one", "component-two", "component-three"]
+    urls, _ = setup_components_upstream(tmp_path, components)
+    cache = MirrorCache(tmp_path / "cache")
+    for idx, cn in enumerate(components):
+        mirror = cache.mirror(urls[cn])
+        # Ensure distinct last used timestamps
+        os.utime(mirror / "commodore-last-used", (idx, idx))
+
+    used = "component-two"
+    limited = MirrorCache(tmp_path / "cache", max_size=cache.size() // 3)
+    limited.mirror(urls[used])
+    limited.evict()
+
+    assert not cache.mirror_dir(urls["component-one"]).exists()
+    assert not cache.mirror_dir(urls["component-three"]).exists()
+    assert cache.mirror_dir(urls[used]).is_dir()
+
+
+def test_evict_used_since(tmp_path: Path):
+    components = ["component-one", "component-two"]
+    urls, _ = setup_components_upstream(tmp_path, components)
+    cache = MirrorCache(tmp_path / "cache")
+    for cn in components:
+        cache.mirror(urls[cn])
+    os.utime(cache.mirror_dir(urls["component-one"]) / "commodore-last-used", (0, 0))
+
+    # Mirrors used by other processes since `used_since`, e.g. by the workers
+    # of a batch compilation, aren't evicted.
+    limited = MirrorCache(tmp_path / "cache", max_size=0)
+    limited.evict(used_since=1.0)
+
+    assert not cache.mirror_dir(urls["component-one"]).exists()
+    assert cache.mirror_dir(urls["component-two"]).is_dir()
+
+
+@patch("commodore.dependency_mgmt._read_components")
+@patch("commodore.dependency_mgmt._discover_components")
+def test_fetch_components_with_cache(patch_discover, patch_read, tmp_path: Path):
+    components = ["component-one", "component-two"]
+    patch_discover.return_value = (components, {})
+    patch_read.return_value = setup_components_upstream(tmp_path, components)
+    config = Config(tmp_path)
+    config.cache_dir = tmp_path / "cache"
+
+    dependency_mgmt.fetch_components(config)
+
+    for component in components:
+        assert component in config.get_components()
+        assert (tmp_path / "dependencies" / component / "class").is_dir()
+        url = patch_read.return_value[0][component]
+        assert config.repo_cache.mirror_dir(url).is_dir()
+
+
+def test_mirror_fresh_since(tmp_path: Path):
+    urls, _ = setup_components_upstream(tmp_path, ["test-component"])
+    url = urls["test-component"]
+    mirror = MirrorCache(tmp_path / "cache").mirror(url)
+    head = git.Repo(mirror).head.commit.hexsha
+    _add_commit(tmp_path / "upstream" / "test-component", "README.md")
+
+    cache = MirrorCache(tmp_path / "cache", fresh_since=0.0)
+    cache.mirror(url)
+    assert git.Repo(mirror).head.commit.hexsha == head
+
+    os.utime(mirror / "commodore-last-fetched", (0, 0))
+    cache = MirrorCache(tmp_path / "cache", fresh_since=1.0)
+    cache.mirror(url)
+    assert git.Repo(mirror).head.commit.hexsha != head
@@ -1,10 +1,14 @@
 """
 Unit-tests for helpers
 """
+import os
 from pathlib import Path
 from typing import Callable
 import textwrap
 import pytest
+import yaml
+
+from unittest.mock import patch
 
 import commodore.helpers as helpers
 from commodore.config import Config
@@ -134,3 +138,122 @@ def test_yaml_dump(tmp_path: Path, input, expected):
 )
 def test_yaml_dump_all(tmp_path: Path, input, expected):
     _test_yaml_dump_fun(helpers.yaml_dump_all, tmp_path, input, expected)
+
+
+_YAML_DOCUMENTS = [
+    {"a": "first line\nsecond line\n", "b": "trailing \nspace"},
+    {"long": "word " * 40, "unicode": "grüezi ✓", "empty": ""},
+    {"types": [None, True, 1, 1.5, "yes", "1.0"]},
+]
+
+
+def test_yaml_backend():
+    assert helpers.yaml_backend() in ("libyaml", "python")
+    if yaml.__with_libyaml__:
+        assert helpers.yaml_backend() == "libyaml"
+
+
+def test_yaml_dump_python_fallback(tmp_path: Path):
+    """
+    The pure-Python dumper must produce the same output as the default one
+    """
+    output = tmp_path / "test.yaml"
+    helpers.yaml_dump_all(_YAML_DOCUMENTS, output)
+    assert output.read_text() == yaml.dump_all(
+        _YAML_DOCUMENTS, Dumper=helpers._PyYamlDumper
+    )
+
+
+def test_yaml_load_python_fallback(tmp_path: Path):
+    output = tmp_path / "test.yaml"
+    helpers.yaml_dump_all(_YAML_DOCUMENTS, output)
+    assert helpers.yaml_load_all(output) == _YAML_DOCUMENTS
+    with open(output) as f:
+        assert list(yaml.load_all(f, Loader=helpers._PyYamlLoader)) == _YAML_DOCUMENTS
+
+
+def _setup_inventory(cfg: Config):
+    cfg.inventory.ensure_dirs()
+    with open(cfg.inventory.classes_dir / "test.yml", "w") as f:
+        f.write("parameters:\n  test: a\n")
+    (cfg.work_dir / "values.yml").write_text("parameters:\n  value: 1\n")
+    helpers.relsymlink(cfg.work_dir / "values.yml", cfg.inventory.classes_dir)
+    with open(cfg.inventory.target_file("test"), "w") as f:
+        f.write("classes:\n  - test\n  - values\n")
+
+
+def test_kapitan_inventory_cache(tmp_path: Path):
+    cfg = Config(work_dir=tmp_path)
+    _setup_inventory(cfg)
+
+    with patch(
+        "commodore.helpers.inventory_reclass", wraps=helpers.inventory_reclass
+    ) as render:
+        nodes = helpers.kapitan_inventory(cfg)
+        assert nodes["test"]["parameters"]["test"] == "a"
+        apps = helpers.kapitan_inventory(cfg, key="applications")
+        assert apps == {}
+        assert render.call_count == 1
+
+        # Changing a symlinked class invalidates the cache
+        (cfg.work_dir / "values.yml").write_text("parameters:\n  value: 2\n")
+        nodes = helpers.kapitan_inventory(cfg)
+        assert nodes["test"]["parameters"]["value"] == 2
+        assert render.call_count == 2
+
+
+def test_inventory_digest(tmp_path: Path):
+    cfg = Config(work_dir=tmp_path)
+    _setup_inventory(cfg)
+    digest = helpers.inventory_digest(cfg.inventory.inventory_dir)
+
+    # Git metadata of config repos isn't part of the digest
+    (cfg.inventory.classes_dir / ".git").mkdir()
+    (cfg.inventory.classes_dir / ".git" / "HEAD").write_text("ref: master\n")
+    assert helpers.inventory_digest(cfg.inventory.inventory_dir) == digest
+
+    with open(cfg.inventory.classes_dir / "test.yml", "a") as f:
+        f.write("  other: b\n")
+    assert helpers.inventory_digest(cfg.inventory.inventory_dir) != digest
+
+
+def test_inventory_digest_mtime(tmp_path: Path):
+    cfg = Config(work_dir=tmp_path)
+    _setup_inventory(cfg)
+    values = cfg.work_dir / "values.yml"
+
+    # Recently modified files are hashed by content, the modification time
+    # may not change if the file is modified again immediately.
+    digest = helpers.inventory_digest(cfg.inventory.inventory_dir)
+    mtime = values.stat().st_mtime_ns
+    values.write_text("parameters:\n  value: 2\n")
+    os.utime(values, ns=(mtime, mtime))
+    assert helpers.inventory_digest(cfg.inventory.inventory_dir) != digest
+
+    # Other files are only hashed by size and modification time
+    os.utime(values, (1, 1))
+    digest = helpers.inventory_digest(cfg.inventory.inventory_dir)
+    values.write_text("parameters:\n  value: 3\n")
+    os.utime(values, (1, 1))
+    assert helpers.inventory_digest(cfg.inventory.inventory_dir) == digest
+    os.utime(values, (2, 2))
+    assert helpers.inventory_digest(cfg.inventory.inventory_dir) != digest
+
+
+@patch("commodore.helpers.kapitan_targets.compile_targets")
+def test_kapitan_compile_copies_inventory(patch_compile, tmp_path: Path):
+    cfg = Config(work_dir=tmp_path)
+    _setup_inventory(cfg)
+    nodes = helpers.kapitan_inventory(cfg)
+
+    def _compile(**kwargs):
+        # Kapitan adds `target_full_path` to the inventory of each target
+        helpers.cached.inv["nodes"]["test"]["parameters"]["target_full_path"] = "x"
+
+    patch_compile.side_effect = _compile
+    helpers.kapitan_compile(cfg, ["test"])
+
+    assert "target_full_path" not in nodes["test"]["parameters"]
+    assert helpers.cached.inv is not cfg.get_rendered_inventory(
+        helpers.inventory_digest(cfg.inventory.inventory_dir)
+    )
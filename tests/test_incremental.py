@@ -0,0 +1,156 @@
+"""
+Unit-tests for incremental catalog compilation
+"""
+
+import json
+
+from pathlib import Path
+
+import git
+import pytest
+
+from commodore.component import Component
+from commodore.config import Config
+from commodore.incremental import (
+    FINGERPRINTS_FILE,
+    TargetFingerprints,
+    expand_stale_targets,
+    select_targets,
+)
+
+
+def _setup_component(config: Config, cn: str) -> Component:
+    repo_path = config.work_dir / "dependencies" / cn
+    repo = git.Repo.init(repo_path)
+    (repo_path / "class").mkdir()
+    (repo_path / "class" / "defaults.yml").write_text("parameters: {}\n")
+    repo.index.add(["class/defaults.yml"])
+    repo.index.commit("Initial commit")
+    c = Component(cn, work_dir=config.work_dir)
+    config.register_component(c)
+    return c
+
+
+def _inventory(**params):
+    return {t: {"parameters": {"value": v}} for t, v in params.items()}
+
+
+@pytest.fixture
+def config(tmp_path: Path):
+    cfg = Config(tmp_path)
+    _setup_component(cfg, "component-a")
+    _setup_component(cfg, "component-b")
+    return cfg
+
+
+def _compile(config: Config, inventory, aliases):
+    fingerprints = select_targets(config, inventory, aliases)
+    stale = fingerprints.stale_targets()
+    for t in stale:
+        (config.inventory.output_dir / t).mkdir(parents=True, exist_ok=True)
+    fingerprints.save()
+    return stale
+
+
+ALIASES = {
+    "component-a": "component-a",
+    "component-b": "component-b",
+    "other-b": "component-b",
+}
+
+
+def test_first_compile_compiles_all(config: Config):
+    inventory = _inventory(**{"component-a": 1, "component-b": 2, "other-b": 3})
+
+    assert _compile(config, inventory, ALIASES) == list(ALIASES.keys())
+    fpfile = config.inventory.output_dir / FINGERPRINTS_FILE
+    assert set(json.loads(fpfile.read_text()).keys()) == set(ALIASES.keys())
+
+
+def test_unchanged_targets_are_skipped(config: Config):
+    inventory = _inventory(**{"component-a": 1, "component-b": 2, "other-b": 3})
+    _compile(config, inventory, ALIASES)
+
+    assert _compile(config, inventory, ALIASES) == []
+
+    inventory["other-b"]["parameters"]["value"] = 4
+    assert _compile(config, inventory, ALIASES) == ["other-b"]
+
+
+def test_component_commit_invalidates_instances(config: Config):
+    inventory = _inventory(**{"component-a": 1, "component-b": 2, "other-b": 3})
+    _compile(config, inventory, ALIASES)
+
+    c = config.get_components()["component-b"]
+    (c.target_directory / "component").mkdir()
+    (c.target_directory / "component" / "main.jsonnet").write_text("{}")
+    # Uncommitted changes always cause recompilation
+    assert _compile(config, inventory, ALIASES) == ["component-b", "other-b"]
+
+    c.repo.index.add(["component/main.jsonnet"])
+    c.repo.index.commit("Add main.jsonnet")
+    assert _compile(config, inventory, ALIASES) == ["component-b", "other-b"]
+    assert _compile(config, inventory, ALIASES) == []
+
+
+def test_filters_and_libs_invalidate_targets(config: Config):
+    inventory = _inventory(**{"component-a": 1, "component-b": 2, "other-b": 3})
+    _compile(config, inventory, ALIASES)
+
+    lib_dir = config.inventory.lib_dir
+    lib_dir.mkdir(parents=True)
+    (lib_dir / "test.libsonnet").write_text("{}")
+    assert _compile(config, inventory, ALIASES) == list(ALIASES.keys())
+    assert _compile(config, inventory, ALIASES) == []
+
+    c = config.get_components()["component-a"]
+    (c.target_directory / "postprocess").mkdir()
+    c.filters_file.write_text("filters: []\n")
+    c.repo.index.add(["postprocess/filters.yml"])
+    c.repo.index.commit("Add filters")
+    assert _compile(config, inventory, ALIASES) == ["component-a"]
+
+
+def test_missing_output_and_removed_targets(config: Config):
+    inventory = _inventory(**{"component-a": 1, "component-b": 2, "other-b": 3})
+    _compile(config, inventory, ALIASES)
+
+    (config.inventory.output_dir / "component-a").rmdir()
+    aliases = dict(ALIASES)
+    del aliases["other-b"]
+    assert _compile(config, inventory, aliases) == ["component-a"]
+    assert not (config.inventory.output_dir / "other-b").exists()
+
+
+def test_invalidate(config: Config):
+    inventory = _inventory(**{"component-a": 1, "component-b": 2, "other-b": 3})
+    _compile(config, inventory, ALIASES)
+
+    fingerprints = TargetFingerprints(config)
+    fingerprints.compute(config, inventory, ALIASES)
+    fingerprints.invalidate(["component-a"])
+
+    fingerprints = TargetFingerprints(config)
+    fingerprints.compute(config, inventory, ALIASES)
+    assert fingerprints.stale_targets() == ["component-a"]
+
+
+@pytest.mark.parametrize(
+    "stale,aliases,targets,components",
+    [
+        # An aliased instance is mapped to its component, and the component's
+        # own target is recompiled, so that its filters run on fresh output.
+        (["other-b"], ALIASES, ["component-b", "other-b"], {"component-b"}),
+        (["component-b"], ALIASES, ["component-b"], {"component-b"}),
+        # Components which are only instantiated under an alias
+        (
+            ["instance-a"],
+            {"component-b": "component-b", "instance-a": "component-a"},
+            ["instance-a"],
+            {"component-a"},
+        ),
+        ([], ALIASES, [], set()),
+    ],
+)
+def test_expand_stale_targets(stale, aliases, targets, components):
+    assert expand_stale_targets(stale, aliases) == (targets, components)
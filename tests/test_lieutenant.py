@@ -0,0 +1,182 @@
+"""
+Unit-tests for the Lieutenant API client
+"""
+
+import json
+import os
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import pytest
+
+from commodore import helpers
+from commodore.config import Config
+from commodore.lieutenant import ApiError, LieutenantClient
+
+
+def _etag(obj):
+    return f'"{len(json.dumps(obj))}"'
+
+
+class FakeLieutenant(BaseHTTPRequestHandler):
+    """
+    Minimal fake of the Lieutenant API. Objects are served from
+    `server.objects`, the first `server.failures` requests fail with a 503.
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        if server.failures > 0:
+            server.failures -= 1
+            self._respond(503, {"reason": "Service Unavailable"})
+            return
+        obj = server.objects.get(self.path.rstrip("/"))
+        if obj is None:
+            self._respond(404, {"reason": "Not Found"})
+            return
+        etag = _etag(obj)
+        if self.headers.get("If-None-Match") == etag:
+            self._respond(304, None, etag=etag)
+            return
+        self._respond(200, obj, etag=etag)
+
+    def _respond(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if etag:
+            self.send_header("ETag", etag)
+        data = b""
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # pylint: disable=redefined-builtin
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    server = HTTPServer(("127.0.0.1", 0), FakeLieutenant)
+    server.requests = []
+    server.failures = 0
+    server.objects = {
+        "/clusters": [{"id": "c-bar", "tenant": "t-foo"}],
+        "/clusters/c-bar": {"id": "c-bar", "tenant": "t-foo"},
+        "/tenants/t-foo": {"id": "t-foo", "displayName": "Foo Inc."},
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(api):
+    return f"http://127.0.0.1:{api.server_address[1]}"
+
+
+def test_query(api):
+    client = LieutenantClient(_url(api), "token")
+
+    assert client.cluster("c-bar") == {"id": "c-bar", "tenant": "t-foo"}
+    assert client.clusters() == [{"id": "c-bar", "tenant": "t-foo"}]
+    path, headers = api.requests[0]
+    assert path == "/clusters/c-bar"
+    assert headers["Authorization"] == "Bearer token"
+
+
+def test_query_conditional_request(api):
+    client = LieutenantClient(_url(api), "token")
+
+    first = client.cluster("c-bar")
+    second = client.cluster("c-bar")
+
+    assert first == second
+    assert "If-None-Match" not in api.requests[0][1]
+    assert api.requests[1][1]["If-None-Match"] == _etag(first)
+
+
+def test_query_retry(api):
+    api.failures = 2
+    client = LieutenantClient(_url(api), "token", retries=3)
+
+    assert client.cluster("c-bar")["id"] == "c-bar"
+    assert len(api.requests) == 3
+
+
+def test_query_errors(api):
+    api.failures = 5
+    client = LieutenantClient(_url(api), "token", retries=1)
+    with pytest.raises(ApiError) as e:
+        client.cluster("c-bar")
+    assert "API returned 503: Service Unavailable" in str(e.value)
+
+    api.failures = 0
+    with pytest.raises(ApiError) as e:
+        client.cluster("c-missing")
+    assert "API returned 404: Not Found" in str(e.value)
+
+
+def test_query_connection_error():
+    client = LieutenantClient("http://127.0.0.1:1", "token", retries=0)
+    with pytest.raises(ApiError) as e:
+        client.clusters()
+    assert "Unable to connect to Lieutenant at http://127.0.0.1:1" in str(e.value)
+
+
+def test_tenant_cache(api, tmp_path: Path):
+    client = LieutenantClient(_url(api), "token", cache_dir=tmp_path, cache_ttl=60)
+    tenant = client.tenant("t-foo")
+    assert tenant["displayName"] == "Foo Inc."
+
+    # A fresh cache entry is used by other clients without asking the API
+    other = LieutenantClient(_url(api), "token", cache_dir=tmp_path, cache_ttl=60)
+    assert other.tenant("t-foo") == tenant
+    assert len(api.requests) == 1
+
+    # Stale entries are revalidated
+    for f in tmp_path.glob("*.json"):
+        os.utime(f, (0, 0))
+    assert other.tenant("t-foo") == tenant
+    assert len(api.requests) == 2
+    assert api.requests[1][1]["If-None-Match"] == _etag(tenant)
+
+
+def test_config_lieutenant(tmp_path: Path):
+    config = Config(tmp_path, api_url="https://syn.example.com", api_token="token")
+    client = config.lieutenant
+    assert client.api_url == "https://syn.example.com"
+    assert config.lieutenant is client
+
+    config.api_url = "https://syn.example.org"
+    assert config.lieutenant is not client
+    assert config.lieutenant.api_url == "https://syn.example.org"
+
+
+def test_tenant_cache_token(api, tmp_path: Path):
+    client = LieutenantClient(_url(api), "token", cache_dir=tmp_path, cache_ttl=60)
+    client.tenant("t-foo")
+
+    # Cache entries aren't shared between API tokens
+    other = LieutenantClient(_url(api), "other", cache_dir=tmp_path, cache_ttl=60)
+    other.tenant("t-foo")
+    assert len(api.requests) == 2
+    assert api.requests[1][1]["Authorization"] == "Bearer other"
+
+
+def test_lieutenant_query_reuses_client(api):
+    url = _url(api)
+    assert helpers.lieutenant_query(url, "token", "clusters", "c-bar")["id"] == "c-bar"
+    helpers.lieutenant_query(url, "token", "tenants", "t-foo")
+    assert helpers._lieutenant_client(url, "token") is helpers._lieutenant_client(
+        url, "token"
+    )
+    assert helpers._lieutenant_client(url, "token") is not helpers._lieutenant_client(
+        url, "other"
+    )
@@ -1,11 +1,27 @@
 """
 Tests for postprocessing
 """
+import json
 import os
+import re
+import textwrap
+
+import _jsonnet
+import click
+import pytest
 import yaml
 from commodore.config import Config
 from commodore.component import Component
-from commodore.postprocess import postprocess_components
+from commodore.postprocess import Filter, postprocess_components
+from commodore.postprocess.builtin_filters import run_builtin_filter
+from commodore.postprocess.jsonnet import (
+    ImportCache,
+    NativeCallbackCache,
+    _iter_output_objects,
+    caches,
+    jsonnet_runner,
+    reset_caches,
+)
 from test_component_template import test_run_component_new_command
 
 
@@ -167,3 +183,469 @@ def test_postprocess_components_invfilter_disabled(tmp_path, capsys):
         assert obj["metadata"]["namespace"] == "untouched"
     captured = capsys.readouterr()
     assert "Skipping disabled filter" in captured.out
+
+
+def test_jsonnet_runner_output(tmp_path):
+    def _evaluate(_file, **kwargs):
+        return json.dumps(
+            {
+                "single": {"data": "first line\nsecond line"},
+                "sub/multi": [{"a": 1}, {"b": [1, 2]}],
+            },
+            indent=3,
+        )
+
+    jsonnet_runner(tmp_path, {}, "test", "out", _evaluate, "filter.jsonnet")
+
+    outdir = tmp_path / "compiled" / "test" / "out"
+    assert (outdir / "single.yaml").read_text() == textwrap.dedent("""\
+        data: |-
+          first line
+          second line
+        """)
+    with open(outdir / "sub" / "multi.yaml") as f:
+        assert list(yaml.safe_load_all(f)) == [{"a": 1}, {"b": [1, 2]}]
+
+
+@pytest.mark.parametrize(
+    "output,expected",
+    [
+        ("{}", []),
+        (' { "a" : 1 , "b": {"c": [1, "}"]}}\n', [("a", 1), ("b", {"c": [1, "}"]})]),
+        ('{"a": []}', [("a", [])]),
+    ],
+)
+def test_iter_output_objects(output, expected):
+    assert list(_iter_output_objects(output)) == expected
+
+
+@pytest.mark.parametrize("output", ["[]", '{"a": 1', '{"a" 1}', '{"a": 1,}', "{1: 2}"])
+def test_iter_output_objects_invalid(output):
+    with pytest.raises(json.JSONDecodeError):
+        list(_iter_output_objects(output))
+
+
+def _setup_parallel(tmp_path, other_filter):
+    testf, config, inventory, components = _setup(
+        tmp_path, _make_ns_filter("myns"), invfilter=True
+    )
+    otherf = tmp_path / "compiled" / "other" / "test" / "object.yaml"
+    os.makedirs(otherf.parent)
+    otherf.write_text(testf.read_text())
+    inventory["other"] = {
+        "classes": inventory["test-component"]["classes"],
+        "parameters": {"commodore": {"postprocess": other_filter}},
+    }
+    components["other"] = Component(
+        "other", work_dir=tmp_path, repo_url="https://fake.repo.url"
+    )
+    config.jobs = 2
+    config.update_verbosity(1)
+    return testf, otherf, config, inventory, components
+
+
+def test_postprocess_components_parallel(tmp_path, capsys):
+    testf, otherf, config, inventory, components = _setup_parallel(
+        tmp_path, _make_ns_filter("otherns")
+    )
+
+    postprocess_components(config, inventory, components)
+
+    with open(testf) as objf:
+        assert yaml.safe_load(objf)["metadata"]["namespace"] == "myns"
+    with open(otherf) as objf:
+        assert yaml.safe_load(objf)["metadata"]["namespace"] == "otherns"
+    captured = capsys.readouterr()
+    assert "Using 2 parallel postprocessing process(es)" in captured.out
+    assert captured.out.index(" > test-component...") < captured.out.index(
+        " > other..."
+    )
+
+
+def test_postprocess_components_parallel_error(tmp_path, capsys):
+    other_filter = _make_ns_filter("otherns")
+    del other_filter["filters"][0]["filterargs"]["namespace"]
+    testf, otherf, config, inventory, components = _setup_parallel(
+        tmp_path, other_filter
+    )
+
+    with pytest.raises(click.ClickException) as e:
+        postprocess_components(config, inventory, components)
+
+    assert "Postprocessing failed for component(s) other" in str(e.value)
+    with open(testf) as objf:
+        assert yaml.safe_load(objf)["metadata"]["namespace"] == "myns"
+    captured = capsys.readouterr()
+    assert (
+        " > Postprocessing other failed: Builtin filter 'helm_namespace': "
+        + "filter argument 'namespace' is required"
+    ) in captured.out
+
+
+def _styled_filter(config, inventory, component, filterid, path, **filterargs):
+    click.secho(f" > Styled output of {component}", fg="green")
+    if component == "other":
+        raise ValueError("unexpected error")
+
+
+@pytest.mark.parametrize("color", [True, False])
+def test_postprocess_components_parallel_color(tmp_path, capsys, monkeypatch, color):
+    monkeypatch.setitem(Filter._run_handlers, "builtin", _styled_filter)
+    _, _, config, inventory, components = _setup_parallel(
+        tmp_path, _make_ns_filter("otherns")
+    )
+
+    with click.Context(click.Command("compile"), color=color):
+        with pytest.raises(click.ClickException):
+            postprocess_components(config, inventory, components)
+
+    styled = click.style(" > Styled output of test-component", fg="green")
+    captured = capsys.readouterr()
+    assert (styled in captured.out) == color
+    assert " > Styled output of test-component" in captured.out
+
+
+def test_postprocess_components_parallel_unexpected_error(
+    tmp_path, capsys, monkeypatch
+):
+    monkeypatch.setitem(Filter._run_handlers, "builtin", _styled_filter)
+    _, _, config, inventory, components = _setup_parallel(
+        tmp_path, _make_ns_filter("otherns")
+    )
+
+    with pytest.raises(click.ClickException) as e:
+        postprocess_components(config, inventory, components)
+
+    assert "Postprocessing failed for component(s) other" in str(e.value)
+    captured = capsys.readouterr()
+    assert (
+        " > Postprocessing other failed: Filter 'builtin:helm_namespace' of "
+        + "component other failed: ValueError: unexpected error"
+    ) in captured.out
+
+
+def test_postprocess_components_unexpected_error(tmp_path, monkeypatch):
+    monkeypatch.setitem(Filter._run_handlers, "builtin", _styled_filter)
+    _, _, config, inventory, components = _setup_parallel(
+        tmp_path, _make_ns_filter("otherns")
+    )
+    config.jobs = 1
+
+    with pytest.raises(click.ClickException) as e:
+        postprocess_components(config, inventory, components)
+
+    assert str(e.value) == (
+        "Filter 'builtin:helm_namespace' of component other failed: "
+        + "ValueError: unexpected error"
+    )
+
+
+def test_import_cache(tmp_path):
+    basedir = tmp_path / "dependencies" / "test"
+    lib = tmp_path / "vendor" / "lib.libsonnet"
+    os.makedirs(basedir)
+    os.makedirs(lib.parent)
+    lib.write_text("{ a: 1 }")
+    cache = ImportCache()
+
+    assert cache.import_callback(tmp_path, str(basedir), "lib.libsonnet") == (
+        "lib.libsonnet",
+        "{ a: 1 }",
+    )
+    assert cache.import_callback(tmp_path, str(basedir), "lib.libsonnet")[1] == (
+        "{ a: 1 }"
+    )
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Modified files are read again
+    lib.write_text("{ a: 2, b: 3 }")
+    assert cache.import_callback(tmp_path, str(basedir), "lib.libsonnet")[1] == (
+        "{ a: 2, b: 3 }"
+    )
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Imports resolve to another file if the memoized file is deleted
+    (basedir / "lib.libsonnet").write_text("{ local: true }")
+    assert cache.import_callback(tmp_path, str(basedir), "lib.libsonnet")[1] == (
+        "{ a: 2, b: 3 }"
+    )
+    lib.unlink()
+    assert cache.import_callback(tmp_path, str(basedir), "lib.libsonnet")[1] == (
+        "{ local: true }"
+    )
+
+
+@pytest.mark.parametrize(
+    "rel,error",
+    [
+        ("", "Got invalid filename (empty string)."),
+        ("missing.libsonnet", "File not found"),
+        ("vendor", "Attempted to import a directory"),
+    ],
+)
+def test_import_cache_errors(tmp_path, rel, error):
+    os.makedirs(tmp_path / "vendor")
+    with pytest.raises(RuntimeError, match=re.escape(error)):
+        ImportCache().import_callback(tmp_path, str(tmp_path), rel)
+
+
+def test_native_callback_cache(tmp_path):
+    a = tmp_path / "a.yaml"
+    b = tmp_path / "b.yaml"
+    a.write_text("a: 1\n---\nb: 2\n")
+    b.write_text("a: 1\n---\nb: 2\n")
+    cache = NativeCallbackCache()
+
+    assert cache.yaml_load_all(a) == [{"a": 1}, {"b": 2}]
+    assert cache.yaml_load_all(a) == [{"a": 1}, {"b": 2}]
+    # Files with identical contents are only parsed once
+    assert cache.yaml_load_all(b) == [{"a": 1}, {"b": 2}]
+    assert sorted(cache.list_dir(tmp_path, True)) == ["a.yaml", "b.yaml"]
+    assert sorted(cache.list_dir(tmp_path, True)) == ["a.yaml", "b.yaml"]
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_native_callback_cache_invalidate(tmp_path):
+    reset_caches()
+
+    def _evaluate(_file, native_callbacks, **kwargs):
+        _, yaml_load_all = native_callbacks["yaml_load_all"]
+        _, list_dir = native_callbacks["list_dir"]
+        files = sorted(list_dir(str(outdir), True))
+        objs = yaml_load_all(str(outdir / "a.yaml"))
+        return json.dumps({"a": objs + [{"files": files}], "b": {}})
+
+    outdir = tmp_path / "compiled" / "test" / "out"
+    os.makedirs(outdir)
+    (outdir / "a.yaml").write_text("a: 1\n")
+    jsonnet_runner(tmp_path, {}, "test", "out", _evaluate, "filter.jsonnet")
+    jsonnet_runner(tmp_path, {}, "test", "out", _evaluate, "filter.jsonnet")
+
+    with open(outdir / "a.yaml") as f:
+        assert list(yaml.safe_load_all(f)) == [
+            {"a": 1},
+            {"files": ["a.yaml"]},
+            {"files": ["a.yaml", "b.yaml"]},
+        ]
+
+
+def test_jsonnet_runner_inventory(tmp_path):
+    _, _, inventory, _ = _setup(tmp_path, _make_ns_filter("myns"))
+    # Rendered inventories only contain JSON-compatible values
+    inventory["test-component"]["classes"] = sorted(
+        inventory["test-component"]["classes"]
+    )
+    filterfile = tmp_path / "filter.jsonnet"
+    filterfile.write_text(
+        "local com = import 'lib/commodore.libjsonnet';\n"
+        + "local ns = com.inventory().parameters.test_component.namespace;\n"
+        + "{ out: { ns: ns, again: com.inventory().parameters.test_component } }\n"
+    )
+    reset_caches()
+
+    for _ in range(2):
+        jsonnet_runner(
+            tmp_path,
+            inventory["test-component"],
+            "test-component",
+            "test",
+            _jsonnet.evaluate_file,
+            filterfile,
+        )
+
+    outfile = tmp_path / "compiled" / "test-component" / "test" / "out.yaml"
+    with open(outfile) as f:
+        assert yaml.safe_load(f) == {
+            "ns": "syn-test-component",
+            "again": {"namespace": "syn-test-component"},
+        }
+    # The inventory is encoded once, and only passed to each VM once
+    cache = caches()["Native callback"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+_HELM_CHART = {
+    "deployment.yaml": textwrap.dedent("""\
+        ---
+        apiVersion: apps/v1
+        kind: Deployment
+        metadata:
+          name: test
+          labels:
+            app: test
+        spec:
+          replicas: 2
+          template:
+            spec:
+              containers:
+                - name: test
+                  args: ["--debug", "true"]
+                  command:
+                    - sh
+                    - -c
+                    - |
+                      echo "multi-line"
+                      exec test
+        """),
+    "rbac.yaml": textwrap.dedent("""\
+        ---
+        apiVersion: v1
+        kind: ServiceAccount
+        metadata:
+          name: test
+          namespace: other
+        ---
+        ---
+        apiVersion: rbac.authorization.k8s.io/v1
+        kind: ClusterRole
+        metadata:
+          name: test
+        rules: []
+        ---
+        apiVersion: v1
+        kind: ConfigMap
+        data:
+          enabled: false
+          key: value
+        """),
+    "service.yml": "apiVersion: v1\nkind: Service\nmetadata:\n  name: test\n",
+    "empty.yaml": "",
+}
+
+
+def _setup_chart(work_dir):
+    chart_dir = work_dir / "compiled" / "test" / "chart"
+    os.makedirs(chart_dir)
+    for name, content in _HELM_CHART.items():
+        (chart_dir / name).write_text(content)
+    return chart_dir
+
+
+@pytest.mark.parametrize(
+    "filterargs",
+    [
+        {"namespace": "myns"},
+        {
+            "namespace": "myns",
+            "exclude_objects": [
+                {"kind": "ClusterRole", "name": "test"},
+                {"kind": "Deployment", "name": "other"},
+            ],
+        },
+    ],
+)
+def test_helm_namespace_parity(tmp_path, filterargs):
+    outputs = {}
+    for filterid in ["helm_namespace", "helm_namespace_jsonnet"]:
+        chart_dir = _setup_chart(tmp_path / filterid)
+        config = Config(work_dir=tmp_path / filterid)
+        reset_caches()
+        run_builtin_filter(config, {}, "test", filterid, "chart", **filterargs)
+        outputs[filterid] = {
+            f.name: f.read_text() for f in chart_dir.iterdir() if f.is_file()
+        }
+
+    assert outputs["helm_namespace"] == outputs["helm_namespace_jsonnet"]
+    assert sorted(outputs["helm_namespace"].keys()) == [
+        "deployment.yaml",
+        "empty.yaml",
+        "rbac.yaml",
+        "service.yaml",
+        "service.yml",
+    ]
+    objs = list(yaml.safe_load_all(outputs["helm_namespace"]["rbac.yaml"]))
+    assert [o["metadata"].get("namespace") for o in objs] == [
+        "myns",
+        None if "exclude_objects" in filterargs else "myns",
+        "myns",
+    ]
+
+
+def test_helm_namespace_create_namespace(tmp_path):
+    chart_dir = _setup_chart(tmp_path)
+    run_builtin_filter(
+        Config(work_dir=tmp_path),
+        {},
+        "test",
+        "helm_namespace",
+        "chart",
+        namespace="myns",
+        create_namespace="true",
+    )
+    with open(chart_dir / "00_namespace.yaml") as f:
+        assert yaml.safe_load(f) == {
+            "apiVersion": "v1",
+            "kind": "Namespace",
+            "metadata": {"annotations": {}, "labels": {"name": "myns"}, "name": "myns"},
+        }
+
+
+@pytest.mark.parametrize(
+    "filterargs,error",
+    [
+        ({}, "filter argument 'namespace' is required"),
+        (
+            {"namespace": "myns", "exclude_objects": [{"kind": "ClusterRole"}]},
+            "must have keys 'kind' and 'name'",
+        ),
+    ],
+)
+def test_helm_namespace_errors(tmp_path, filterargs, error):
+    _setup_chart(tmp_path)
+    with pytest.raises(click.ClickException, match=error):
+        run_builtin_filter(
+            Config(work_dir=tmp_path),
+            {},
+            "test",
+            "helm_namespace",
+            "chart",
+            **filterargs
+        )
+
+
+@pytest.mark.parametrize(
+    "filterid,error,message",
+    [
+        (
+            "helm_namespace",
+            click.ClickException,
+            "files 'deployment.yaml' and 'deployment.yml' would both be written "
+            + "to 'deployment.yaml'",
+        ),
+        ("helm_namespace_jsonnet", RuntimeError, 'duplicate field name: "deployment"'),
+    ],
+)
+def test_helm_namespace_output_collision(tmp_path, filterid, error, message):
+    chart_dir = _setup_chart(tmp_path)
+    (chart_dir / "deployment.yml").write_text(_HELM_CHART["deployment.yaml"])
+
+    with pytest.raises(error, match=re.escape(message)):
+        run_builtin_filter(
+            Config(work_dir=tmp_path),
+            {},
+            "test",
+            filterid,
+            "chart",
+            namespace="myns",
+        )
+
+    # No file is rewritten
+    for name, content in _HELM_CHART.items():
+        assert (chart_dir / name).read_text() == content
+
+
+def test_helm_namespace_invalid_file(tmp_path):
+    chart_dir = _setup_chart(tmp_path)
+    (chart_dir / "invalid.yaml").write_text("a: [")
+
+    with pytest.raises(yaml.YAMLError):
+        run_builtin_filter(
+            Config(work_dir=tmp_path),
+            {},
+            "test",
+            "helm_namespace",
+            "chart",
+            namespace="myns",
+        )
+
+    assert not any(f.name.endswith(".tmp") for f in chart_dir.iterdir())
@@ -1,9 +1,13 @@
+import os
+
+import click
 import pytest
 
 from pathlib import Path
 
 from commodore import refs
 from commodore.config import Config
+from commodore.helpers import yaml_load
 
 
 @pytest.fixture
@@ -112,3 +116,177 @@ def test_update_refs(tmp_path: Path, config, inventory):
     for ref in not_expected_refs:
         refpath = ref_prefix / ref
         assert not refpath.exists()
+
+
+def test_find_refs_key_paths(config, inventory):
+    inventory["test-a"]["parameters"]["test"]["params"]["env"].append(
+        {"key": "envC", "value": "?{vaultkv:t-tenant/c-cluster/test/envC}"}
+    )
+    inventory["test-a"]["parameters"]["test"]["nested"] = [
+        [42, "?{vaultkv:t-tenant/c-cluster/test/nested}", None]
+    ]
+    rb = refs.RefBuilder(config, inventory)
+    rb.find_refs("test-a", "test")
+
+    found = {r.refstr: r.keys for r in rb.refs}
+    assert found == {
+        "vaultkv:t-tenant/c-cluster/test/test-a-accesskey": ["test/accesskey"],
+        "vaultkv:t-tenant/c-cluster/test/test-a-secretkey": ["test/secretkey"],
+        "vaultkv:t-tenant/c-cluster/test/envC": ["test/params/env[2]/value"],
+        "vaultkv:t-tenant/c-cluster/test/nested": ["test/nested[0][1]"],
+    }
+
+
+def test_find_refs_leaf(config, inventory):
+    rb = refs.RefBuilder(config, inventory)
+    rb.find_refs("test-a", "_instance")
+    assert list(rb.refs) == []
+
+    inventory["test-a"]["parameters"]["leaf"] = "?{vaultkv:t-tenant/c/leaf}"
+    rb.find_refs("test-a", "leaf")
+    assert [(r.refstr, r.keys) for r in rb.refs] == [
+        ("vaultkv:t-tenant/c/leaf", ["leaf"])
+    ]
+
+
+def test_find_refs_skips_searched_params(config, inventory):
+    rb = refs.RefBuilder(config, inventory)
+    rb.find_refs("cluster", "other_component")
+    rb.find_refs("other-component", "other_component")
+
+    found = list(rb.refs)
+    assert len(found) == 1
+    assert found[0].keys == ["other_component/thesecret"]
+
+
+def test_find_refs_unserializable_params(config, inventory):
+    # Parameters which can't be serialized for the digest are always searched
+    inventory["test-a"]["parameters"]["mixed"] = {
+        1: "?{vaultkv:t-tenant/c/one}",
+        "two": "?{vaultkv:t-tenant/c/two}",
+    }
+    rb = refs.RefBuilder(config, inventory)
+    rb.find_refs("test-a", "mixed")
+    rb.find_refs("test-a", "mixed")
+
+    found = {r.refstr: r.keys for r in rb.refs}
+    assert found == {
+        "vaultkv:t-tenant/c/one": ["mixed/1", "mixed/1"],
+        "vaultkv:t-tenant/c/two": ["mixed/two", "mixed/two"],
+    }
+
+
+def test_update_refs_only_writes_changes(tmp_path: Path, config, inventory, capsys):
+    aliases = config.get_component_aliases()
+    refs.update_refs(config, aliases, inventory)
+    stdout, _ = capsys.readouterr()
+    assert " > 6 created, 0 updated, 0 deleted, 0 unchanged" in stdout
+
+    ref_prefix = config.refs_dir / "t-tenant" / "c-cluster"
+    unchanged = ref_prefix / "global" / "password"
+    os.utime(unchanged, (0, 0))
+
+    del inventory["test-b"]["parameters"]["test"]["secretkey"]
+    refs.update_refs(config, aliases, inventory)
+    stdout, _ = capsys.readouterr()
+    assert " > 0 created, 0 updated, 1 deleted, 5 unchanged" in stdout
+    assert unchanged.stat().st_mtime == 0
+    assert not (ref_prefix / "test" / "test-b-secretkey").exists()
+
+    vault_params = inventory["cluster"]["parameters"]["kapitan"]["secrets"]["vaultkv"]
+    vault_params["VAULT_ADDR"] = "https://vault.example.org"
+    refs.update_refs(config, aliases, inventory)
+    stdout, _ = capsys.readouterr()
+    assert " > 0 created, 5 updated, 0 deleted, 0 unchanged" in stdout
+    assert "https://vault.example.org" in unchanged.read_text()
+
+
+def test_write_refs(tmp_path: Path):
+    refs_dir = tmp_path / "refs"
+    (refs_dir / "a").mkdir(parents=True)
+    (refs_dir / "a" / "unchanged").write_text("unchanged")
+    (refs_dir / "a" / "changed").write_text("old")
+    (refs_dir / "stale" / "dir").mkdir(parents=True)
+    (refs_dir / "stale" / "dir" / "ref").write_text("stale")
+    (refs_dir / "file").write_text("in the way of a directory")
+    (refs_dir / ".hidden").write_text("hidden")
+    os.utime(refs_dir / "a" / "unchanged", (0, 0))
+
+    counts = refs.write_refs(
+        refs_dir,
+        {
+            Path("a/unchanged"): "unchanged",
+            Path("a/changed"): "new",
+            Path("file/ref"): "new",
+            Path("b/new"): "new",
+        },
+    )
+
+    assert counts == (2, 1, 2, 1)
+    assert (refs_dir / "a" / "unchanged").stat().st_mtime == 0
+    assert (refs_dir / "a" / "changed").read_text() == "new"
+    assert (refs_dir / "file" / "ref").read_text() == "new"
+    assert (refs_dir / "b" / "new").read_text() == "new"
+    assert (refs_dir / ".hidden").is_file()
+    assert not (refs_dir / "stale").exists()
+
+
+def test_update_refs_external_backends(tmp_path: Path, config, inventory, capsys):
+    params = inventory["test-a"]["parameters"]["test"]
+    params["gkms"] = "?{gkms:t-tenant/c-cluster/test/gkms-secret}"
+    params["plain"] = "?{plain:t-tenant/c-cluster/test/plain-secret}"
+    gkms_ref = config.refs_dir / "t-tenant" / "c-cluster" / "test" / "gkms-secret"
+    gkms_ref.parent.mkdir(parents=True)
+    gkms_ref.write_text("data: ciphertext\nencoding: original\nkey: k\ntype: gkms\n")
+
+    aliases = config.get_component_aliases()
+    refs.update_refs(config, aliases, inventory)
+
+    stdout, _ = capsys.readouterr()
+    assert " > 6 created, 0 updated, 0 deleted, 1 unchanged" in stdout
+    assert (
+        "Ref file for secret ref plain:t-tenant/c-cluster/test/plain-secret is missing"
+        in stdout
+    )
+    assert "ciphertext" in gkms_ref.read_text()
+
+
+def test_update_refs_unsupported_backend(config, inventory):
+    inventory["test-a"]["parameters"]["test"]["other"] = "?{gpg:t-tenant/secret}"
+    with pytest.raises(click.ClickException) as e:
+        refs.update_refs(config, config.get_component_aliases(), inventory)
+    assert "Unsupported secret ref type 'gpg' in gpg:t-tenant/secret" in str(e.value)
+
+
+def test_register_backend(config, inventory):
+    inventory["cluster"]["parameters"]["kapitan"]["secrets"]["base64"] = {"a": "b"}
+    inventory["test-a"]["parameters"]["test"]["b64"] = "?{base64:t-tenant/b64}"
+    inventory["test-b"]["parameters"]["test"]["b64"] = "?{base64:t-tenant/b64-2}"
+    calls = []
+
+    def _render(refs, params):
+        calls.append(sorted(r.ref for r in refs))
+        return [{"data": r.ref, "params": params, "type": r.type} for r in refs]
+
+    backends = refs.RefBackends()
+    backends.register("base64", _render)
+    refs.update_refs(config, config.get_component_aliases(), inventory, backends)
+
+    # The backend renders all refs of its type in a single call
+    assert calls == [["t-tenant/b64", "t-tenant/b64-2"]]
+    reffile = config.refs_dir / "t-tenant" / "b64"
+    assert yaml_load(reffile) == {
+        "data": "t-tenant/b64",
+        "params": {"a": "b"},
+        "type": "base64",
+    }
+    # Registrations don't leak into other runs
+    assert not refs.RefBackends().generated("base64")
+    assert refs.RefBackends().external("base64")
+
+
+def test_vaultkv_params_missing(config, inventory):
+    del inventory["cluster"]["parameters"]["kapitan"]
+    with pytest.raises(click.ClickException) as e:
+        refs.update_refs(config, config.get_component_aliases(), inventory)
+    assert "requires parameters in `parameters.kapitan.secrets.vaultkv`" in str(e.value)
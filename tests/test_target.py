@@ -226,3 +226,15 @@ def test_read_cluster_and_tenant_missing_fact(tmp_path):
 
     with pytest.raises(KeyError):
         cluster.read_cluster_and_tenant(inv)
+
+
+def test_update_target_unchanged(tmp_path: P):
+    cfg = Config(tmp_path)
+    _setup_working_dir(cfg.inventory, [])
+    cluster.update_target(cfg, cfg.inventory.bootstrap_target)
+    file = cfg.inventory.target_file(cfg.inventory.bootstrap_target)
+    os.utime(file, (0, 0))
+
+    cluster.update_target(cfg, cfg.inventory.bootstrap_target)
+
+    assert file.stat().st_mtime == 0
@@ -0,0 +1,92 @@
+"""
+Unit-tests for tree synchronization
+"""
+
+import os
+
+from pathlib import Path
+
+import pytest
+
+from commodore.treesync import sync_trees
+
+
+def _write(path: Path, content: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def _tree(basedir: Path):
+    return {
+        str(p.relative_to(basedir)): p.read_text()
+        for p in sorted(basedir.rglob("*"))
+        if p.is_file()
+    }
+
+
+@pytest.mark.parametrize("mode", ["copy", "reflink", "hardlink"])
+def test_sync_trees(tmp_path: Path, mode):
+    src_a = tmp_path / "compiled" / "a"
+    src_b = tmp_path / "compiled" / "b"
+    dest = tmp_path / "manifests"
+    _write(src_a / "a" / "unchanged.yaml", "unchanged")
+    _write(src_a / "a" / "modified.yaml", "new")
+    _write(src_a / "a" / "added.yaml", "added")
+    _write(src_a / "b" / "overridden.yaml", "from a")
+    _write(src_b / "b" / "overridden.yaml", "from b")
+    _write(src_b / "replaced" / "file.yaml", "now a directory")
+
+    _write(dest / "a" / "unchanged.yaml", "unchanged")
+    _write(dest / "a" / "modified.yaml", "old")
+    _write(dest / "stale" / "deleted.yaml", "deleted")
+    _write(dest / "replaced", "was a file")
+    _write(dest / ".hidden", "kept")
+    os.utime(dest / "a" / "unchanged.yaml", (0, 0))
+
+    result = sync_trees([src_a, src_b], dest, mode=mode)
+
+    assert [str(p) for p in result.added] == [
+        "a/added.yaml",
+        "b/overridden.yaml",
+        "replaced/file.yaml",
+    ]
+    assert [str(p) for p in result.modified] == ["a/modified.yaml"]
+    assert [str(p) for p in result.deleted] == ["replaced", "stale/deleted.yaml"]
+    assert result.unchanged == 1
+    assert result.changed
+    assert _tree(dest) == {
+        ".hidden": "kept",
+        "a/added.yaml": "added",
+        "a/modified.yaml": "new",
+        "a/unchanged.yaml": "unchanged",
+        "b/overridden.yaml": "from b",
+        "replaced/file.yaml": "now a directory",
+    }
+    assert (dest / "a" / "unchanged.yaml").stat().st_mtime == 0
+    assert not (dest / "stale").exists()
+
+
+def test_sync_trees_last_source_wins(tmp_path: Path):
+    _write(tmp_path / "a" / "file.yaml", "from a")
+    _write(tmp_path / "b" / "file.yaml", "from b")
+    dest = tmp_path / "dest"
+
+    result = sync_trees([tmp_path / "a", tmp_path / "b"], dest)
+    assert (dest / "file.yaml").read_text() == "from b"
+    assert str(result) == "1 added, 0 modified, 0 deleted, 0 unchanged"
+
+    result = sync_trees([tmp_path / "a", tmp_path / "b"], dest)
+    assert not result.changed
+
+
+def test_sync_trees_hardlink(tmp_path: Path):
+    _write(tmp_path / "src" / "file.yaml", "content")
+    dest = tmp_path / "dest"
+
+    sync_trees([tmp_path / "src"], dest, mode="hardlink")
+    assert (dest / "file.yaml").samefile(tmp_path / "src" / "file.yaml")
+
+
+def test_sync_trees_invalid_mode(tmp_path: Path):
+    with pytest.raises(ValueError):
+        sync_trees([tmp_path], tmp_path / "dest", mode="symlink")